@@ -0,0 +1,31 @@
+"""Define URL patterns for the read API."""
+from django.urls import path
+
+from blog.views import api_views
+
+app_name = "api"
+urlpatterns = [
+    path("posts/", api_views.PostListAPIView.as_view(), name="post_list"),
+    path(
+        "posts/<str:slug>/",
+        api_views.PostDetailAPIView.as_view(),
+        name="post_detail",
+    ),
+    path(
+        "posts/<str:slug>/comments/",
+        api_views.CommentListAPIView.as_view(),
+        name="comment_list",
+    ),
+    path("tags/", api_views.TagListAPIView.as_view(), name="tag_list"),
+    path(
+        "tags/<str:slug>/",
+        api_views.TagDetailAPIView.as_view(),
+        name="tag_detail",
+    ),
+    path("authors/", api_views.AuthorListAPIView.as_view(), name="author_list"),
+    path(
+        "authors/<int:pk>/",
+        api_views.AuthorDetailAPIView.as_view(),
+        name="author_detail",
+    ),
+]
@@ -0,0 +1,345 @@
+"""Stream a backup of the blog as NDJSON, and restore it.
+
+A backup has one JSON record per line, {"type": ..., "pk": ..., "fields": ...},
+written type by type in the order of RECORD_TYPES, so every record comes after
+the records it refers to. Records are read from the database and written in
+chunks, and restored with bulk_create in batches, so the memory used doesn't
+depend on the size of the blog. Only the new primary keys of the users, posts,
+tags and hit counts are kept while restoring, to point the records that refer
+to them at their new rows.
+
+Users, posts and tags that already exist (by username or slug) are kept as they
+are, and the records that refer to them are attached to the existing rows. A
+comment or hit that is already there is skipped, as are the other records by
+their unique constraints, so restoring a backup twice doesn't duplicate them.
+The uploaded media is backed up separately, as a tar stream of MEDIA_ROOT.
+"""
+import json
+import os
+import tarfile
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import DateTimeField
+from hitcount.models import Hit
+from hitcount.utils import get_hitcount_model
+from secretballot.utils import get_vote_model
+
+from blog.cache import bump_version
+from blog.models import Blog, Comment, Redirect, Tag
+from blog.pagecache import purge_all_pages
+from blog.search import update_search_vectors
+from users.models import Profile
+
+CHUNK_SIZE = 2000
+
+
+class BackupEncoder(DjangoJSONEncoder):
+    """Encode dates with their microseconds, which DjangoJSONEncoder drops."""
+
+    def default(self, o):
+        """Return a JSON friendly version of a value."""
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def blog_content_type():
+    """Return the content type of the posts."""
+    return ContentType.objects.get_for_model(Blog)
+
+
+# each record type, in the order they are written. 'key' is the field that
+# identifies an existing row and 'remap' the fields that hold the primary key of
+# an earlier record type. 'unique' are the fields that identify a row of a type
+# with no unique constraint, to skip those that exist (the others are skipped
+# by their constraint). The hit counts and votes are 'generic' relations, only
+# those of the posts are backed up, and 'filter' picks the hits of those.
+RECORD_TYPES = {
+    "user": {
+        "model": User,
+        "fields": (
+            "username",
+            "password",
+            "email",
+            "first_name",
+            "last_name",
+            "is_staff",
+            "is_active",
+            "is_superuser",
+            "date_joined",
+            "last_login",
+        ),
+        "key": "username",
+    },
+    "profile": {
+        "model": Profile,
+        "fields": (
+            "user_id",
+            "image",
+            "image_sizes",
+            "location",
+            "website",
+            "linkedin_user",
+            "facebook_user",
+            "github_user",
+            "youtube_user",
+            "twitter_user",
+            "bio",
+            "author",
+        ),
+        "remap": {"user_id": "user"},
+    },
+    "post": {
+        "model": Blog,
+        "fields": (
+            "user_id",
+            "title",
+            "slug",
+            "desc",
+            "body",
+            "rendered_body",
+            "image",
+            "image_sizes",
+            "draft",
+            "image_attrib_name",
+            "image_attrib_name_link",
+            "image_attrib_site",
+            "image_attrib_site_link",
+            "created_at",
+            "updated_at",
+            "comment_count",
+            "view_count",
+            "vote_count",
+        ),
+        "key": "slug",
+        "remap": {"user_id": "user"},
+    },
+    "tag": {
+        "model": Tag,
+        "fields": ("tag_name", "slug", "tag_creator_id"),
+        "key": "slug",
+        "remap": {"tag_creator_id": "user"},
+    },
+    "tag_post": {
+        "model": Tag.posts.through,
+        "fields": ("tag_id", "blog_id"),
+        "remap": {"tag_id": "tag", "blog_id": "post"},
+    },
+    "comment": {
+        "model": Comment,
+        "fields": (
+            "related_post_id",
+            "created_by_user_id",
+            "created_by_guest",
+            "guest_email",
+            "body",
+            "created_at",
+            "updated_at",
+        ),
+        "remap": {"related_post_id": "post", "created_by_user_id": "user"},
+        "unique": ("related_post_id", "created_at", "body"),
+    },
+    "redirect": {
+        "model": Redirect,
+        "fields": ("old_slug", "old_post_id"),
+        "remap": {"old_post_id": "post"},
+    },
+    "hitcount": {
+        "model": get_hitcount_model(),
+        "fields": ("object_pk", "hits", "modified"),
+        "key": "object_pk",
+        "remap": {"object_pk": "post"},
+        "generic": True,
+    },
+    "hit": {
+        "model": Hit,
+        "fields": (
+            "hitcount_id",
+            "user_id",
+            "ip",
+            "session",
+            "user_agent",
+            "created",
+        ),
+        "remap": {"hitcount_id": "hitcount", "user_id": "user"},
+        "unique": ("hitcount_id", "session", "created"),
+        "filter": lambda: {"hitcount__content_type": blog_content_type()},
+    },
+    "vote": {
+        "model": get_vote_model(),
+        "fields": ("object_id", "token", "vote", "created_at", "updated_at"),
+        "remap": {"object_id": "post"},
+        "generic": True,
+    },
+}
+
+
+def export_records():
+    """Generate the lines of a backup of every record."""
+    for name, record_type in RECORD_TYPES.items():
+        rows = record_type["model"].objects.order_by("pk")
+        if record_type.get("generic"):
+            rows = rows.filter(content_type=blog_content_type())
+        if "filter" in record_type:
+            rows = rows.filter(**record_type["filter"]())
+        for row in rows.values("pk", *record_type["fields"]).iterator(
+            chunk_size=CHUNK_SIZE
+        ):
+            pk = row.pop("pk")
+            record = {"type": name, "pk": pk, "fields": row}
+            yield json.dumps(record, cls=BackupEncoder) + "\n"
+
+
+def export_media(fileobj):
+    """Write every file in MEDIA_ROOT to a tar stream."""
+    with tarfile.open(fileobj=fileobj, mode="w|") as archive:
+        for root, _, files in os.walk(settings.MEDIA_ROOT):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                archive.add(
+                    path, arcname=os.path.relpath(path, settings.MEDIA_ROOT)
+                )
+
+
+def import_media(fileobj):
+    """Extract a tar stream of media files into MEDIA_ROOT.
+
+    Returns the number of files extracted. Anything that isn't a plain file
+    inside MEDIA_ROOT is skipped.
+    """
+    root = os.path.realpath(settings.MEDIA_ROOT)
+    extracted = 0
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for member in archive:
+            path = os.path.realpath(os.path.join(root, member.name))
+            if not member.isfile() or not path.startswith(root + os.sep):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            source = archive.extractfile(member)
+            with open(path, "wb") as target:
+                while chunk := source.read(1024 * 1024):
+                    target.write(chunk)
+            extracted += 1
+    return extracted
+
+
+@contextmanager
+def original_timestamps():
+    """Keep the imported dates, rather than setting them to now."""
+    fields = [
+        field
+        for record_type in RECORD_TYPES.values()
+        for field in record_type["model"]._meta.concrete_fields
+        if isinstance(field, DateTimeField)
+        and (field.auto_now or field.auto_now_add)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def skip_existing(model, fields, objects):
+    """Return the objects that have no row with the same 'fields' values.
+
+    The rows are looked up by the first field, which should be indexed.
+    """
+
+    def values(obj):
+        return tuple(
+            model._meta.get_field(field).to_python(getattr(obj, field))
+            for field in fields
+        )
+
+    candidates = {getattr(obj, fields[0]) for obj in objects}
+    existing = set(
+        model.objects.filter(**{f"{fields[0]}__in": candidates}).values_list(
+            *fields
+        )
+    )
+    return [obj for obj in objects if values(obj) not in existing]
+
+
+def restore_batch(name, records, keys):
+    """Restore a batch of records of one type.
+
+    'keys' maps each record type to {old pk: new pk}, it is updated with the
+    records of this batch if they have a key. Records that refer to a row that
+    wasn't restored, or that is already there, are skipped. Returns the number
+    of records written.
+    """
+    record_type = RECORD_TYPES[name]
+    model = record_type["model"]
+    extra = {}
+    if record_type.get("generic"):
+        extra["content_type"] = blog_content_type()
+    objects, old_pks = [], []
+    for record in records:
+        fields = record["fields"]
+        for field, target in record_type.get("remap", {}).items():
+            if fields.get(field) is not None:
+                fields[field] = keys[target].get(fields[field])
+                if fields[field] is None:
+                    break
+        else:
+            objects.append(model(**fields, **extra))
+            old_pks.append(record["pk"])
+
+    if "unique" in record_type and objects:
+        objects = skip_existing(model, record_type["unique"], objects)
+    # rows that already exist are kept, and only found again by their key.
+    model.objects.bulk_create(
+        objects, batch_size=CHUNK_SIZE, ignore_conflicts=True
+    )
+    key = record_type.get("key")
+    if key is not None:
+        values = [getattr(obj, key) for obj in objects]
+        new_pks = dict(
+            model.objects.filter(**{f"{key}__in": values}, **extra).values_list(
+                key, "pk"
+            )
+        )
+        keys[name].update(
+            (old_pk, new_pks[value])
+            for old_pk, value in zip(old_pks, values)
+            if value in new_pks
+        )
+    if name == "post":
+        restored = [keys[name][pk] for pk in old_pks if pk in keys[name]]
+        update_search_vectors(Blog.objects.filter(pk__in=restored))
+    return len(objects)
+
+
+def import_records(lines):
+    """Restore the records in the lines of a backup.
+
+    Returns {record type: number of records written}.
+    """
+    keys = {name: {} for name in RECORD_TYPES}
+    written = dict.fromkeys(RECORD_TYPES, 0)
+    records = (json.loads(line) for line in lines if line.strip())
+    with transaction.atomic(), original_timestamps():
+        for name, group in groupby(records, key=lambda record: record["type"]):
+            if name not in RECORD_TYPES:
+                raise ValueError(f"Unknown record type '{name}'.")
+            while batch := list(islice(group, CHUNK_SIZE)):
+                written[name] += restore_batch(name, batch, keys)
+        # the posts may have had comments, hits or votes added.
+        Blog.objects.resync_counters()
+
+    # bulk_create sends no signals, so invalidate everything that is cached.
+    purge_all_pages()
+    for namespace in ("sidebar", "search", "feeds", "redirects"):
+        bump_version(namespace)
+    return written
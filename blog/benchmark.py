@@ -0,0 +1,182 @@
+"""Measure the latency and query count of the main pages.
+
+Each page is requested a number of times with the Django test client, after a
+few warm up requests, and the percentiles of the response times are recorded
+with the number of queries of the last request. The full-page cache is turned
+off while measuring, so the views themselves are measured (the smaller caches,
+such as the sidebar, are left on as they are in production). Hits are written
+in the request, so they are part of the measurement and never left buffered.
+
+The results are plain JSON, with the pages in a fixed order, so two runs can
+be compared with compare_results (or any diff tool). See the blog_benchmark
+command, and blog/tests/test_benchmark.py to run them under pytest.
+"""
+import json
+import platform
+import statistics
+import subprocess
+from time import perf_counter
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from blog.models import Blog, Tag
+
+# the pages that are measured, each gets the corpus and returns its URL.
+BENCHMARK_PAGES = {
+    "index": lambda corpus: reverse("blog:index"),
+    "index_deep": lambda corpus: reverse("blog:index") + "?page=20",
+    "post_detail": lambda corpus: corpus["post"].get_absolute_url(),
+    "tag_list": lambda corpus: reverse("blog:tag_list"),
+    "tag_detail": lambda corpus: reverse(
+        "blog:tag_detail", args=[corpus["tag"].slug]
+    ),
+    "search": lambda corpus: reverse("blog:search") + "?q=django+cache",
+    "feed": lambda corpus: reverse("latest-posts-feed"),
+    "sitemap": lambda corpus: reverse("sitemap"),
+    "sitemap_posts": lambda corpus: reverse(
+        "sitemap-section", args=["posts-0"]
+    ),
+    "profile": lambda corpus: reverse("user-profile", args=[corpus["user"].pk]),
+    "my_profile": lambda corpus: reverse("my-profile"),
+}
+
+# the pages that need a logged in user.
+LOGGED_IN_PAGES = {"my_profile"}
+
+
+def find_corpus():
+    """Return the post, tag and author to benchmark the detail pages with.
+
+    These are the post with the most comments, the tag with the most posts and
+    the user with the most posts, the slowest of each kind to show.
+    """
+    post = Blog.objects.filter(draft=False).order_by("-comment_count").first()
+    tag = Tag.objects.annotate(count=Count("posts")).order_by("-count").first()
+    user = (
+        User.objects.annotate(count=Count("blog_posts"))
+        .order_by("-count")
+        .first()
+    )
+    return {"post": post, "tag": tag, "user": user}
+
+
+def percentile(times, percent):
+    """Return the percentile of these times, by the nearest rank."""
+    ordered = sorted(times)
+    rank = max(0, round(percent / 100 * len(ordered)) - 1)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def read_content(response):
+    """Return the body of a response, reading it if it is streamed."""
+    if response.streaming:
+        return b"".join(response.streaming_content)
+    return response.content
+
+
+def measure(client, url, rounds, warmup):
+    """Return the timings (in ms) and query count of requests to a URL."""
+    for _ in range(warmup):
+        client.get(url)
+    times = []
+    for _ in range(rounds):
+        with CaptureQueriesContext(connection) as queries:
+            start = perf_counter()
+            response = client.get(url)
+            size = len(read_content(response))
+            times.append((perf_counter() - start) * 1000)
+    return {
+        "url": url,
+        "status": response.status_code,
+        "queries": len(queries),
+        "bytes": size,
+        "min": round(min(times), 3),
+        "p50": round(percentile(times, 50), 3),
+        "p90": round(percentile(times, 90), 3),
+        "p99": round(percentile(times, 99), 3),
+        "max": round(max(times), 3),
+        "mean": round(statistics.fmean(times), 3),
+    }
+
+
+def git_revision():
+    """Return the current git commit, or '' if it can't be found."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_benchmarks(rounds=20, warmup=2, pages=None, corpus=None):
+    """Measure each page, and return the results as a JSON friendly dict."""
+    corpus = corpus or find_corpus()
+    client = Client(SERVER_NAME="localhost")
+    logged_in = Client(SERVER_NAME="localhost")
+    logged_in.force_login(corpus["user"])
+
+    results = {}
+    with override_settings(PAGE_CACHE_TIMEOUT=0, BLOG_HIT_MODE="sync"):
+        for name, url in BENCHMARK_PAGES.items():
+            if pages and name not in pages:
+                continue
+            page_client = logged_in if name in LOGGED_IN_PAGES else client
+            results[name] = measure(page_client, url(corpus), rounds, warmup)
+
+    return {
+        "meta": {
+            "date": timezone.now().isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "rounds": rounds,
+            "warmup": warmup,
+            "posts": Blog.objects.count(),
+            "tags": Tag.objects.count(),
+        },
+        "pages": results,
+    }
+
+
+def write_results(results, path):
+    """Write the results to a JSON file."""
+    with open(path, "w", encoding="utf-8") as output:
+        json.dump(results, output, indent=2)
+        output.write("\n")
+
+
+def compare_results(before, after, metric="p50"):
+    """Return a line comparing each page of two runs.
+
+    Each gives the metric and query count of both runs, with the change.
+    """
+    lines = []
+    for name, new in after["pages"].items():
+        old = before["pages"].get(name)
+        if old is None:
+            lines.append(
+                f"{name}: {new[metric]:.1f}ms, {new['queries']} queries"
+            )
+            continue
+        change = (
+            (new[metric] - old[metric]) / old[metric] * 100
+            if old[metric]
+            else 0
+        )
+        lines.append(
+            f"{name}: {old[metric]:.1f}ms -> {new[metric]:.1f}ms "
+            f"({change:+.0f}%), {old['queries']} -> {new['queries']} queries"
+        )
+    return lines
@@ -0,0 +1,30 @@
+"""Versioned entries in the Django cache framework.
+
+Cached data is stored under a key that includes a version token for its
+namespace. Bumping the version of a namespace (usually from a signal) makes
+every entry in it unreachable at once, and the stale entries simply expire.
+"""
+from uuid import uuid4
+
+from django.core.cache import cache
+
+
+def get_version(namespace):
+    """Return the current version token for this namespace."""
+    key = f"{namespace}:version"
+    version = cache.get(key)
+    if version is None:
+        # never reuse an old token if the version has been evicted.
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    """Invalidate everything cached in this namespace."""
+    cache.set(f"{namespace}:version", uuid4().hex, None)
+
+
+def versioned_key(namespace, *parts):
+    """Return a cache key for this namespace at its current version."""
+    return ":".join([namespace, get_version(namespace), *map(str, parts)])
@@ -0,0 +1,138 @@
+"""Conditional GET (ETag / Last-Modified) for the posts, feed, sitemap and API.
+
+The validators for each page are computed from a single aggregate query, and
+are used with Django's 'condition' decorator, so a client revalidating a page
+that has not changed gets a '304 Not Modified' without any template being
+rendered. Changes that leave no timestamp in the database (such as renaming a
+tag, deleting a comment or editing the site preferences) are covered by the
+page cache versions, which are bumped for exactly those (see pagecache.py).
+
+Hits are not counted for a 304 response. django-hitcount ignores repeat views
+from the same session anyway, and a revalidation always comes from a browser
+that has already seen the page.
+"""
+from hashlib import md5
+
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+from blog.cache import get_version
+from blog.models import Blog
+
+
+def make_etag(*parts):
+    """Return a strong ETag built from these values."""
+    return '"%s"' % md5(":".join(map(str, parts)).encode()).hexdigest()
+
+
+def post_freshness(request, slug):
+    """Return the (etag, last_modified) of a post page, or (None, None).
+
+    The post, its last updated comment and its counters are fetched in one
+    query. Drafts shown to anyone but their author get no validators, so the
+    view can return its 404. The result is kept on the request, as 'condition'
+    asks for the ETag and the last modified time separately.
+    """
+    if not hasattr(request, "post_freshness"):
+        post = (
+            Blog.objects.filter(slug=slug)
+            .order_by()
+            .values(
+                "draft", "user_id", "updated_at", "comment_count", "vote_count"
+            )
+            .annotate(last_comment=Max("comments__updated_at"))
+            .first()
+        )
+        if post is None or (
+            post["draft"] and post["user_id"] != request.user.pk
+        ):
+            request.post_freshness = (None, None)
+        else:
+            last_modified = max(
+                filter(None, (post["updated_at"], post["last_comment"]))
+            )
+            etag = make_etag(
+                last_modified.isoformat(),
+                post["comment_count"],
+                post["vote_count"],
+                request.user.pk,
+                get_version("pages"),
+                get_version(f"pages:post:{slug}"),
+            )
+            request.post_freshness = (etag, last_modified)
+    return request.post_freshness
+
+
+def published_freshness(request):
+    """Return the (etag, last_modified) of the published posts as a whole.
+
+    Used for the feed and the sitemap, which list every published post.
+    """
+    if not hasattr(request, "published_freshness"):
+        published = Blog.objects.filter(draft=False).aggregate(
+            last_modified=Max("updated_at"), count=Count("pk")
+        )
+        last_modified = published["last_modified"]
+        request.published_freshness = (
+            make_etag(
+                last_modified.isoformat() if last_modified else "",
+                published["count"],
+                get_version("pages"),
+            ),
+            last_modified,
+        )
+    return request.published_freshness
+
+
+def post_etag(request, slug):
+    """Return the ETag of a post page."""
+    return post_freshness(request, slug)[0]
+
+
+def post_last_modified(request, slug):
+    """Return the last modified time of a post page."""
+    return post_freshness(request, slug)[1]
+
+
+def published_etag(request, **kwargs):
+    """Return the ETag of the feed or sitemap."""
+    return published_freshness(request)[0]
+
+
+def published_last_modified(request, **kwargs):
+    """Return the last modified time of the feed or sitemap."""
+    return published_freshness(request)[1]
+
+
+def api_etag(request, **kwargs):
+    """Return the ETag of a read API list, tag or author.
+
+    These show the counters of the posts and the authors' profiles, so the
+    index and tag list page versions and the 'api' version are added.
+    """
+    return make_etag(
+        published_etag(request),
+        get_version("pages:index"),
+        get_version("pages:tags"),
+        get_version("api"),
+    )
+
+
+def api_post_etag(request, slug):
+    """Return the ETag of a read API post or its comments."""
+    etag = post_etag(request, slug)
+    return etag and make_etag(etag, get_version("api"))
+
+
+post_condition = condition(
+    etag_func=post_etag, last_modified_func=post_last_modified
+)
+published_condition = condition(
+    etag_func=published_etag, last_modified_func=published_last_modified
+)
+api_condition = condition(
+    etag_func=api_etag, last_modified_func=published_last_modified
+)
+api_post_condition = condition(
+    etag_func=api_post_etag, last_modified_func=post_last_modified
+)
@@ -1,14 +1,67 @@
-"""Configure RSS feeds for the Blog model."""
+"""Configure RSS, Atom and JSON feeds for the Blog model.
+
+Every feed is built from one queryset, with the authors joined in and the tags
+prefetched. The rendered feed is cached, with its ETag and Last-Modified
+headers, until any post or tag changes (the 'feeds' version is bumped in
+signals.py), so polling an unchanged feed does not touch the database at all.
+"""
+import json
+from hashlib import md5
+
+from django.contrib.auth.models import User
 from django.contrib.syndication.views import Feed
-from django.utils.feedgenerator import DefaultFeed
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.cache import get_conditional_response
+from django.utils.feedgenerator import Atom1Feed, DefaultFeed, SyndicationFeed
+from django.utils.http import parse_http_date_safe
 
+from blog.cache import versioned_key
 from blog.models import Blog, Tag
 
+FEED_TIMEOUT = 60 * 60 * 24
+
 
 class CorrectMimeTypeFeed(DefaultFeed):
     content_type = "application/xml; charset=utf-8"
 
 
+class JSONFeed(SyndicationFeed):
+    """Generate a feed in the JSON Feed 1.1 format."""
+
+    content_type = "application/feed+json; charset=utf-8"
+
+    def write(self, outfile, encoding):
+        """Write the feed as JSON."""
+        feed = {
+            "version": "https://jsonfeed.org/version/1.1",
+            "title": self.feed["title"],
+            "home_page_url": self.feed["link"],
+            "feed_url": self.feed["feed_url"],
+            "description": self.feed["description"],
+            "language": self.feed["language"],
+            "items": [
+                {
+                    "id": item["unique_id"],
+                    "url": item["link"],
+                    "title": item["title"],
+                    "content_text": item["description"],
+                    "date_published": item["pubdate"].isoformat(),
+                    "date_modified": item["updateddate"].isoformat(),
+                    "authors": [{"name": item["author_name"]}],
+                    "tags": item["categories"],
+                }
+                for item in self.items
+            ],
+        }
+        outfile.write(json.dumps(feed))
+
+
+FEED_TYPES = {"rss": CorrectMimeTypeFeed, "atom": Atom1Feed, "json": JSONFeed}
+
+
 class PostsFeed(Feed):
     """RSS feed for the blog posts."""
 
@@ -18,9 +71,53 @@ class PostsFeed(Feed):
     feed_copyright = "Copyright (c) 2021, Seapagan"
     feed_type = CorrectMimeTypeFeed
 
-    def items(self):
+    def __init__(self, feed_format="rss"):
+        """Set the format of the feed, 'rss', 'atom' or 'json'."""
+        super().__init__()
+        self.feed_format = feed_format
+        self.feed_type = FEED_TYPES[feed_format]
+
+    def __call__(self, request, *args, **kwargs):
+        """Return the feed, from the cache if it has not changed."""
+        # the feeds don't read the query string, so it is left out of the key,
+        # but the links in them are absolute, so the host is kept in.
+        key = versioned_key(
+            "feeds",
+            type(self).__name__,
+            self.feed_format,
+            md5(request.build_absolute_uri(request.path).encode()).hexdigest(),
+        )
+        cached = cache.get(key)
+        if cached is None:
+            response = super().__call__(request, *args, **kwargs)
+            response["ETag"] = '"%s"' % md5(response.content).hexdigest()
+            cached = {
+                "content": response.content,
+                "headers": dict(response.headers),
+            }
+            cache.set(key, cached, FEED_TIMEOUT)
+
+        response = HttpResponse(cached["content"], headers=cached["headers"])
+        return get_conditional_response(
+            request,
+            etag=response["ETag"],
+            last_modified=parse_http_date_safe(
+                response.get("Last-Modified", "")
+            ),
+            response=response,
+        )
+
+    def subtitle(self):
+        """Return the subtitle, used by the Atom feed."""
+        return self.description
+
+    def get_queryset(self, obj):
+        """Return the posts in this feed."""
+        return Blog.objects.filter(draft=False)
+
+    def items(self, obj):
         """Return the latest blog posts."""
-        return Blog.objects.filter(draft=False).order_by("-created_at")[:5]
+        return self.get_queryset(obj).summary().order_by("-created_at")[:5]
 
     def item_title(self, item):
         """Return the title of the blog post."""
@@ -44,5 +141,57 @@ class PostsFeed(Feed):
 
     def item_categories(self, item):
         """Returns the tags for this post as categories."""
-        tags = Tag.objects.filter(posts=item)
-        return list(tags.values_list("tag_name", flat=True))
+        return [tag.tag_name for tag in item.tag_set.all()]
+
+
+class TagPostsFeed(PostsFeed):
+    """Feed of the posts with one tag."""
+
+    def get_object(self, request, slug):
+        """Return the tag."""
+        return get_object_or_404(Tag, slug=slug)
+
+    def title(self, obj):
+        """Return the title of the feed."""
+        return f"Tek:Cited Posts tagged '{obj.tag_name}'"
+
+    def link(self, obj):
+        """Return the page of the tag."""
+        return reverse("blog:tag_detail", args=[obj.slug])
+
+    def get_queryset(self, obj):
+        """Return the posts with this tag."""
+        return obj.posts.filter(draft=False)
+
+
+class AuthorPostsFeed(PostsFeed):
+    """Feed of the posts by one author."""
+
+    def get_object(self, request, pk):
+        """Return the author."""
+        return get_object_or_404(User, pk=pk)
+
+    def title(self, obj):
+        """Return the title of the feed."""
+        return f"Tek:Cited Posts by {obj.username.capitalize()}"
+
+    def link(self, obj):
+        """Return the profile page of the author."""
+        return reverse("user-profile", args=[obj.pk])
+
+    def get_queryset(self, obj):
+        """Return the posts by this author."""
+        return obj.blog_posts.filter(draft=False)
+
+
+def feed_urls(route, feed_class, name):
+    """Return the URL patterns of a feed in each of its formats.
+
+    The RSS feed is at the route itself, the others at 'atom/' and 'json/'
+    below it.
+    """
+    return [
+        path(route, feed_class(), name=name),
+        path(f"{route}atom/", feed_class("atom"), name=f"{name}-atom"),
+        path(f"{route}json/", feed_class("json"), name=f"{name}-json"),
+    ]
@@ -0,0 +1,252 @@
+"""Write-behind buffering of post page hits.
+
+In the default 'sync' mode every counted view of a post inserts a Hit and
+updates the HitCount row inside the request, as django-hitcount does. In the
+'buffered' mode (settings.BLOG_HIT_MODE) counted hits are instead appended to an
+in-process buffer, and a background thread writes them in bulk: one
+bulk_create for the Hit rows and one aggregated UPDATE per post for the
+HitCount and Blog totals. The buffer is also flushed when the process exits.
+If a flush fails, its hits are put back in the buffer for the next one.
+
+The same blocking and per-IP / per-session limits as django-hitcount are
+applied, counting the hits that are still waiting in the buffer.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from hitcount.conf import settings as hitcount_settings
+from hitcount.mixins import HitCountViewMixin
+from hitcount.models import BlockedIP, BlockedUserAgent, Hit
+from hitcount.utils import get_hitcount_model, get_ip
+
+from blog.models import Blog
+
+logger = logging.getLogger(__name__)
+
+BufferedHit = namedtuple(
+    "BufferedHit",
+    "hitcount_id content_type_id object_pk session ip user_agent user_id",
+)
+
+UpdateHitCountResponse = namedtuple(
+    "UpdateHitCountResponse", "hit_counted hit_message"
+)
+
+
+def hit_mode():
+    """Return the configured hit counting mode, 'sync' or 'buffered'."""
+    return getattr(settings, "BLOG_HIT_MODE", "sync")
+
+
+class HitBuffer:
+    """A thread-safe, in-process queue of hits waiting to be written."""
+
+    def __init__(self):
+        """Create an empty buffer."""
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.flusher = None
+        self.clear()
+
+    def clear(self):
+        """Empty the buffer and its limit counters."""
+        self.hits = []
+        self.by_session = Counter()
+        self.by_ip = Counter()
+
+    def add(self, hit):
+        """Queue a hit, waking the flusher early if the buffer is full."""
+        with self.lock:
+            self.hits.append(hit)
+            self.by_session[hit.session, hit.hitcount_id] += 1
+            self.by_ip[hit.ip] += 1
+            size = len(self.hits)
+        self.start_flusher()
+        if size >= getattr(settings, "BLOG_HIT_BUFFER_SIZE", 1000):
+            self.wake.set()
+
+    def pending_for_session(self, session, hitcount_id):
+        """Return how many queued hits this session has on this post."""
+        return self.by_session[session, hitcount_id]
+
+    def pending_for_ip(self, ip):
+        """Return how many queued hits this IP address has."""
+        return self.by_ip[ip]
+
+    def drain(self):
+        """Remove and return every queued hit."""
+        with self.lock:
+            hits = self.hits
+            self.clear()
+        return hits
+
+    def restore(self, hits):
+        """Put drained hits back, ahead of those queued since."""
+        with self.lock:
+            self.hits[:0] = hits
+            for hit in hits:
+                self.by_session[hit.session, hit.hitcount_id] += 1
+                self.by_ip[hit.ip] += 1
+
+    def start_flusher(self):
+        """Start the background flusher thread, if it is not running."""
+        if self.flusher is not None:
+            return
+        with self.lock:
+            if self.flusher is None:
+                self.flusher = threading.Thread(
+                    target=self.run_flusher, name="hit-flusher", daemon=True
+                )
+                self.flusher.start()
+
+    def run_flusher(self):
+        """Flush the buffer every BLOG_HIT_FLUSH_INTERVAL seconds."""
+        interval = getattr(settings, "BLOG_HIT_FLUSH_INTERVAL", 10)
+        while True:
+            self.wake.wait(interval)
+            self.wake.clear()
+            try:
+                flush_hits()
+            except Exception:  # keep flushing, even if one batch fails.
+                logger.exception("Could not write the buffered hits.")
+            finally:
+                close_old_connections()
+
+
+hit_buffer = HitBuffer()
+
+
+def flush_hits():
+    """Write every buffered hit to the database in bulk.
+
+    The Hit rows are created with one bulk_create (so their 'created' time is
+    the flush time), then each post gets one UPDATE adding its new hits to the
+    HitCount and Blog totals. Returns the number of hits written. If the
+    writes fail, the hits are put back in the buffer and the error is raised.
+    """
+    hits = hit_buffer.drain()
+    if not hits:
+        return 0
+    try:
+        write_hits(hits)
+    except Exception:
+        hit_buffer.restore(hits)
+        raise
+    return len(hits)
+
+
+def write_hits(hits):
+    """Write these hits, and add them to the totals, in one transaction."""
+    per_post = Counter(
+        (hit.hitcount_id, hit.content_type_id, hit.object_pk) for hit in hits
+    )
+    blog_type_id = ContentType.objects.get_for_model(Blog).id
+    with transaction.atomic():
+        Hit.objects.bulk_create(
+            [
+                Hit(
+                    hitcount_id=hit.hitcount_id,
+                    session=hit.session,
+                    ip=hit.ip,
+                    user_agent=hit.user_agent,
+                    user_id=hit.user_id,
+                )
+                for hit in hits
+            ],
+            batch_size=500,
+        )
+        for post, total in per_post.items():
+            hitcount_id, content_type_id, object_pk = post
+            get_hitcount_model().objects.filter(pk=hitcount_id).update(
+                hits=F("hits") + total, modified=timezone.now()
+            )
+            if content_type_id == blog_type_id:
+                Blog.objects.filter(pk=object_pk).update(
+                    view_count=F("view_count") + total
+                )
+
+
+atexit.register(flush_hits)
+
+
+def count_hit(request, hitcount):
+    """Decide whether to count this hit, as django-hitcount does.
+
+    Returns the same UpdateHitCountResponse namedtuple, but in 'buffered' mode
+    the hit is queued rather than saved.
+    """
+    if hit_mode() != "buffered":
+        return HitCountViewMixin.hit_count(request, hitcount)
+
+    if not request.session.session_key:
+        request.session.create()
+    session_key = request.session.session_key
+
+    ip = get_ip(request) if hitcount_settings.HITCOUNT_USE_IP else None
+    user_agent = request.META.get("HTTP_USER_AGENT", "")[:255]
+
+    if BlockedIP.objects.is_blocked(ip):
+        return UpdateHitCountResponse(
+            False, "Not counted: user IP has been blocked"
+        )
+    if BlockedUserAgent.objects.is_blocked(user_agent):
+        return UpdateHitCountResponse(
+            False, "Not counted: user agent has been blocked"
+        )
+
+    exclude_user_group = hitcount_settings.HITCOUNT_EXCLUDE_USER_GROUP
+    if exclude_user_group and request.user.is_authenticated:
+        if request.user.groups.filter(name__in=exclude_user_group):
+            return UpdateHitCountResponse(
+                False, "Not counted: user group has been excluded"
+            )
+
+    ip_limit = hitcount_settings.HITCOUNT_HITS_PER_IP_LIMIT
+    if ip and ip_limit:
+        active = Hit.objects.filter_active(ip=ip).count()
+        if active + hit_buffer.pending_for_ip(ip) >= ip_limit:
+            return UpdateHitCountResponse(
+                False, "Not counted: hits per IP address limit reached"
+            )
+
+    session_limit = hitcount_settings.HITCOUNT_HITS_PER_SESSION_LIMIT
+    if session_limit:
+        active = Hit.objects.filter_active(
+            session=session_key, hitcount=hitcount
+        ).count()
+        pending = hit_buffer.pending_for_session(session_key, hitcount.pk)
+        if active + pending >= session_limit:
+            return UpdateHitCountResponse(
+                False, "Not counted: hits per session limit reached."
+            )
+
+    user = request.user
+    hit_buffer.add(
+        BufferedHit(
+            hitcount_id=hitcount.pk,
+            content_type_id=hitcount.content_type_id,
+            object_pk=hitcount.object_pk,
+            session=session_key,
+            ip=ip,
+            user_agent=user_agent,
+            user_id=user.pk if user.is_authenticated else None,
+        )
+    )
+    if user.is_authenticated:
+        return UpdateHitCountResponse(True, "Hit counted: user authentication")
+    return UpdateHitCountResponse(True, "Hit counted: session key")
+
+
+class BufferedHitCountMixin:
+    """Count hits in the request, or queue them when in 'buffered' mode."""
+
+    def hit_count(self, request, hitcount):
+        """Count the hit, see count_hit()."""
+        return count_hit(request, hitcount)
@@ -0,0 +1,102 @@
+"""Measure the main pages of the blog, and store the results as JSON."""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from blog.benchmark import (
+    BENCHMARK_PAGES,
+    compare_results,
+    run_benchmarks,
+    write_results,
+)
+from blog.seeding import purge_caches, seed_corpus
+
+
+class Command(BaseCommand):
+    """Benchmark the pages against a seeded corpus, or the current data."""
+
+    help = (
+        "Measure the response time percentiles and query counts of the main "
+        "pages. By default a corpus of posts is seeded for the run and rolled "
+        "back afterwards, so the database is left as it was."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument("--rounds", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument(
+            "--page",
+            action="append",
+            choices=list(BENCHMARK_PAGES),
+            help="Only measure this page, can be given more than once.",
+        )
+        parser.add_argument(
+            "--output",
+            default="-",
+            help="The file to write the JSON results to, '-' for stdout.",
+        )
+        parser.add_argument(
+            "--compare",
+            help="The JSON results of an earlier run, to compare against.",
+        )
+        parser.add_argument(
+            "--no-seed",
+            action="store_true",
+            help="Measure the current data, rather than a seeded corpus.",
+        )
+        parser.add_argument("--posts", type=int, default=2000)
+        parser.add_argument("--tags", type=int, default=100)
+        parser.add_argument(
+            "--comments",
+            type=int,
+            default=5,
+            help="The average number of comments on a post.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        before = None
+        if options["compare"]:
+            try:
+                with open(options["compare"], encoding="utf-8") as previous:
+                    before = json.load(previous)
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Could not read the results: {error}")
+
+        if options["no_seed"]:
+            results = run_benchmarks(
+                options["rounds"], options["warmup"], options["page"]
+            )
+        else:
+            with transaction.atomic():
+                seed_corpus(
+                    posts=options["posts"],
+                    tags=options["tags"],
+                    comments=options["comments"],
+                    seed=options["seed"],
+                )
+                results = run_benchmarks(
+                    options["rounds"], options["warmup"], options["page"]
+                )
+                transaction.set_rollback(True)
+            # nothing cached from the seeded corpus may outlive it.
+            purge_caches()
+
+        if options["output"] == "-":
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            write_results(results, options["output"])
+
+        # the results may be on stdout, so report on stderr.
+        if before is not None:
+            for line in compare_results(before, results):
+                self.stderr.write(line)
+        else:
+            for name, page in results["pages"].items():
+                self.stderr.write(
+                    f"{name}: p50 {page['p50']:.1f}ms, p90 {page['p90']:.1f}ms"
+                    f", {page['queries']} queries"
+                )
@@ -0,0 +1,55 @@
+"""Stream a backup of the blog, and optionally its media, to files."""
+import gzip
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+
+from blog.backup import export_media, export_records
+
+
+class Command(BaseCommand):
+    """Write every user, post, tag, comment, hit and vote as NDJSON."""
+
+    help = (
+        "Back up the blog as one JSON record per line, to a file or stdout "
+        "(use a .gz name to compress it). The media files can be written to a "
+        "tar file at the same time."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument(
+            "--output",
+            default="-",
+            help="The file to write the records to, '-' for stdout.",
+        )
+        parser.add_argument(
+            "--media",
+            help=(
+                "A tar file to write the media files to (.tar.gz to compress)."
+            ),
+        )
+
+    def open_output(self, path):
+        """Open the file to write the records to, compressed if it's .gz."""
+        if path == "-":
+            return nullcontext(self.stdout)
+        if path.endswith(".gz"):
+            return gzip.open(path, "wt", encoding="utf-8")
+        return open(path, "w", encoding="utf-8")
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        records = 0
+        with self.open_output(options["output"]) as output:
+            for line in export_records():
+                output.write(line)
+                records += 1
+
+        if options["media"]:
+            opener = gzip.open if options["media"].endswith(".gz") else open
+            with opener(options["media"], "wb") as media:
+                export_media(media)
+
+        # the records may be on stdout, so report on stderr.
+        self.stderr.write(self.style.SUCCESS(f"Exported {records} record(s)."))
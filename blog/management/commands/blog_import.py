@@ -0,0 +1,57 @@
+"""Restore a backup made by blog_export."""
+import gzip
+import sys
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.backup import import_media, import_records
+
+
+class Command(BaseCommand):
+    """Restore the records of a backup in batches, and its media files."""
+
+    help = (
+        "Restore a backup made by blog_export, from a file or stdin. Users, "
+        "posts and tags that already exist are kept, and the comments, hits, "
+        "likes and redirects already there are not added again."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument(
+            "input",
+            nargs="?",
+            default="-",
+            help="The file to read the records from, '-' for stdin.",
+        )
+        parser.add_argument(
+            "--media",
+            help="A tar file of media files to extract into MEDIA_ROOT.",
+        )
+
+    def open_input(self, path):
+        """Open the file to read the records from, compressed if it's .gz."""
+        if path == "-":
+            return nullcontext(sys.stdin)
+        if path.endswith(".gz"):
+            return gzip.open(path, "rt", encoding="utf-8")
+        return open(path, encoding="utf-8")
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        try:
+            with self.open_input(options["input"]) as lines:
+                written = import_records(lines)
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f"Could not restore the backup: {error}")
+
+        if options["media"]:
+            with open(options["media"], "rb") as media:
+                files = import_media(media)
+            self.stdout.write(f"Extracted {files} media file(s).")
+
+        summary = ", ".join(
+            f"{count} {name}(s)" for name, count in written.items()
+        )
+        self.stdout.write(self.style.SUCCESS(f"Restored {summary}."))
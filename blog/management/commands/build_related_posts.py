@@ -0,0 +1,40 @@
+"""Recompute the related posts of the published posts."""
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from blog.related import build_related_posts, update_pending_related_posts
+
+
+class Command(BaseCommand):
+    """Rebuild the RelatedPost table from the posts' tags and popularity."""
+
+    help = (
+        "Recompute the related posts shown under each published post, from "
+        "the tags they share and their popularity. Run it regularly, as the "
+        "views and votes change, and with --pending more often."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument(
+            "--pending",
+            action="store_true",
+            help=(
+                "Only update the posts affected by the posts queued since the "
+                "last run, as their tags changed or they were (un)published."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        start = perf_counter()
+        if options["pending"]:
+            count = update_pending_related_posts()
+            done = f"Updated the related posts of {count} queued post(s)"
+        else:
+            count = build_related_posts()
+            done = f"Computed the related posts of {count} post(s)"
+        self.stdout.write(
+            self.style.SUCCESS(f"{done} in {perf_counter() - start:.1f}s.")
+        )
@@ -0,0 +1,36 @@
+"""Add the latest hits and likes to the time decayed popularity of posts."""
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from blog.popularity import refresh_popularity
+
+
+class Command(BaseCommand):
+    """Refresh the PostPopularity table from the hit and vote history."""
+
+    help = (
+        "Add the hits and likes since the last run to the popularity scores "
+        "of their posts, which decay over time. Run it regularly, the "
+        "'Popular Posts' are ranked by these scores."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recount every hit and like, instead of only the new ones.",
+        )
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        start = perf_counter()
+        refresh = refresh_popularity(full=options["full"])
+        kind = "all" if refresh.full else "new"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Scored the {kind} hits and likes of {refresh.posts} post(s) "
+                f"in {perf_counter() - start:.1f}s."
+            )
+        )
@@ -0,0 +1,89 @@
+"""Regenerate the resized copies of the uploaded images, in parallel."""
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from blog.models import Blog
+from blog.pagecache import purge_all_pages
+from myblog.images import IMAGE_KINDS, make_sizes
+from users.models import Profile
+
+# the models with an 'image' field, and the kind of image it holds.
+IMAGE_MODELS = ((Blog, "header"), (Profile, "avatar"))
+
+
+def resize(name, kind):
+    """Make the resized copies of one image, in a worker process.
+
+    Returns a (sizes, error) tuple, as exceptions are reported by the command.
+    """
+    try:
+        return make_sizes(name, kind), None
+    except (OSError, ValueError) as error:
+        return None, f"{name}: {error}"
+
+
+class Command(BaseCommand):
+    """Make the WebP and JPEG copies of every post header and avatar."""
+
+    help = (
+        "Regenerate the resized copies of every post header image, avatar and "
+        "placeholder image, using a pool of processes."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="How many processes to resize images with.",
+        )
+        parser.add_argument(
+            "--missing",
+            action="store_true",
+            help="Only process images that have no resized copies yet.",
+        )
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        jobs = [
+            (None, None, kind["placeholder"], name)
+            for name, kind in IMAGE_KINDS.items()
+        ]
+        for model, kind in IMAGE_MODELS:
+            images = model.objects.exclude(image="").exclude(image=None)
+            if options["missing"]:
+                images = images.filter(image_sizes={})
+            jobs.extend(
+                (model, pk, name, kind)
+                for pk, name in images.order_by().values_list("pk", "image")
+            )
+
+        updates = defaultdict(list)
+        errors = 0
+        with ProcessPoolExecutor(
+            max_workers=options["workers"], initializer=django.setup
+        ) as pool:
+            results = pool.map(
+                resize, [job[2] for job in jobs], [job[3] for job in jobs]
+            )
+            for (model, pk, name, kind), (sizes, error) in zip(jobs, results):
+                if error is not None:
+                    errors += 1
+                    self.stderr.write(error)
+                elif model is not None:
+                    updates[model].append(model(pk=pk, image_sizes=sizes))
+
+        for model, objects in updates.items():
+            model.objects.bulk_update(objects, ["image_sizes"], batch_size=100)
+        # the bulk update sends no signals, so purge the cached pages here.
+        purge_all_pages()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Resized {len(jobs) - errors} image(s), {errors} failed."
+            )
+        )
@@ -0,0 +1,35 @@
+"""Re-render the stored HTML of every post from its body."""
+from django.core.management.base import BaseCommand
+
+from blog.models import Blog
+from blog.pagecache import purge_all_pages
+from blog.rendering import render_posts
+
+
+class Command(BaseCommand):
+    """Re-render the rendered_body of every post in bulk."""
+
+    help = (
+        "Re-render the displayed HTML of every post, for example after the "
+        "rendering pipeline has changed."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="How many posts to render and write at a time.",
+        )
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        rendered = render_posts(
+            Blog.objects.all(), batch_size=options["batch_size"]
+        )
+        # the bulk update sends no signals, so purge the cached pages here.
+        purge_all_pages()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rendered the body of {rendered} post(s).")
+        )
@@ -0,0 +1,33 @@
+"""Recount the denormalized comment, view and vote totals on every post."""
+from django.core.management.base import BaseCommand
+
+from blog.models import Blog
+
+
+class Command(BaseCommand):
+    """Resync drifted Blog counters from the source tables."""
+
+    help = (
+        "Recount the comment, view and vote totals of any post where they have "
+        "drifted from the Comment, HitCount and Vote tables."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many posts have drifted.",
+        )
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        if options["dry_run"]:
+            drifted = Blog.objects.drifted().count()
+            self.stdout.write(f"{drifted} post(s) have drifted counters.")
+            return
+
+        updated = Blog.objects.resync_counters()
+        self.stdout.write(
+            self.style.SUCCESS(f"Resynced the counters of {updated} post(s).")
+        )
@@ -0,0 +1,103 @@
+"""Fill the database with a seeded corpus of synthetic posts, for testing."""
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.seeding import seed_corpus
+
+
+class Command(BaseCommand):
+    """Bulk create users, posts, tags, comments, hits and votes."""
+
+    help = (
+        "Add a deterministic corpus of synthetic posts, with their tags, "
+        "comments, hits and votes, for load testing. The same --seed always "
+        "gives the same corpus."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument("--posts", type=int, default=10000)
+        parser.add_argument("--tags", type=int, default=200)
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument(
+            "--comments",
+            type=float,
+            default=5,
+            help="The average number of comments on a published post.",
+        )
+        parser.add_argument(
+            "--tags-per-post",
+            type=int,
+            default=4,
+            help="The most tags a post has, each has at least one.",
+        )
+        parser.add_argument(
+            "--hits",
+            type=float,
+            default=20,
+            help="The average number of hits on a published post.",
+        )
+        parser.add_argument(
+            "--votes",
+            type=float,
+            default=0.05,
+            help="The number of votes per hit.",
+        )
+        parser.add_argument(
+            "--drafts",
+            type=float,
+            default=0.05,
+            help="The fraction of the posts that are drafts.",
+        )
+        parser.add_argument(
+            "--tag-skew",
+            type=float,
+            default=1.0,
+            help="The Zipf exponent of the tag popularity, 0 for even.",
+        )
+        parser.add_argument(
+            "--comment-skew",
+            type=float,
+            default=0.8,
+            help="The Zipf exponent of the comments per post, 0 for even.",
+        )
+        parser.add_argument(
+            "--hit-skew",
+            type=float,
+            default=1.1,
+            help="The Zipf exponent of the hits per post, 0 for even.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        if options["posts"] < 1 or options["tags"] < 1 or options["users"] < 1:
+            raise CommandError("At least one post, tag and user are needed.")
+        if not 0 <= options["drafts"] <= 1:
+            raise CommandError("--drafts must be between 0 and 1.")
+
+        start = perf_counter()
+        corpus = seed_corpus(
+            posts=options["posts"],
+            tags=options["tags"],
+            users=options["users"],
+            comments=options["comments"],
+            tags_per_post=max(1, options["tags_per_post"]),
+            hits=options["hits"],
+            votes=options["votes"],
+            drafts=options["drafts"],
+            tag_skew=options["tag_skew"],
+            comment_skew=options["comment_skew"],
+            hit_skew=options["hit_skew"],
+            seed=options["seed"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {len(corpus['posts'])} post(s), "
+                f"{len(corpus['tags'])} tag(s), {len(corpus['users'])} "
+                f"user(s), {corpus['comments']} comment(s), "
+                f"{corpus['hits']} hit(s) and {corpus['votes']} vote(s) in "
+                f"{perf_counter() - start:.1f}s."
+            )
+        )
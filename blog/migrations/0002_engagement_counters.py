@@ -0,0 +1,87 @@
+# Generated by Django 4.0.10 on 2026-10-18 19:42
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def count_existing_engagement(apps, schema_editor):
+    """Fill in the counters of every existing post, in one UPDATE.
+
+    This is BlogQuerySet.with_actual_counts, on the historical models.
+    """
+    alias = schema_editor.connection.alias
+    Blog = apps.get_model("blog", "Blog")
+    Comment = apps.get_model("blog", "Comment")
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    HitCount = apps.get_model("hitcount", "HitCount")
+    Vote = apps.get_model("secretballot", "Vote")
+
+    comments = (
+        Comment.objects.using(alias)
+        .filter(related_post=OuterRef("pk"))
+        .order_by()
+        .values("related_post")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    counts = {"comment_count": Coalesce(Subquery(comments), 0)}
+    # the hits and votes are generic relations, there are none without this.
+    content_type = (
+        ContentType.objects.using(alias)
+        .filter(app_label="blog", model="blog")
+        .first()
+    )
+    if content_type is not None:
+        hits = HitCount.objects.using(alias).filter(
+            content_type=content_type, object_pk=OuterRef("pk")
+        )
+        votes = (
+            Vote.objects.using(alias)
+            .filter(content_type=content_type, object_id=OuterRef("pk"))
+            .order_by()
+            .values("object_id")
+            .annotate(total=Sum("vote"))
+            .values("total")
+        )
+        counts["view_count"] = Coalesce(Subquery(hits.values("hits")[:1]), 0)
+        counts["vote_count"] = Coalesce(Subquery(votes), 0)
+    Blog.objects.using(alias).update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0001_initial"),
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("hitcount", "0005_auto_20210616_2026"),
+        ("secretballot", "0002_auto_20200328_0249"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="blog",
+            name="comment_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="blog",
+            name="view_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="blog",
+            name="vote_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="blog",
+            index=models.Index(
+                fields=["draft", "-view_count", "-vote_count", "-created_at"],
+                name="blog_popularity_idx",
+            ),
+        ),
+        migrations.RunPython(
+            count_existing_engagement, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.0.10 on 2026-10-18 19:58
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import F, Func, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+
+def create_search_index(apps, schema_editor):
+    """Add the GIN index and fill in the search vectors, Postgresql only.
+
+    The vectors are built as blog.search.update_search_vectors does, from the
+    historical models, so later changes to the app can't break this.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS blog_search_vector_idx "
+        "ON blog_blog USING gin (search_vector)"
+    )
+    Blog = apps.get_model("blog", "Blog")
+    through = Blog._meta.get_field("tag").through
+    tags = (
+        through.objects.filter(blog=OuterRef("pk"))
+        .order_by()
+        .values("blog")
+        .annotate(names=StringAgg("tag__tag_name", " "))
+        .values("names")
+    )
+    body = Func(
+        F("body"),
+        Value("<[^>]+>"),
+        Value(" "),
+        Value("g"),
+        function="regexp_replace",
+        output_field=TextField(),
+    )
+    config = getattr(settings, "BLOG_SEARCH_CONFIG", "english")
+    Blog.objects.using(schema_editor.connection.alias).update(
+        search_vector=(
+            SearchVector("title", weight="A", config=config)
+            + SearchVector(
+                Coalesce(Subquery(tags), Value("")), weight="A", config=config
+            )
+            + SearchVector("desc", weight="B", config=config)
+            + SearchVector(body, weight="C", config=config)
+        )
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    """Remove the GIN index, Postgresql only."""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS blog_search_vector_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0002_engagement_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="blog",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
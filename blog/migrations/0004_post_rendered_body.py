@@ -0,0 +1,44 @@
+# Generated by Django 4.0.10 on 2026-10-18 19:55
+
+from django.db import migrations, models
+
+from blog.rendering import render_body
+
+BATCH_SIZE = 100
+
+
+def render_existing_posts(apps, schema_editor):
+    """Render the body of every existing post, in batches.
+
+    This is blog.rendering.render_posts, on the historical model.
+    """
+    Blog = apps.get_model("blog", "Blog")
+    posts = Blog.objects.using(schema_editor.connection.alias)
+    batch = []
+    for pk, body in (
+        posts.order_by("pk")
+        .values_list("pk", "body")
+        .iterator(chunk_size=BATCH_SIZE)
+    ):
+        batch.append(Blog(pk=pk, rendered_body=render_body(body)))
+        if len(batch) == BATCH_SIZE:
+            posts.bulk_update(batch, ["rendered_body"])
+            batch = []
+    if batch:
+        posts.bulk_update(batch, ["rendered_body"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0003_post_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="blog",
+            name="rendered_body",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(render_existing_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-18 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0004_post_rendered_body"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="blog",
+            name="image_sizes",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.10 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_image_sizes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(condition=models.Q(('draft', False)), fields=['-created_at', '-id'], name='blog_published_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.0.10 on 2026-10-18 20:15
+
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    """Merge tags whose names only differ in case into the oldest of them."""
+    Tag = apps.get_model("blog", "Tag")
+    kept = {}
+    for tag in Tag.objects.order_by("pk"):
+        name = tag.tag_name.lower()
+        if name not in kept:
+            kept[name] = tag
+            continue
+        kept[name].posts.add(*tag.posts.all())
+        tag.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0006_published_keyset_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="tag",
+            constraint=models.UniqueConstraint(
+                Lower("tag_name"), name="blog_tag_name_ci_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.0.10 on 2026-10-18 20:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0008_related_posts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PopularityRefresh",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("last_hit_id", models.PositiveBigIntegerField(default=0)),
+                ("last_vote_id", models.PositiveBigIntegerField(default=0)),
+                ("half_life", models.FloatField()),
+                ("vote_weight", models.FloatField()),
+                ("full", models.BooleanField(default=False)),
+                ("posts", models.PositiveIntegerField(default=0)),
+                ("finished_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "get_latest_by": "pk",
+            },
+        ),
+        migrations.CreateModel(
+            name="PostPopularity",
+            fields=[
+                (
+                    "post",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="popularity",
+                        serialize=False,
+                        to="blog.blog",
+                    ),
+                ),
+                ("score", models.FloatField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name_plural": "post popularities",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="postpopularity",
+            index=models.Index(
+                fields=["-score"], name="blog_popularity_score_idx"
+            ),
+        ),
+    ]
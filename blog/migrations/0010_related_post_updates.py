@@ -0,0 +1,36 @@
+# Generated by Django 4.0.10 on 2026-10-18 20:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0009_post_popularity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RelatedPostUpdate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="blog.blog",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -5,13 +5,31 @@ from ckeditor.fields import RichTextField
 from ckeditor_uploader.fields import RichTextUploadingField
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericRelation
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.search import SearchVectorField
 from django.core.files.storage import FileSystemStorage
-from django.db import models
+from django.db import connections, models
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Window
+from django.db.models.functions import Coalesce, Lower, RowNumber
 from django.template.defaultfilters import slugify
 from django.urls import reverse
 from hitcount.conf import settings as hitcount_settings
 from hitcount.mixins import HitCountModelMixin
+from hitcount.utils import get_hitcount_model
 from preferences.models import Preferences
+from secretballot.utils import get_vote_model
+
+from blog.rendering import render_body
+from myblog.images import update_image_sizes
+
+# columns maintained by signals, see signals.py
+DERIVED_FIELDS = (
+    "comment_count",
+    "view_count",
+    "vote_count",
+    "search_vector",
+    "image_sizes",
+)
 
 
 class OverwriteStorage(FileSystemStorage):
@@ -38,6 +56,93 @@ def get_upload_path(instance, filename):
     return os.path.join("posts", instance.slug, filename)
 
 
+class BlogQuerySet(models.QuerySet):
+    """Custom QuerySet for the Blog model."""
+
+    def summary(self):
+        """Return posts with everything needed to render a summary card.
+
+        The comment, hit and vote totals are columns on the post, the author is
+        joined in and the tags are prefetched, so rendering any number of cards
+        costs a constant number of queries. The (large) bodies and search vector
+        are not needed for a card, so are not loaded.
+        """
+        return (
+            self.select_related("user")
+            .prefetch_related("tag_set")
+            .defer("body", "rendered_body", "search_vector")
+        )
+
+    def visible_to(self, user=None):
+        """Return the published posts, and the drafts written by this user."""
+        if user is not None and user.is_authenticated:
+            return self.filter(Q(draft=False) | Q(user=user))
+        return self.filter(draft=False)
+
+    def by_popularity(self):
+        """Order the posts by hits, votes then date.
+
+        This matches blog_popularity_idx, so the published posts can be read in
+        this order from the index without sorting them all.
+        """
+        return self.order_by("-view_count", "-vote_count", "-created_at")
+
+    def with_actual_counts(self):
+        """Annotate the engagement totals, counted from the source tables.
+
+        The annotations are correlated subqueries so they can be compared to,
+        or used to update, the denormalized counter columns.
+        """
+        content_type = ContentType.objects.get_for_model(self.model)
+        comments = (
+            Comment.objects.filter(related_post=OuterRef("pk"))
+            .order_by()
+            .values("related_post")
+            .annotate(total=Count("pk"))
+            .values("total")
+        )
+        hits = get_hitcount_model().objects.filter(
+            content_type=content_type, object_pk=OuterRef("pk")
+        )
+        votes = (
+            get_vote_model()
+            .objects.filter(content_type=content_type, object_id=OuterRef("pk"))
+            .order_by()
+            .values("object_id")
+            .annotate(total=Sum("vote"))
+            .values("total")
+        )
+        return self.annotate(
+            actual_comment_count=Coalesce(Subquery(comments), 0),
+            actual_view_count=Coalesce(Subquery(hits.values("hits")[:1]), 0),
+            actual_vote_count=Coalesce(Subquery(votes), 0),
+        )
+
+    def drifted(self):
+        """Return the posts whose counter columns disagree with the source."""
+        return self.with_actual_counts().exclude(
+            comment_count=F("actual_comment_count"),
+            view_count=F("actual_view_count"),
+            vote_count=F("actual_vote_count"),
+        )
+
+    def resync_counters(self):
+        """Recount the engagement totals of drifted posts in bulk.
+
+        Returns the number of posts that were updated.
+        """
+        actual = self.model.objects.filter(
+            pk=OuterRef("pk")
+        ).with_actual_counts()
+        return self.model.objects.filter(
+            pk__in=self.drifted().values("pk")
+        ).update(
+            comment_count=Subquery(actual.values("actual_comment_count")),
+            view_count=Subquery(actual.values("actual_view_count")),
+            vote_count=Subquery(actual.values("actual_vote_count")),
+        )
+
+
 class Blog(models.Model, HitCountModelMixin):
     """Define the blog model.
 
@@ -52,6 +157,8 @@ class Blog(models.Model, HitCountModelMixin):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     body = RichTextUploadingField(config_name="post")
+    # the body as shown on the post page, see rendering.py
+    rendered_body = models.TextField(blank=True, editable=False)
     slug = models.SlugField(default="", unique=True)
     image = models.ImageField(
         upload_to=get_upload_path,
@@ -59,6 +166,8 @@ class Blog(models.Model, HitCountModelMixin):
         storage=OverwriteStorage(),
         blank=True,
     )
+    # the resized copies of the header image, see myblog/images.py
+    image_sizes = models.JSONField(default=dict, blank=True, editable=False)
     draft = models.BooleanField(default=False)
     hit_count_generic = GenericRelation(
         hitcount_settings.HITCOUNT_HITCOUNT_MODEL,
@@ -85,20 +194,62 @@ class Blog(models.Model, HitCountModelMixin):
         default="",
         blank=True,
     )
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    view_count = models.PositiveIntegerField(default=0, editable=False)
+    vote_count = models.IntegerField(default=0, editable=False)
+    # only used on Postgresql, see search.py
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = BlogQuerySet.as_manager()
 
     class Meta:
         """Meta configuration for the Blog model."""
 
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["draft", "-view_count", "-vote_count", "-created_at"],
+                name="blog_popularity_idx",
+            ),
+            # the order of the index pages when paged by cursor, see
+            # pagination.py. Only published posts are listed to most readers.
+            models.Index(
+                fields=["-created_at", "-id"],
+                condition=Q(draft=False),
+                name="blog_published_keyset_idx",
+            ),
+        ]
 
     def __str__(self):
         """Return string representation of the Blog object."""
         return self.title
 
     def save(self, *args, **kwargs):
-        """Override the save fumction, so we can generate the slug."""
+        """Override the save fumction, so we can generate the slug.
+
+        The body is rendered for display here too, so it is only done once. The
+        derived columns are never written by a normal save of an existing
+        post, so a stale instance cannot overwrite the signal updates.
+        """
         self.slug = slugify(self.title)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "body" in update_fields:
+            self.rendered_body = render_body(self.body)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "rendered_body"}
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in DERIVED_FIELDS
+            ]
+        # a new upload, or a removed image, needs new resized copies.
+        image_changed = (self.image and not self.image._committed) or (
+            not self.image and self.image_sizes
+        )
         super(Blog, self).save(*args, **kwargs)
+        if image_changed:
+            update_image_sizes(self, "header")
 
     def get_absolute_url(self):
         """Override get_absolute_url function."""
@@ -106,7 +257,7 @@ class Blog(models.Model, HitCountModelMixin):
 
     def no_of_comments(self):
         """Count comments on this post."""
-        return Comment.objects.filter(related_post=self).count()
+        return self.comment_count
 
     def has_image_meta(self):
         """Return true if this post has any image metadata."""
@@ -182,6 +333,76 @@ def post_count(self):
     return self.posts.all().count()
 
 
+class TagQuerySet(models.QuerySet):
+    """Custom QuerySet for the Tag model."""
+
+    def overview(self, user=None, limit=6):
+        """Return the tags with their most popular posts, as plain data.
+
+        Each tag is a dictionary with its 'tag_name', 'slug', 'post_count' and
+        up to 'limit' 'posts' ({'slug', 'title', 'draft'}), ordered by hits,
+        votes then date. Draft posts are only included for their author. The
+        posts of every tag come from one query, numbering the posts of each tag
+        with ROW_NUMBER() and keeping the first 'limit' of them.
+        """
+        tags = {
+            pk: {"tag_name": tag_name, "slug": slug, "posts": []}
+            for pk, tag_name, slug in self.values_list("pk", "tag_name", "slug")
+        }
+        if not tags:
+            return []
+
+        visible = Q(blog__draft=False)
+        if user is not None and user.is_authenticated:
+            visible |= Q(blog__user=user)
+        partition = [F("tag_id")]
+        ranked = (
+            self.model.posts.through.objects.filter(
+                visible, tag__in=self.values("pk")
+            )
+            .annotate(
+                post_rank=Window(
+                    RowNumber(),
+                    partition_by=partition,
+                    order_by=[
+                        F("blog__view_count").desc(),
+                        F("blog__vote_count").desc(),
+                        F("blog__created_at").desc(),
+                        F("blog_id").desc(),
+                    ],
+                ),
+                post_total=Window(Count("pk"), partition_by=partition),
+            )
+            .values_list(
+                "tag_id",
+                "blog__slug",
+                "blog__title",
+                "blog__draft",
+                "post_rank",
+                "post_total",
+            )
+        )
+        # a window function can't be filtered on in the same query, so keep
+        # the top posts of each tag in an outer query.
+        sql, params = ranked.query.get_compiler(self.db).as_sql()
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f"SELECT * FROM ({sql}) ranked WHERE post_rank <= %s "
+                "ORDER BY tag_id, post_rank",
+                (*params, limit),
+            )
+            for tag_id, slug, title, draft, _, total in cursor.fetchall():
+                tags[tag_id]["posts"].append(
+                    {"slug": slug, "title": title, "draft": bool(draft)}
+                )
+                tags[tag_id]["post_count"] = total
+
+        for tag in tags.values():
+            tag.setdefault("post_count", 0)
+            tag["more"] = tag["post_count"] > limit
+        return list(tags.values())
+
+
 class Tag(models.Model):
     """Define the Tags model."""
 
@@ -193,6 +414,18 @@ class Tag(models.Model):
     slug = models.SlugField(default="", unique=True)
     posts = models.ManyToManyField(Blog, blank=True)
 
+    objects = TagQuerySet.as_manager()
+
+    class Meta:
+        """Meta configuration for the Tag model."""
+
+        constraints = [
+            # tags are looked up by name case-insensitively, see tags.py
+            models.UniqueConstraint(
+                Lower("tag_name"), name="blog_tag_name_ci_unique"
+            ),
+        ]
+
     def __str__(self):
         """Define the Text version of this object."""
         return f"{self.tag_name}"
@@ -212,3 +445,104 @@ class Redirect(models.Model):
     def __str__(self):
         """Define the Text version of this object."""
         return f"{self.old_slug} -> {self.old_post}"
+
+
+class RelatedPost(models.Model):
+    """Define the RelatedPost model.
+
+    The top few related posts of each published post, by rank, as computed
+    by blog/related.py from the posts' tags and popularity.
+    """
+
+    post = models.ForeignKey(
+        Blog, on_delete=models.CASCADE, related_name="related_posts"
+    )
+    related = models.ForeignKey(
+        Blog, on_delete=models.CASCADE, related_name="+"
+    )
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        """Meta configuration for the RelatedPost model."""
+
+        ordering = ["post", "rank"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["post", "rank"], name="blog_relatedpost_rank_unique"
+            ),
+        ]
+
+    def __str__(self):
+        """Define the Text version of this object."""
+        return f"{self.post} -> {self.related} ({self.rank})"
+
+
+class RelatedPostUpdate(models.Model):
+    """Define the RelatedPostUpdate model.
+
+    A queue of the posts whose related posts may have changed, added to by the
+    signals and worked through by 'build_related_posts --pending'.
+    """
+
+    post = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name="+")
+
+    def __str__(self):
+        """Define the Text version of this object."""
+        return f"Update the related posts of {self.post}"
+
+
+class PostPopularity(models.Model):
+    """Define the PostPopularity model.
+
+    The time decayed popularity of each published post with any hits or likes,
+    kept up to date by the refresh_popularity command, see blog/popularity.py.
+    """
+
+    post = models.OneToOneField(
+        Blog,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="popularity",
+    )
+    # log2 of the decayed activity at the epoch, only comparable to the others.
+    score = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        """Meta configuration for the PostPopularity model."""
+
+        verbose_name_plural = "post popularities"
+        indexes = [
+            models.Index(fields=["-score"], name="blog_popularity_score_idx"),
+        ]
+
+    def __str__(self):
+        """Define the Text version of this object."""
+        return f"{self.post} ({self.score:.2f})"
+
+
+class PopularityRefresh(models.Model):
+    """Define the PopularityRefresh model.
+
+    A record of each popularity refresh, the last one says which hits and
+    votes have been counted and with which settings.
+    """
+
+    last_hit_id = models.PositiveBigIntegerField(default=0)
+    last_vote_id = models.PositiveBigIntegerField(default=0)
+    half_life = models.FloatField()
+    vote_weight = models.FloatField()
+    full = models.BooleanField(default=False)
+    posts = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        """Meta configuration for the PopularityRefresh model."""
+
+        get_latest_by = "pk"
+
+    def __str__(self):
+        """Define the Text version of this object."""
+        kind = "full" if self.full else "incremental"
+        return f"{kind} refresh of {self.posts} post(s) at {self.finished_at}"
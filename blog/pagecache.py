@@ -0,0 +1,198 @@
+"""Full-page cache of the public blog pages for anonymous readers.
+
+The index, tag list, tag detail and post detail pages are stored in the Django
+cache the first time an anonymous visitor requests them, already minified, and
+served from there until they change or PAGE_CACHE_TIMEOUT expires. Each page
+belongs to a group ('index', 'tags', 'tag:<slug>' or 'post:<slug>') with its own
+version, so saving a comment only purges the pages showing that post, while
+anything that changes every page (a new or renamed post, a tag, the site
+preferences) bumps the version of all of them. See signals.py for the purging.
+
+Hits on a cached post page are still counted, the hit count entry is stored
+alongside the page for that. The ETag and Last-Modified headers are stored too,
+so cached pages can also be revalidated with a 304.
+"""
+from hashlib import md5
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from hitcount.utils import get_hitcount_model
+from secretballot.utils import get_vote_model
+
+from blog.cache import bump_version, get_version, versioned_key
+from blog.hits import count_hit
+from blog.models import Blog
+
+# the pages that may be cached, with the group each one belongs to.
+CACHED_PAGES = {
+    "blog:index": lambda kwargs: "index",
+    "blog:tag_list": lambda kwargs: "tags",
+    "blog:tag_detail": lambda kwargs: f"tag:{kwargs['slug']}",
+    "blog:detail": lambda kwargs: f"post:{kwargs['slug']}",
+    "blog:comments": lambda kwargs: f"post:{kwargs['slug']}",
+}
+
+
+def page_timeout():
+    """Return how many seconds a page stays in the cache, 0 to disable."""
+    return getattr(settings, "PAGE_CACHE_TIMEOUT", 300)
+
+
+def purge_all_pages():
+    """Drop every cached page."""
+    bump_version("pages")
+
+
+def purge_pages(*groups):
+    """Drop the cached pages in these groups."""
+    for group in groups:
+        bump_version(f"pages:{group}")
+
+
+def purge_post_pages(post):
+    """Drop every cached page that shows this post.
+
+    That is its own page (under its current and old slugs), the index, the
+    tag list and the pages of each of its tags.
+    """
+    slugs = [post.slug, *post.redirect_set.values_list("old_slug", flat=True)]
+    purge_pages(
+        "index",
+        "tags",
+        *(f"post:{slug}" for slug in slugs),
+        *(
+            f"tag:{slug}"
+            for slug in post.tag_set.values_list("slug", flat=True)
+        ),
+    )
+
+
+def can_vote(request, slug):
+    """Return True if this visitor has not yet liked the post.
+
+    The like button is the only part of a post page that differs between
+    anonymous readers, so it is part of the cache key.
+    """
+    token = getattr(request, "secretballot_token", None)
+    if token is None:
+        return False
+    return not (
+        get_vote_model()
+        .objects.filter(
+            content_type=ContentType.objects.get_for_model(Blog),
+            object_id__in=Blog.objects.filter(slug=slug).values("pk"),
+            token=token,
+        )
+        .exists()
+    )
+
+
+class PageCacheMiddleware:
+    """Serve the public pages to anonymous readers from the cache.
+
+    This must come after the authentication, messages and secretballot
+    middleware and before HtmlMinifyMiddleware, so the minified page is stored.
+    """
+
+    def __init__(self, get_response):
+        """Store the next handler in the chain."""
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Return the cached page, or render and store it."""
+        key = self.get_cache_key(request)
+        if key is None:
+            return self.get_response(request)
+
+        entry = cache.get(key)
+        if entry is not None:
+            return self.cached_response(request, entry)
+
+        response = self.get_response(request)
+        if response.status_code == 200 and not response.streaming:
+            cache.set(key, self.make_entry(response), page_timeout())
+        return response
+
+    def get_cache_key(self, request):
+        """Return the cache key for this request, or None if not cacheable."""
+        if request.method != "GET" or request.user.is_authenticated:
+            return None
+        if not page_timeout():
+            return None
+        # other query strings are rare, don't let them fill the cache.
+        if set(request.GET) - {"page", "cursor"}:
+            return None
+        # a page showing flash messages must not be stored or served.
+        if "messages" in request.COOKIES or "_messages" in request.session:
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        group = CACHED_PAGES.get(match.view_name)
+        if group is None:
+            return None
+
+        group = group(match.kwargs)
+        variant = "page"
+        if match.view_name == "blog:detail":
+            variant = (
+                "can-vote"
+                if can_vote(request, match.kwargs["slug"])
+                else "voted"
+            )
+        return versioned_key(
+            "pages",
+            get_version(f"pages:{group}"),
+            variant,
+            request.GET.get("page", 1),
+            request.GET.get("cursor", ""),
+            md5(request.path.encode()).hexdigest(),
+        )
+
+    def make_entry(self, response):
+        """Return what is stored for this response.
+
+        Cookies are never stored, as they belong to the visitor who caused
+        the page to be rendered.
+        """
+        context = getattr(response, "context_data", None) or {}
+        hitcount = None
+        if "hitcount" in context:
+            post = context["object"]
+            hitcount = (
+                context["hitcount"]["pk"],
+                ContentType.objects.get_for_model(post).id,
+                str(post.pk),
+            )
+        return {
+            "content": response.content,
+            "headers": dict(response.headers),
+            "hitcount": hitcount,
+        }
+
+    def cached_response(self, request, entry):
+        """Build the response for a cached page, counting the hit if needed."""
+        if entry["hitcount"] is not None:
+            pk, content_type_id, object_pk = entry["hitcount"]
+            count_hit(
+                request,
+                get_hitcount_model()(
+                    pk=pk, content_type_id=content_type_id, object_pk=object_pk
+                ),
+            )
+        response = HttpResponse(entry["content"], headers=entry["headers"])
+        # revalidate against the validators stored with the page.
+        return get_conditional_response(
+            request,
+            etag=response.get("ETag"),
+            last_modified=parse_http_date_safe(
+                response.get("Last-Modified", "")
+            ),
+            response=response,
+        )
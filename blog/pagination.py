@@ -0,0 +1,236 @@
+"""Keyset (cursor) pagination of the posts and comments.
+
+Numbered pages cost a COUNT of every post, and an OFFSET that makes the
+database read and throw away every post before the page, so the deeper the
+page the slower it is. A cursor page instead remembers the (created_at, id) of
+the post at its edge, and the next page starts right after it, using
+blog_published_keyset_idx, so every page costs the same however deep it is.
+
+Cursors are opaque strings in the 'cursor' query parameter, they hold the key
+of the edge item and which way to read from it. Set BLOG_PAGINATION to
+'cursor' in settings.py to page the index this way. Comments are always paged
+this way, oldest first, as a post can have thousands of them, and so are the
+posts and comments of the read API, with the same cursors.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from blog.cache import versioned_key
+
+TOTAL_TIMEOUT = 60 * 60
+
+
+def pagination_mode():
+    """Return how the post lists are paged, 'offset' or 'cursor'."""
+    return getattr(settings, "BLOG_PAGINATION", "offset")
+
+
+def encode_cursor(post, backwards=False):
+    """Return the opaque cursor that reads on from this post."""
+    key = [post.created_at.isoformat(), post.pk, backwards]
+    return urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return the (created_at, pk, backwards) held by a cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, pk, backwards = json.loads(urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(pk), bool(backwards)
+    except (ValueError, TypeError) as error:
+        raise InvalidPage("That cursor is not valid.") from error
+
+
+class CursorPage:
+    """One page of posts, with the cursors of the pages either side."""
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        """Store the posts and the cursors."""
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        """Iterate over the posts on this page."""
+        return iter(self.object_list)
+
+    def __len__(self):
+        """Return the number of posts on this page."""
+        return len(self.object_list)
+
+    def has_next(self):
+        """Return True if there are older posts."""
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        """Return True if there are newer posts."""
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        """Return True if there are posts on other pages."""
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Page through posts or comments by (created_at, id).
+
+    The items are newest first, unless 'newest_first' is False.
+    """
+
+    def __init__(self, queryset, per_page, newest_first=True):
+        """Store the items to page through, and how many go on a page."""
+        self.queryset = queryset
+        self.per_page = per_page
+        self.newest_first = newest_first
+
+    def page(self, cursor=None):
+        """Return the page of items that this cursor points to.
+
+        One more item than fits is read, to find out if there is another page.
+        """
+        backwards = False
+        if cursor:
+            created_at, pk, backwards = decode_cursor(cursor)
+        descending = self.newest_first != backwards
+        if descending:
+            items = self.queryset.order_by("-created_at", "-pk")
+        else:
+            items = self.queryset.order_by("created_at", "pk")
+        if cursor and descending:
+            items = items.filter(
+                Q(created_at__lt=created_at) | Q(pk__lt=pk),
+                created_at__lte=created_at,
+            )
+        elif cursor:
+            items = items.filter(
+                Q(created_at__gt=created_at) | Q(pk__gt=pk),
+                created_at__gte=created_at,
+            )
+
+        rows = list(items[: self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = True, more
+        else:
+            has_next, has_previous = more, bool(cursor)
+        if not rows:
+            has_next = has_previous = False
+
+        return CursorPage(
+            rows,
+            self,
+            encode_cursor(rows[-1]) if has_next else None,
+            encode_cursor(rows[0], backwards=True) if has_previous else None,
+        )
+
+    @cached_property
+    def count(self):
+        """Return the total number of items, cached for up to an hour.
+
+        The total is approximate, it is only recounted when a post is added
+        or removed (which bumps the 'pages' version) or the hour is up.
+        """
+        query = md5(str(self.queryset.query).encode()).hexdigest()
+        key = versioned_key("pages", "post-total", query)
+        return cache.get_or_set(key, self.queryset.count, TOTAL_TIMEOUT)
+
+
+class CursorPaginationMixin:
+    """Page a ListView by cursor.
+
+    This is only done if BLOG_PAGINATION is 'cursor', unless 'always_cursor'
+    is set.
+    """
+
+    always_cursor = False
+    newest_first = True
+
+    def uses_cursor(self):
+        """Return True if this view is paged by cursor."""
+        return self.always_cursor or pagination_mode() == "cursor"
+
+    def paginate_queryset(self, queryset, page_size):
+        """Return (paginator, page, object_list, is_paginated)."""
+        if not self.uses_cursor():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size, self.newest_first)
+        try:
+            page = paginator.page(self.request.GET.get("cursor"))
+        except InvalidPage as error:
+            raise Http404(str(error))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        """Tell the template which kind of pagination links to show."""
+        context = super().get_context_data(**kwargs)
+        context["cursor_pagination"] = self.uses_cursor()
+        context["show_total"] = getattr(settings, "BLOG_PAGINATION_TOTAL", True)
+        return context
+
+
+class APICursorPagination(BasePagination):
+    """Page an API list of posts or comments by (created_at, id).
+
+    The view's 'newest_first' sets the order, as with CursorPaginationMixin.
+    """
+
+    page_size = 10
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return the items on the page the request's cursor points to."""
+        self.request = request
+        paginator = CursorPaginator(
+            queryset, self.page_size, getattr(view, "newest_first", True)
+        )
+        try:
+            self.page = paginator.page(request.query_params.get("cursor"))
+        except InvalidPage as error:
+            raise NotFound(str(error))
+        return list(self.page)
+
+    def get_link(self, cursor):
+        """Return the URL of the page this cursor points to, or None."""
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, "cursor", cursor)
+
+    def get_paginated_response(self, data):
+        """Return the items with the links to the pages either side."""
+        return Response(
+            {
+                "next": self.get_link(self.page.next_cursor),
+                "previous": self.get_link(self.page.previous_cursor),
+                "results": data,
+            }
+        )
+
+
+class SlugCursorPagination(CursorPagination):
+    """Page an API list of tags by slug."""
+
+    ordering = "slug"
+    page_size = 50
+
+
+class IdCursorPagination(CursorPagination):
+    """Page an API list of authors by id."""
+
+    ordering = "id"
+    page_size = 50
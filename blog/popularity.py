@@ -0,0 +1,185 @@
+"""Rank the posts by their recent hits and likes, with an exponential decay.
+
+Every hit counts 1, and every like BLOG_POPULARITY_VOTE_WEIGHT, halving in
+value every BLOG_POPULARITY_HALF_LIFE days, so a post that was popular a year
+ago drops below one that is popular this week. The score of a post is the sum
+of its decayed hits and likes.
+
+Decaying every score to the present would mean rewriting every row on each
+refresh. Instead the events are decayed (or rather grown) to a fixed epoch, the
+Unix epoch: an event at time t counts weight * 2 ** (t / half life), and the
+posts are ordered by the sum of these, which is the same order as their
+decayed scores at any time. A new event then only adds to the score of its own
+post, so a refresh only touches the posts with new hits or likes. The sums are
+kept as log2, as the sums themselves would overflow a float; decayed_score
+turns one back into the decayed activity at a given time.
+
+The hits and votes are read by id, the last ids read are kept in a
+PopularityRefresh row, and the next refresh only reads those after them.
+Changing the half life or the vote weight makes the next refresh a full one,
+as does 'refresh_popularity --full', which also drops likes that were taken
+back and posts that are gone.
+
+Only published posts are scored, so the popular posts are read straight from
+the score index, without checking each post is published. A post that is
+unpublished loses its score (see signals.py), and one that is published is
+scored from its next hit on.
+"""
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from hitcount.models import Hit
+from secretballot.utils import get_vote_model
+
+from blog.backup import CHUNK_SIZE
+from blog.cache import bump_version
+from blog.models import Blog, PopularityRefresh, PostPopularity
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def half_life():
+    """Return how many days it takes a hit or like to lose half its value."""
+    return float(getattr(settings, "BLOG_POPULARITY_HALF_LIFE", 7))
+
+
+def vote_weight():
+    """Return how many hits a like counts for."""
+    return float(getattr(settings, "BLOG_POPULARITY_VOTE_WEIGHT", 5))
+
+
+def decayed_score(score, when):
+    """Return the decayed activity of a stored score at this time."""
+    return 2 ** (score - when.timestamp() / (half_life() * SECONDS_PER_DAY))
+
+
+def log_sums(post_ids, exponents):
+    """Return the posts and log2 of the sum of 2 ** exponent for each.
+
+    The largest exponent of each post is taken out before summing, so the
+    powers can't overflow.
+    """
+    posts, groups = np.unique(post_ids, return_inverse=True)
+    largest = np.full(len(posts), -np.inf)
+    np.maximum.at(largest, groups, exponents)
+    sums = np.bincount(groups, weights=np.exp2(exponents - largest[groups]))
+    return posts, largest + np.log2(sums)
+
+
+def merge_scores(scores, posts, sums):
+    """Add the log2 sums of these posts into the dict of scores."""
+    for post, value in zip(posts.tolist(), sums.tolist()):
+        old = scores.get(post)
+        scores[post] = value if old is None else np.logaddexp2(old, value)
+
+
+def add_events(scores, events, weight):
+    """Add the (post id, time) events of this weight into the scores.
+
+    The events are read in chunks, so they are never all held at once.
+    """
+    events = iter(events)
+    seconds = half_life() * SECONDS_PER_DAY
+    while chunk := list(islice(events, CHUNK_SIZE)):
+        post_ids = np.fromiter((row[0] for row in chunk), np.int64, len(chunk))
+        times = np.fromiter(
+            (row[1].timestamp() for row in chunk), np.float64, len(chunk)
+        )
+        merge_scores(
+            scores, *log_sums(post_ids, times / seconds + np.log2(weight))
+        )
+
+
+def new_activity(after_hit=0, after_vote=0):
+    """Return the scores of the hits and likes since these ids.
+
+    Returns ({post id: log2 sum}, last hit id, last vote id).
+    """
+    content_type = ContentType.objects.get_for_model(Blog)
+    Vote = get_vote_model()
+    last_hit = Hit.objects.aggregate(last=Max("pk"))["last"] or 0
+    last_vote = Vote.objects.aggregate(last=Max("pk"))["last"] or 0
+
+    scores = {}
+    hits = Hit.objects.filter(
+        pk__gt=after_hit,
+        pk__lte=last_hit,
+        hitcount__content_type=content_type,
+    ).values_list("hitcount__object_pk", "created")
+    add_events(scores, hits.iterator(CHUNK_SIZE), 1)
+    # only likes count, the time of some old votes was not recorded.
+    likes = Vote.objects.filter(
+        pk__gt=after_vote,
+        pk__lte=last_vote,
+        content_type=content_type,
+        vote__gt=0,
+        created_at__isnull=False,
+    ).values_list("object_id", "created_at")
+    if vote_weight() > 0:
+        add_events(scores, likes.iterator(CHUNK_SIZE), vote_weight())
+    return scores, last_hit, last_vote
+
+
+def refresh_popularity(full=False):
+    """Add the hits and likes since the last refresh to the posts' scores.
+
+    A full refresh recounts every hit and like instead. Returns the
+    PopularityRefresh, with how many posts were updated.
+    """
+    last = PopularityRefresh.objects.order_by("-pk").first()
+    full = (
+        full
+        or last is None
+        or last.half_life != half_life()
+        or last.vote_weight != vote_weight()
+    )
+    scores, last_hit, last_vote = (
+        new_activity()
+        if full
+        else new_activity(last.last_hit_id, last.last_vote_id)
+    )
+
+    with transaction.atomic():
+        # only published posts are ranked, and hits can outlive their post.
+        posts = Blog.objects.filter(draft=False).values_list("pk", flat=True)
+        if not full:
+            posts = posts.filter(pk__in=list(scores))
+        posts = set(posts) & scores.keys()
+        if full:
+            PostPopularity.objects.all().delete()
+            existing = {}
+        else:
+            existing = {
+                row.pk: row
+                for row in PostPopularity.objects.filter(pk__in=list(posts))
+            }
+        now = timezone.now()
+        for post_id, row in existing.items():
+            row.score = float(np.logaddexp2(row.score, scores[post_id]))
+            row.updated_at = now
+        PostPopularity.objects.bulk_update(
+            existing.values(), ["score", "updated_at"], batch_size=CHUNK_SIZE
+        )
+        PostPopularity.objects.bulk_create(
+            (
+                PostPopularity(post_id=post_id, score=float(scores[post_id]))
+                for post_id in posts - set(existing)
+            ),
+            batch_size=CHUNK_SIZE,
+        )
+        refresh = PopularityRefresh.objects.create(
+            last_hit_id=last_hit,
+            last_vote_id=last_vote,
+            half_life=half_life(),
+            vote_weight=vote_weight(),
+            full=full,
+            posts=len(posts),
+        )
+    # the popular posts are in the sidebar.
+    bump_version("sidebar")
+    return refresh
@@ -0,0 +1,78 @@
+"""Permanent redirects from the old slugs of renamed posts.
+
+When a published post is renamed its old slug is stored in the Redirect table.
+Every process keeps the old slugs in memory, as a map of old slug to the
+current slug of the post, which is rebuilt with one query whenever the
+'redirects' version is bumped (on any Redirect or Blog change, see signals.py).
+A request for an old slug is answered from the map with a cacheable 301,
+without touching the database.
+
+A Redirect points at the post rather than at the next slug, so however many
+times a post is renamed, every old slug goes straight to the current one.
+"""
+from functools import wraps
+
+from django.http import HttpResponsePermanentRedirect
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+
+from blog.cache import get_version
+from blog.models import Blog, Redirect
+
+# how long browsers and proxies may cache a redirect for.
+REDIRECT_MAX_AGE = 60 * 60 * 24
+
+# the process-wide map, as a (version, {old slug: current slug}) tuple.
+_redirects = None
+
+
+def build_redirects():
+    """Return {old slug: current slug} for the published posts.
+
+    Slugs that now belong to a post are left out, as are any old slugs that
+    would redirect to themselves.
+    """
+    rows = (
+        Redirect.objects.filter(old_post__draft=False)
+        .exclude(old_slug__in=Blog.objects.values("slug"))
+        .values_list("old_slug", "old_post__slug")
+    )
+    return {old: new for old, new in rows.iterator() if old != new}
+
+
+def get_redirects():
+    """Return the redirect map, rebuilding it if it is out of date."""
+    global _redirects
+    version = get_version("redirects")
+    if _redirects is None or _redirects[0] != version:
+        _redirects = (version, build_redirects())
+    return _redirects[1]
+
+
+def record_rename(post, old_slug):
+    """Redirect a renamed post's old slug to it.
+
+    Any redirect from the post's new slug is removed, so a post renamed back to
+    an earlier title can't redirect to itself.
+    """
+    Redirect.objects.filter(old_slug=post.slug).delete()
+    Redirect.objects.update_or_create(
+        old_slug=old_slug, defaults={"old_post": post}
+    )
+
+
+def redirect_old_slugs(view):
+    """Decorate a post view to send old slugs to the post's current URL."""
+
+    @wraps(view)
+    def wrapper(request, *args, slug, **kwargs):
+        new_slug = get_redirects().get(slug)
+        if new_slug is None:
+            return view(request, *args, slug=slug, **kwargs)
+        response = HttpResponsePermanentRedirect(
+            reverse("blog:detail", args=[new_slug])
+        )
+        patch_cache_control(response, public=True, max_age=REDIRECT_MAX_AGE)
+        return response
+
+    return wrapper
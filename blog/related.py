@@ -0,0 +1,330 @@
+"""Precomputed 'related posts', from the posts' tags and popularity.
+
+The published posts and their tags are read in two queries into a sparse
+post-by-tag matrix, kept as the (post, tag) index pairs sorted both ways
+(CSR style). Each tag is weighted by its inverse document frequency, so a tag
+on every post says little about two posts being related. The similarity of
+every post in a batch to every other post is the cosine of their weighted tag
+vectors, computed for the whole batch at once with NumPy, by expanding each
+tag of the batch's posts into the posts that have that tag and summing with
+bincount. Only posts that share a tag are candidates, and their score is
+blended with their popularity (views and votes, on a log scale):
+
+    score = (1 - BLOG_RELATED_POPULARITY) * similarity
+            + BLOG_RELATED_POPULARITY * popularity
+
+The best BLOG_RELATED_POSTS of each post are stored in the RelatedPost table,
+so the post page reads them with a single query. Computing them reads every
+published post and tag, so it is never done while a post is saved: when a
+post's tags change or it is published, unpublished or deleted, the post is
+added to the RelatedPostUpdate queue as its transaction commits (see
+signals.py). 'build_related_posts --pending' recomputes the related posts
+affected by the queued posts, and should be run often. 'build_related_posts'
+recomputes those of every post, and should be run regularly as the popularity
+changes. A change of tags also shifts the weight of those tags a little for
+every post that has them, which is left to the next full build too. The pages
+of the posts whose related posts were recomputed are purged from the page
+cache.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+
+from blog.models import Blog, RelatedPost, RelatedPostUpdate, Tag
+from blog.pagecache import purge_all_pages, purge_pages
+
+# how many posts are scored against every other post at once.
+BATCH_SIZE = 256
+
+
+def related_count():
+    """Return how many related posts are kept for each post."""
+    return getattr(settings, "BLOG_RELATED_POSTS", 4)
+
+
+def popularity_weight():
+    """Return how much the popularity counts, against the similarity."""
+    return getattr(settings, "BLOG_RELATED_POPULARITY", 0.2)
+
+
+class TagMatrix:
+    """The sparse post-by-tag matrix of the published posts."""
+
+    def __init__(self):
+        """Load the published posts and their tags."""
+        posts = list(
+            Blog.objects.filter(draft=False)
+            .order_by("pk")
+            .values_list("pk", "view_count", "vote_count")
+        )
+        self.post_ids = np.array([row[0] for row in posts], dtype=np.int64)
+        counts = np.array([row[1:] for row in posts], dtype=np.float64)
+        counts = counts.reshape(len(posts), 2)
+        # votes are rarer than views, so count for more.
+        popularity = np.log1p(counts[:, 0] + 5 * np.maximum(counts[:, 1], 0))
+        top = popularity.max() if len(posts) else 0
+        self.popularity = popularity / top if top else popularity
+
+        pairs = np.array(
+            Tag.posts.through.objects.filter(blog__draft=False).values_list(
+                "blog_id", "tag_id"
+            ),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        tag_ids, tags = np.unique(pairs[:, 1], return_inverse=True)
+        posts = np.searchsorted(self.post_ids, pairs[:, 0])
+        count = len(self.post_ids)
+
+        # the tags of each post, and the posts of each tag.
+        by_post = np.lexsort((tags, posts))
+        self.post_tags = tags[by_post]
+        self.post_ptr = np.searchsorted(posts[by_post], np.arange(count + 1))
+        by_tag = np.lexsort((posts, tags))
+        self.tag_posts = posts[by_tag]
+        self.tag_ptr = np.searchsorted(
+            tags[by_tag], np.arange(len(tag_ids) + 1)
+        )
+
+        # squared inverse document frequency of each tag, and post norms.
+        frequency = np.diff(self.tag_ptr)
+        self.weights = np.log1p(count / np.maximum(frequency, 1)) ** 2
+        self.norms = np.sqrt(
+            np.bincount(posts, weights=self.weights[tags], minlength=count)
+        )
+
+    def locate(self, post_ids):
+        """Return the rows of these posts, and which of them were found."""
+        post_ids = np.asarray(post_ids, dtype=np.int64)
+        if not len(self.post_ids):
+            return post_ids, np.zeros(len(post_ids), dtype=bool)
+        rows = np.searchsorted(self.post_ids, post_ids)
+        rows = np.minimum(rows, len(self.post_ids) - 1)
+        return rows, self.post_ids[rows] == post_ids
+
+    def index_of(self, post_ids):
+        """Return the rows of these posts, leaving out unknown ones."""
+        rows, found = self.locate(sorted(post_ids))
+        return rows[found]
+
+    def similarity(self, rows):
+        """Return the cosine similarity of these posts to every post."""
+        count = len(self.post_ids)
+        # the (batch row, tag) pairs of the posts in this batch.
+        starts, ends = self.post_ptr[rows], self.post_ptr[rows + 1]
+        lengths = ends - starts
+        batch_rows = np.repeat(np.arange(len(rows)), lengths)
+        tags = self.post_tags[expand_ranges(starts, lengths)]
+
+        # each pair adds its tag's weight to every post with that tag.
+        tag_lengths = self.tag_ptr[tags + 1] - self.tag_ptr[tags]
+        others = self.tag_posts[expand_ranges(self.tag_ptr[tags], tag_lengths)]
+        cells = np.repeat(batch_rows, tag_lengths) * count + others
+        shared = np.bincount(
+            cells,
+            weights=np.repeat(self.weights[tags], tag_lengths),
+            minlength=len(rows) * count,
+        ).reshape(len(rows), count)
+
+        norms = np.outer(self.norms[rows], self.norms)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(norms > 0, shared / norms, 0.0)
+
+    def newly_related(self, rows, count):
+        """Return the ids of posts that these posts could now be related to.
+
+        The similarity is symmetric, so the rows of these posts say how each
+        other post would score them. Those where one of them beats the lowest
+        stored related post (or that have fewer than 'count') are returned.
+        """
+        lowest = np.full(len(self.post_ids), -np.inf)
+        stored = np.array(
+            RelatedPost.objects.filter(rank=count - 1).values_list(
+                "post_id", "score"
+            ),
+            dtype=np.float64,
+        ).reshape(-1, 2)
+        stored_rows, found = self.locate(stored[:, 0])
+        lowest[stored_rows[found]] = stored[found, 1]
+
+        weight = popularity_weight()
+        newly = set()
+        for start in range(0, len(rows), BATCH_SIZE):
+            end = start + BATCH_SIZE
+            batch = rows[start:end]
+            similarity = self.similarity(batch)
+            scores = (1 - weight) * similarity + weight * self.popularity[
+                batch, np.newaxis
+            ]
+            scores[similarity <= 0] = -np.inf
+            best = scores.max(axis=0)
+            newly.update(self.post_ids[best > lowest].tolist())
+        return newly
+
+    def top_related(self, rows, count):
+        """Return [(post id, [(related id, score), ...]), ...] for these rows.
+
+        Only posts sharing a tag are related, the best 'count' of them.
+        """
+        weight = popularity_weight()
+        results = []
+        for start in range(0, len(rows), BATCH_SIZE):
+            end = start + BATCH_SIZE
+            batch = rows[start:end]
+            similarity = self.similarity(batch)
+            scores = (1 - weight) * similarity + weight * self.popularity
+            scores[similarity <= 0] = -np.inf
+            scores[np.arange(len(batch)), batch] = -np.inf
+
+            keep = min(count, scores.shape[1])
+            if keep == 0:
+                results += [(int(self.post_ids[row]), []) for row in batch]
+                continue
+            best = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1, kind="stable")
+            best = np.take_along_axis(best, order, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+            for row, columns, values in zip(batch, best, best_scores):
+                results.append(
+                    (
+                        int(self.post_ids[row]),
+                        [
+                            (int(self.post_ids[column]), float(value))
+                            for column, value in zip(columns, values)
+                            if np.isfinite(value)
+                        ],
+                    )
+                )
+        return results
+
+
+def expand_ranges(starts, lengths):
+    """Return the concatenated ranges start .. start + length, vectorized."""
+    total = lengths.sum()
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + (np.arange(total) - offsets)
+
+
+def store_related(results):
+    """Replace the stored related posts of these posts."""
+    with transaction.atomic():
+        RelatedPost.objects.filter(
+            post_id__in=[post_id for post_id, _ in results]
+        ).delete()
+        RelatedPost.objects.bulk_create(
+            (
+                RelatedPost(
+                    post_id=post_id, related_id=related, rank=rank, score=score
+                )
+                for post_id, related_posts in results
+                for rank, (related, score) in enumerate(related_posts)
+            ),
+            batch_size=1000,
+        )
+
+
+def build_related_posts():
+    """Recompute the related posts of every published post.
+
+    Returns the number of posts they were computed for.
+    """
+    last = RelatedPostUpdate.objects.aggregate(last=Max("pk"))["last"] or 0
+    matrix = TagMatrix()
+    rows = np.arange(len(matrix.post_ids))
+    # stored a few batches at a time, so they are not all held at once.
+    step = BATCH_SIZE * 8
+    for start in range(0, len(rows), step):
+        end = start + step
+        store_related(matrix.top_related(rows[start:end], related_count()))
+    # everything queued so far is up to date now.
+    RelatedPostUpdate.objects.filter(pk__lte=last).delete()
+    # drafts don't have related posts, and can't be one.
+    RelatedPost.objects.filter(
+        Q(post__draft=True) | Q(related__draft=True)
+    ).delete()
+    purge_all_pages()
+    return len(rows)
+
+
+def update_related_posts(post_ids):
+    """Recompute the related posts that may have changed with these posts.
+
+    Those are the related posts of these posts, of the posts that list any of
+    them as related, and of the posts that they now score high enough for.
+    """
+    post_ids = set(post_ids)
+    matrix = TagMatrix()
+    affected = (
+        post_ids
+        | set(
+            RelatedPost.objects.filter(related_id__in=post_ids).values_list(
+                "post_id", flat=True
+            )
+        )
+        | matrix.newly_related(matrix.index_of(post_ids), related_count())
+    )
+    results = matrix.top_related(matrix.index_of(affected), related_count())
+    # posts that are not published (any more) have none.
+    listed = {post_id for post_id, _ in results}
+    RelatedPost.objects.filter(post_id__in=affected - listed).delete()
+    store_related(results)
+    purge_pages(
+        *(
+            f"post:{slug}"
+            for slug in Blog.objects.filter(pk__in=affected).values_list(
+                "slug", flat=True
+            )
+        )
+    )
+
+
+def flush_related_updates(post_ids):
+    """Queue the posts in this set that still exist, and empty it."""
+    if not post_ids:
+        return
+    queued = list(post_ids)
+    post_ids.clear()
+    RelatedPostUpdate.objects.bulk_create(
+        RelatedPostUpdate(post_id=post_id)
+        for post_id in Blog.objects.filter(pk__in=queued).values_list(
+            "pk", flat=True
+        )
+    )
+
+
+def queue_related_update(post_ids):
+    """Queue these posts, to update their related posts in the next run.
+
+    The posts are kept in a set for the connection until the transaction
+    commits, and the first of its callbacks queues them all in one INSERT (the
+    others find the set empty). Outside a transaction they are queued straight
+    away. The posts of a rolled back transaction are queued with the next one,
+    which only costs an update that changes nothing. The work is done by
+    update_pending_related_posts.
+    """
+    connection = transaction.get_connection()
+    pending = getattr(connection, "pending_related_posts", None)
+    if pending is None:
+        pending = connection.pending_related_posts = set()
+    pending.update(post_ids)
+    transaction.on_commit(lambda: flush_related_updates(pending))
+
+
+def update_pending_related_posts():
+    """Update the related posts for the queued posts, and empty the queue.
+
+    Only the queue entries seen at the start are removed, so posts queued
+    while this runs are updated in the next run. Returns how many posts were
+    queued.
+    """
+    last = RelatedPostUpdate.objects.aggregate(last=Max("pk"))["last"]
+    if last is None:
+        return 0
+    queued = RelatedPostUpdate.objects.filter(pk__lte=last)
+    post_ids = set(queued.values_list("post_id", flat=True))
+    update_related_posts(post_ids)
+    queued.delete()
+    return len(post_ids)
@@ -0,0 +1,248 @@
+"""Render the CKEditor HTML of a post once, when it is saved.
+
+The body written in the editor is post-processed into the HTML that is shown
+on the post page, and stored in Blog.rendered_body :
+
+- it is sanitized, keeping only the tags and attributes the editor produces.
+- code snippets are highlighted with Pygments, using the same token classes as
+  Prism so the existing theme applies. They are not given a 'language-' class,
+  so Prism does not highlight them again in the browser.
+- images are given their width and height (read from the style set by the
+  editor, or from the file itself) and are loaded lazily.
+- the h2 to h4 headings are given an id and an anchor link.
+"""
+import re
+from pathlib import Path
+from urllib.parse import unquote
+
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.template.defaultfilters import slugify
+from PIL import Image
+from pygments.lexers import get_lexer_by_name
+from pygments.token import Token
+from pygments.util import ClassNotFound
+
+ALLOWED_TAGS = set(
+    "a address b blockquote br caption code div em h2 h3 h4 h5 h6 hr i img li "
+    "ol p pre s span strike strong sub sup table tbody td tfoot th thead tr u "
+    "ul".split()
+)
+ALLOWED_ATTRIBUTES = {
+    "*": {"class", "style", "title"},
+    "a": {"href", "name", "rel", "target"},
+    "img": {"alt", "height", "src", "width"},
+    "td": {"colspan", "rowspan"},
+    "th": {"colspan", "rowspan", "scope"},
+    "table": {"border", "cellpadding", "cellspacing"},
+}
+# these are removed along with everything inside them.
+REMOVED_TAGS = {"script", "style", "iframe", "object", "embed", "form"}
+ALLOWED_SCHEMES = {"http", "https", "mailto", ""}
+UNSAFE_STYLE_RE = re.compile(r"expression|url\s*\(|javascript:", re.I)
+
+# Pygments token types and the Prism token class used to style them. The most
+# specific match wins, tokens not listed here are not styled.
+PRISM_TOKENS = {
+    Token.Comment: "comment",
+    Token.Comment.Preproc: "prolog",
+    Token.Keyword: "keyword",
+    Token.Keyword.Constant: "boolean",
+    Token.Name.Attribute: "attr-name",
+    Token.Name.Builtin: "builtin",
+    Token.Name.Class: "class-name",
+    Token.Name.Constant: "constant",
+    Token.Name.Decorator: "function",
+    Token.Name.Function: "function",
+    Token.Name.Tag: "tag",
+    Token.Name.Variable: "variable",
+    Token.Literal.Number: "number",
+    Token.Literal.String: "string",
+    Token.Literal.String.Regex: "regex",
+    Token.Operator: "operator",
+    Token.Operator.Word: "keyword",
+    Token.Punctuation: "punctuation",
+    Token.Generic.Deleted: "deleted",
+    Token.Generic.Inserted: "inserted",
+}
+# Prism language names that Pygments knows by another name.
+LANGUAGE_ALIASES = {"markup": "html", "shell-session": "console"}
+
+DIMENSION_RE = re.compile(r"(width|height)\s*:\s*(\d+)px", re.I)
+
+
+def render_body(html):
+    """Return the rendered version of a post body."""
+    soup = BeautifulSoup(html or "", "html.parser")
+    sanitize(soup)
+    highlight_code(soup)
+    size_images(soup)
+    anchor_headings(soup)
+    return str(soup)
+
+
+def sanitize(soup):
+    """Remove every tag, attribute and link not produced by the editor."""
+    for tag in soup.find_all(REMOVED_TAGS):
+        tag.decompose()
+    for tag in soup.find_all(True):
+        if tag.name not in ALLOWED_TAGS:
+            tag.unwrap()
+            continue
+        allowed = ALLOWED_ATTRIBUTES["*"] | ALLOWED_ATTRIBUTES.get(
+            tag.name, set()
+        )
+        for attribute in list(tag.attrs):
+            value = tag[attribute]
+            if isinstance(value, list):
+                value = " ".join(value)
+            if (
+                attribute not in allowed
+                or (attribute == "style" and UNSAFE_STYLE_RE.search(value))
+                or (attribute in ("href", "src") and not safe_url(value))
+            ):
+                del tag[attribute]
+
+
+def safe_url(url):
+    """Return True if this link does not use a dangerous scheme."""
+    scheme, colon, _ = url.strip().partition(":")
+    if not colon or "/" in scheme:
+        return True
+    return scheme.lower() in ALLOWED_SCHEMES
+
+
+def highlight(code, language):
+    """Split code into (Prism token class, text) pairs.
+
+    The class is None for text that is not styled, and for the whole of the
+    code if the language is not known.
+    """
+    language = LANGUAGE_ALIASES.get(language, language)
+    try:
+        lexer = get_lexer_by_name(language, stripnl=False, ensurenl=False)
+    except ClassNotFound:
+        return [(None, code)]
+    tokens = []
+    for token_type, text in lexer.get_tokens(code):
+        while token_type not in PRISM_TOKENS and token_type.parent:
+            token_type = token_type.parent
+        token_class = PRISM_TOKENS.get(token_type)
+        if tokens and tokens[-1][0] == token_class:
+            tokens[-1] = (token_class, tokens[-1][1] + text)
+        else:
+            tokens.append((token_class, text))
+    return tokens
+
+
+def highlight_code(soup):
+    """Highlight the code snippets inserted by the editor."""
+    for code in soup.select("pre > code"):
+        pre = code.parent
+        classes = code.get("class", []) + pre.get("class", [])
+        language = next(
+            (c[9:] for c in classes if c.startswith("language-")), ""
+        )
+        tokens = highlight(code.get_text(), language)
+        code.clear()
+        for token_class, text in tokens:
+            if token_class is None:
+                code.append(text)
+            else:
+                span = soup.new_tag("span")
+                span["class"] = ["token", token_class]
+                span.string = text
+                code.append(span)
+        del code["class"]
+        pre["class"] = ["code_block"]
+        if language:
+            pre["data-language"] = language
+
+
+def image_size(src):
+    """Return the (width, height) of an uploaded image, or None."""
+    if not src.startswith(settings.MEDIA_URL):
+        return None
+    media_root = Path(settings.MEDIA_ROOT).resolve()
+    prefix = len(settings.MEDIA_URL)
+    path = (media_root / unquote(src[prefix:])).resolve()
+    if media_root not in path.parents:
+        return None
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except (OSError, ValueError):
+        return None
+
+
+def size_images(soup):
+    """Give every image its dimensions, and load it lazily."""
+    for img in soup.find_all("img"):
+        img["loading"] = "lazy"
+        img["decoding"] = "async"
+        if img.has_attr("width") and img.has_attr("height"):
+            continue
+        size = {
+            name.lower(): int(value)
+            for name, value in DIMENSION_RE.findall(img.get("style", ""))
+        }
+        if len(size) < 2:
+            natural = image_size(img.get("src", ""))
+            if natural is None:
+                continue
+            width, height = natural
+            # keep the aspect ratio if only one dimension was set.
+            if "width" in size:
+                height = round(height * size["width"] / width)
+                width = size["width"]
+            elif "height" in size:
+                width = round(width * size["height"] / height)
+                height = size["height"]
+            size = {"width": width, "height": height}
+        img["width"] = str(size["width"])
+        img["height"] = str(size["height"])
+
+
+def anchor_headings(soup):
+    """Give each heading a unique id, and a link to it."""
+    used = set()
+    for heading in soup.find_all(["h2", "h3", "h4"]):
+        slug = slugify(heading.get_text()) or "section"
+        anchor, count = slug, 1
+        while anchor in used:
+            count += 1
+            anchor = f"{slug}-{count}"
+        used.add(anchor)
+        heading["id"] = anchor
+        link = soup.new_tag(
+            "a", attrs={"class": "heading_anchor", "href": f"#{anchor}"}
+        )
+        link["aria-hidden"] = "true"
+        link.string = "#"
+        heading.append(link)
+
+
+def render_posts(queryset, batch_size=100):
+    """Re-render the body of these posts in bulk, returning how many.
+
+    The posts are read and written in batches, with one bulk UPDATE each. This
+    takes the queryset model rather than importing Blog so it can be used from
+    migrations.
+    """
+    model = queryset.model
+    batch = []
+    total = 0
+    for pk, body in (
+        queryset.order_by("pk")
+        .values_list("pk", "body")
+        .iterator(chunk_size=batch_size)
+    ):
+        batch.append(model(pk=pk, rendered_body=render_body(body)))
+        if len(batch) == batch_size:
+            model.objects.bulk_update(batch, ["rendered_body"])
+            total += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_update(batch, ["rendered_body"])
+        total += len(batch)
+    return total
@@ -0,0 +1,227 @@
+"""Full-text search for blog posts.
+
+Posts are searched on their title, tags, description and body, and the results
+are ranked by relevance. On Postgresql each post keeps a stored tsvector that
+is updated when it is saved or its tags change (see signals.py), and searches
+use the GIN index on it. Any other database falls back to an inverted index
+built in memory, which is rebuilt whenever the 'search' version is bumped.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, Func, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+from django.utils.html import strip_tags
+
+from blog.cache import get_version
+from blog.models import Blog
+
+# relative weight of each searched field, most important first.
+WEIGHTS = {"title": 1.0, "tags": 1.0, "desc": 0.4, "body": 0.2}
+
+WORD_RE = re.compile(r"\w+")
+
+
+def search_config():
+    """Return the Postgresql text search configuration to use."""
+    return getattr(settings, "BLOG_SEARCH_CONFIG", "english")
+
+
+def tokenize(text):
+    """Split text into lower case words."""
+    return WORD_RE.findall(text.lower())
+
+
+def update_search_vectors(queryset):
+    """Recompute the stored search vector of these posts in one UPDATE.
+
+    Does nothing unless we are running on Postgresql. This takes the queryset
+    model rather than importing Tag so it can be used from migrations.
+    """
+    if connection.vendor != "postgresql":
+        return
+    through = queryset.model._meta.get_field("tag").through
+    tags = (
+        through.objects.filter(blog=OuterRef("pk"))
+        .order_by()
+        .values("blog")
+        .annotate(names=StringAgg("tag__tag_name", " "))
+        .values("names")
+    )
+    body = Func(
+        F("body"),
+        Value("<[^>]+>"),
+        Value(" "),
+        Value("g"),
+        function="regexp_replace",
+        output_field=TextField(),
+    )
+    config = search_config()
+    queryset.update(
+        search_vector=(
+            SearchVector("title", weight="A", config=config)
+            + SearchVector(
+                Coalesce(Subquery(tags), Value("")), weight="A", config=config
+            )
+            + SearchVector("desc", weight="B", config=config)
+            + SearchVector(body, weight="C", config=config)
+        )
+    )
+
+
+class PostgresSearchBackend:
+    """Search the stored tsvector column, using its GIN index."""
+
+    def search(self, query, user=None):
+        """Return a lazy queryset of matching posts, best match first."""
+        search_query = SearchQuery(
+            query, search_type="websearch", config=search_config()
+        )
+        return (
+            Blog.objects.summary()
+            .visible_to(user)
+            .filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F("search_vector"), search_query))
+            .order_by("-rank", "-created_at")
+        )
+
+
+class InvertedIndex:
+    """A weighted inverted index of every post, held in memory."""
+
+    def __init__(self):
+        """Build the index from the database."""
+        tags = defaultdict(list)
+        for post_id, tag_name in Blog.tag_set.through.objects.values_list(
+            "blog_id", "tag__tag_name"
+        ):
+            tags[post_id].append(tag_name)
+
+        # maps each word to {post_id: weighted term frequency}
+        self.postings = defaultdict(dict)
+        # maps each draft post to its author
+        self.drafts = {}
+        self.post_count = 0
+        for post in Blog.objects.values(
+            "pk", "title", "desc", "body", "draft", "user_id"
+        ):
+            self.post_count += 1
+            if post["draft"]:
+                self.drafts[post["pk"]] = post["user_id"]
+            fields = {
+                "title": post["title"],
+                "tags": " ".join(tags[post["pk"]]),
+                "desc": post["desc"],
+                "body": strip_tags(post["body"]),
+            }
+            weights = Counter()
+            for field, text in fields.items():
+                for word in tokenize(text):
+                    weights[word] += WEIGHTS[field]
+            for word, weight in weights.items():
+                self.postings[word][post["pk"]] = weight
+
+    def search(self, query, user=None):
+        """Return the ids of posts containing every query word, ranked.
+
+        Draft posts are only returned to their author.
+        """
+        words = set(tokenize(query))
+        if not words:
+            return []
+        scores = None
+        for word in words:
+            postings = self.postings.get(word, {})
+            idf = math.log(1 + self.post_count / (1 + len(postings)))
+            word_scores = {
+                post_id: weight * idf for post_id, weight in postings.items()
+            }
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {
+                    post_id: score + word_scores[post_id]
+                    for post_id, score in scores.items()
+                    if post_id in word_scores
+                }
+        user_id = user.pk if user is not None else None
+        return sorted(
+            (
+                post_id
+                for post_id in scores
+                if self.drafts.get(post_id, user_id) == user_id
+            ),
+            key=lambda post_id: -scores[post_id],
+        )
+
+
+class RankedResults:
+    """A lazy, sliceable list of posts in a precomputed order.
+
+    Only the posts in the requested slice are fetched, so it can be handed to
+    a Paginator like a queryset.
+    """
+
+    def __init__(self, post_ids, queryset):
+        """Store the ranked ids and the queryset to fetch posts from."""
+        self.post_ids = post_ids
+        self.queryset = queryset
+
+    def count(self):
+        """Return the number of results."""
+        return len(self.post_ids)
+
+    def __len__(self):
+        """Return the number of results."""
+        return len(self.post_ids)
+
+    def __bool__(self):
+        """Return True if there are any results."""
+        return bool(self.post_ids)
+
+    def __getitem__(self, index):
+        """Fetch a single post, or a slice of posts, in ranked order."""
+        if isinstance(index, slice):
+            post_ids = self.post_ids[index]
+            posts = self.queryset.in_bulk(post_ids)
+            return [posts[post_id] for post_id in post_ids if post_id in posts]
+        return self[slice(index, index + 1)][0]
+
+    def __iter__(self):
+        """Iterate over every result."""
+        return iter(self[:])
+
+
+class InvertedIndexSearchBackend:
+    """Pure Python search, for databases without full-text support."""
+
+    # the process-wide index, as a (version, InvertedIndex) tuple.
+    _index = None
+
+    def get_index(self):
+        """Return the inverted index, rebuilding it if it is out of date."""
+        version = get_version("search")
+        cached = InvertedIndexSearchBackend._index
+        if cached is None or cached[0] != version:
+            cached = (version, InvertedIndex())
+            InvertedIndexSearchBackend._index = cached
+        return cached[1]
+
+    def search(self, query, user=None):
+        """Return the matching posts, best match first."""
+        return RankedResults(
+            self.get_index().search(query, user),
+            Blog.objects.summary().visible_to(user),
+        )
+
+
+def get_search_backend():
+    """Return the best search backend for the current database."""
+    if connection.vendor == "postgresql":
+        return PostgresSearchBackend()
+    return InvertedIndexSearchBackend()
@@ -0,0 +1,329 @@
+"""Generate a deterministic corpus of posts, tags, comments, hits and votes.
+
+The rows are written with bulk_create in batches of CHUNK_SIZE, so no signals
+are sent and nothing is saved one row at a time. The slugs, rendered bodies and
+counter columns that save() and the signals would fill in are computed here
+instead, the related posts and popularity scores are rebuilt in full, and every
+cache is invalidated at the end. The same seed always gives the same titles,
+tags, comments, hits and votes, so benchmark runs on two branches can be
+compared.
+
+Popularity follows a Zipf distribution: the posts are put in a random order of
+popularity, and the post at rank k gets a share of the hits (and comments)
+proportional to 1 / k ** skew. The tags are picked the same way, so a few tags
+are on most posts. A skew of 0 spreads them evenly.
+"""
+import random
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Max
+from django.template.defaultfilters import slugify
+from django.utils import timezone
+from hitcount.models import Hit
+from hitcount.utils import get_hitcount_model
+from secretballot.utils import get_vote_model
+
+from blog.backup import CHUNK_SIZE, original_timestamps
+from blog.cache import bump_version
+from blog.models import Blog, Comment, Tag
+from blog.pagecache import purge_all_pages
+from blog.popularity import refresh_popularity
+from blog.related import build_related_posts
+from blog.rendering import render_body
+from blog.search import update_search_vectors
+from users.models import Profile
+
+WORDS = (
+    "python django cache query index page post tag comment author feed view "
+    "model template server client browser search cursor signal counter "
+    "database table column vector image header sidebar profile backup stream "
+    "latency memory thread process request response header cookie session "
+    "token pattern design refactor release deploy docker proxy static media"
+).split()
+
+USER_AGENTS = (
+    "Mozilla/5.0 (X11; Linux x86_64; rv:105.0) Gecko/20100101 Firefox/105.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 12_6) AppleWebKit/605.1.15",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/106",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) Mobile/15E148",
+)
+
+# the bodies are picked from a few rendered ones, rendering is the slow part.
+BODY_COUNT = 20
+
+
+def purge_caches():
+    """Invalidate everything that is cached, as bulk_create sends no signals."""
+    purge_all_pages()
+    for namespace in ("sidebar", "search", "feeds", "redirects", "api"):
+        bump_version(namespace)
+
+
+def zipf_weights(count, skew):
+    """Return the weights of 'count' ranks, the first being the largest."""
+    return [1 / (rank + 1) ** skew for rank in range(count)]
+
+
+def share_out(total, weights):
+    """Split a total into whole numbers, in proportion to these weights."""
+    whole = sum(weights)
+    return [round(total * weight / whole) for weight in weights]
+
+
+def next_number(model):
+    """Return a number above the primary key of every row of a model."""
+    return (model.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+
+
+def insert(model, objects):
+    """Write the objects in batches, without building them all at once.
+
+    Returns the objects written, with their primary keys.
+    """
+    objects = iter(objects)
+    written = []
+    while batch := list(islice(objects, CHUNK_SIZE)):
+        written += model.objects.bulk_create(batch)
+    return written
+
+
+def sentence(rng, words=12):
+    """Return a sentence of random words."""
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_body(rng):
+    """Return the HTML body of a post, with headings and a code snippet."""
+    parts = []
+    for _ in range(rng.randint(2, 5)):
+        parts.append(f"<h2>{sentence(rng, 4)}</h2>")
+        for _ in range(rng.randint(2, 4)):
+            sentences = " ".join(sentence(rng) for _ in range(5))
+            parts.append(f"<p>{sentences}</p>")
+    parts.append(
+        '<pre><code class="language-python">print("hello")</code></pre>'
+    )
+    return "".join(parts)
+
+
+def random_time(rng, start, end):
+    """Return a time between these two."""
+    return start + (end - start) * rng.random()
+
+
+def make_comment(rng, post, users, now):
+    """Return a comment on a post, by a guest or one of these users."""
+    created_at = random_time(rng, post.created_at, now)
+    comment = Comment(
+        related_post_id=post.pk,
+        body=f"<p>{sentence(rng, 15)}</p>",
+        created_at=created_at,
+        updated_at=created_at,
+    )
+    if rng.random() < 0.5:
+        comment.created_by_user_id = rng.choice(users).pk
+    else:
+        comment.created_by_guest = f"guest{rng.randint(1, 500)}"
+    return comment
+
+
+def make_hit(rng, hitcount, post, now):
+    """Return a hit on a post, from a random visitor."""
+    return Hit(
+        hitcount_id=hitcount.pk,
+        ip="10." + ".".join(str(rng.randint(1, 254)) for _ in range(3)),
+        session=f"{rng.getrandbits(128):032x}",
+        user_agent=rng.choice(USER_AGENTS),
+        created=random_time(rng, post.created_at, now),
+    )
+
+
+def make_vote(rng, post, vote, token, now):
+    """Return a vote on a post, by the visitor with this token."""
+    created_at = random_time(rng, post.created_at, now)
+    return get_vote_model()(
+        content_type=ContentType.objects.get_for_model(post),
+        object_id=post.pk,
+        token=token,
+        vote=vote,
+        created_at=created_at,
+        updated_at=created_at,
+    )
+
+
+def seed_corpus(
+    posts=500,
+    tags=50,
+    users=10,
+    comments=5,
+    tags_per_post=4,
+    hits=20,
+    votes=0.05,
+    drafts=0.05,
+    tag_skew=1.0,
+    comment_skew=0.8,
+    hit_skew=1.1,
+    seed=0,
+):
+    """Add a corpus of posts, with their tags, comments, hits and votes.
+
+    'comments' and 'hits' are the average number per published post, shared
+    out by popularity, and 'votes' the number of votes per hit. Each post has
+    1 to 'tags_per_post' tags and 'drafts' of the posts are drafts, which get
+    no comments, hits or votes. There is a post every 90 minutes up to now, and
+    each comment, hit and vote is at a random time after its post.
+    Returns {"users": [...], "posts": [...], "tags": [...]} of the new rows,
+    with the number of comments, hits and votes.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    # numbers to make this run's usernames, titles and tag names unique.
+    first_user, first_post, first_tag = map(next_number, (User, Blog, Tag))
+    content_type = ContentType.objects.get_for_model(Blog)
+
+    # the comments, hits and votes of each post, by its rank of popularity.
+    published = [rng.random() >= drafts for _ in range(posts)]
+    ranks = list(range(sum(published)))
+    rng.shuffle(ranks)
+    hit_shares = share_out(
+        len(ranks) * hits, zipf_weights(len(ranks), hit_skew)
+    )
+    comment_shares = share_out(
+        len(ranks) * comments, zipf_weights(len(ranks), comment_skew)
+    )
+    post_hits, post_comments = [], []
+    live_ranks = iter(ranks)
+    for is_published in published:
+        rank = next(live_ranks) if is_published else None
+        post_hits.append(hit_shares[rank] if is_published else 0)
+        post_comments.append(comment_shares[rank] if is_published else 0)
+    post_votes = [
+        [1 if rng.random() < 0.9 else -1 for _ in range(round(count * votes))]
+        for count in post_hits
+    ]
+
+    with transaction.atomic(), original_timestamps():
+        new_users = insert(
+            User,
+            (
+                User(username=f"seed-{first_user + number}", password="!")
+                for number in range(users)
+            ),
+        )
+        insert(Profile, (Profile(user=user, author=True) for user in new_users))
+        names = [
+            f"{rng.choice(WORDS)[:8]}{first_tag + number}"
+            for number in range(tags)
+        ]
+        new_tags = insert(
+            Tag,
+            (
+                Tag(
+                    tag_name=name,
+                    slug=slugify(name),
+                    tag_creator=rng.choice(new_users),
+                )
+                for name in names
+            ),
+        )
+        bodies = [
+            (body, render_body(body))
+            for body in (make_body(rng) for _ in range(BODY_COUNT))
+        ]
+
+        new_posts = []
+        for number in range(posts):
+            title = f"{sentence(rng, 3)[:-1]} {first_post + number}"
+            body, rendered_body = rng.choice(bodies)
+            created_at = now - timedelta(minutes=(posts - number) * 90)
+            new_posts.append(
+                Blog(
+                    user=rng.choice(new_users),
+                    title=title,
+                    slug=slugify(title),
+                    desc=sentence(rng, 20),
+                    body=body,
+                    rendered_body=rendered_body,
+                    draft=not published[number],
+                    created_at=created_at,
+                    updated_at=created_at,
+                    comment_count=post_comments[number],
+                    view_count=post_hits[number],
+                    vote_count=sum(post_votes[number]),
+                )
+            )
+        new_posts = insert(Blog, new_posts)
+
+        tag_weights = zipf_weights(len(new_tags), tag_skew)
+        insert(
+            Tag.posts.through,
+            (
+                Tag.posts.through(tag_id=tag.pk, blog_id=post.pk)
+                for post in new_posts
+                for tag in set(
+                    rng.choices(
+                        new_tags, tag_weights, k=rng.randint(1, tags_per_post)
+                    )
+                )
+            ),
+        )
+        insert(
+            Comment,
+            (
+                make_comment(rng, post, new_users, now)
+                for post, count in zip(new_posts, post_comments)
+                for _ in range(count)
+            ),
+        )
+        hitcounts = insert(
+            get_hitcount_model(),
+            (
+                get_hitcount_model()(
+                    content_type=content_type,
+                    object_pk=post.pk,
+                    hits=count,
+                    modified=now,
+                )
+                for post, count in zip(new_posts, post_hits)
+                if count
+            ),
+        )
+        viewed = [
+            (post, count) for post, count in zip(new_posts, post_hits) if count
+        ]
+        insert(
+            Hit,
+            (
+                make_hit(rng, hitcount, post, now)
+                for hitcount, (post, count) in zip(hitcounts, viewed)
+                for _ in range(count)
+            ),
+        )
+        insert(
+            get_vote_model(),
+            (
+                make_vote(rng, post, vote, f"seed-{post.pk}-{number}", now)
+                for post, votes_on_post in zip(new_posts, post_votes)
+                for number, vote in enumerate(votes_on_post)
+            ),
+        )
+        update_search_vectors(
+            Blog.objects.filter(pk__in=[post.pk for post in new_posts])
+        )
+
+    # the pages would otherwise show no related or popular posts.
+    build_related_posts()
+    refresh_popularity(full=True)
+    purge_caches()
+    return {
+        "users": new_users,
+        "posts": new_posts,
+        "tags": new_tags,
+        "comments": sum(post_comments),
+        "hits": sum(post_hits),
+        "votes": sum(len(post) for post in post_votes),
+    }
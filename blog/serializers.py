@@ -0,0 +1,199 @@
+"""Serializers for the read API (see views/api_views.py)."""
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import serializers
+
+from blog.models import Blog, Comment, Tag
+
+
+def requested_fields(request):
+    """Return the set of fields asked for with '?fields=', or None for all."""
+    fields = request.query_params.get("fields", "") if request else ""
+    wanted = {name.strip() for name in fields.split(",") if name.strip()}
+    return wanted or None
+
+
+class SparseFieldsMixin:
+    """Only serialize the fields listed in the 'fields' query parameter.
+
+    This only applies to the top-level serializer, nested ones are left whole.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Drop the fields that were not asked for."""
+        super().__init__(*args, **kwargs)
+        wanted = requested_fields(self.context.get("request"))
+        if wanted is not None:
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class AbsoluteURLField(serializers.Field):
+    """The full URL of an object's HTML page."""
+
+    def __init__(self, **kwargs):
+        """Make the field read only, and read it from the whole object."""
+        super().__init__(source="*", read_only=True, **kwargs)
+
+    def to_representation(self, value):
+        """Return the URL, absolute if the request is known."""
+        url = self.get_url(value)
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+    def get_url(self, value):
+        """Return the path of the object's page."""
+        return value.get_absolute_url()
+
+
+class TagURLField(AbsoluteURLField):
+    """The full URL of a tag's page."""
+
+    def get_url(self, value):
+        """Return the path of the tag's page."""
+        return reverse("blog:tag_detail", args=[value.slug])
+
+
+class AuthorURLField(AbsoluteURLField):
+    """The full URL of an author's profile page."""
+
+    def get_url(self, value):
+        """Return the path of the author's profile page."""
+        return reverse("user-profile", args=[value.pk])
+
+
+class PostAuthorSerializer(serializers.ModelSerializer):
+    """The author of a post, as shown with the post."""
+
+    url = AuthorURLField()
+
+    class Meta:
+        """Meta configuration for the serializer."""
+
+        model = User
+        fields = ["id", "username", "url"]
+
+
+class PostTagSerializer(serializers.ModelSerializer):
+    """A tag, as shown with a post."""
+
+    name = serializers.CharField(source="tag_name")
+    url = TagURLField()
+
+    class Meta:
+        """Meta configuration for the serializer."""
+
+        model = Tag
+        fields = ["name", "slug", "url"]
+
+
+class PostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """A post in a list of posts, without its body."""
+
+    url = AbsoluteURLField()
+    author = PostAuthorSerializer(source="user")
+    tags = PostTagSerializer(source="tag_set", many=True)
+
+    class Meta:
+        """Meta configuration for the serializer."""
+
+        model = Blog
+        fields = [
+            "slug",
+            "title",
+            "desc",
+            "url",
+            "author",
+            "tags",
+            "image",
+            "image_sizes",
+            "created_at",
+            "updated_at",
+            "comment_count",
+            "view_count",
+            "vote_count",
+        ]
+
+
+class PostDetailSerializer(PostSerializer):
+    """A single post, with its body rendered to HTML."""
+
+    body = serializers.CharField(source="rendered_body")
+
+    class Meta(PostSerializer.Meta):
+        """Meta configuration for the serializer."""
+
+        fields = PostSerializer.Meta.fields + [
+            "body",
+            "image_attrib_name",
+            "image_attrib_name_link",
+            "image_attrib_site",
+            "image_attrib_site_link",
+        ]
+
+
+class TagSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """A tag, with the number of published posts that have it."""
+
+    name = serializers.CharField(source="tag_name")
+    url = TagURLField()
+    post_count = serializers.IntegerField()
+
+    class Meta:
+        """Meta configuration for the serializer."""
+
+        model = Tag
+        fields = ["name", "slug", "url", "post_count"]
+
+
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """A comment on a post, without the guest's email address."""
+
+    author = serializers.CharField(source="get_commenter")
+    user = serializers.PrimaryKeyRelatedField(
+        source="created_by_user", read_only=True
+    )
+
+    class Meta:
+        """Meta configuration for the serializer."""
+
+        model = Comment
+        fields = ["id", "author", "user", "body", "created_at", "updated_at"]
+
+
+class AuthorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """An author's public profile, with their number of published posts."""
+
+    url = AuthorURLField()
+    image = serializers.ImageField(source="profile.image")
+    image_sizes = serializers.JSONField(source="profile.image_sizes")
+    location = serializers.CharField(source="profile.location")
+    bio = serializers.CharField(source="profile.bio")
+    website = serializers.URLField(source="profile.website")
+    github_user = serializers.CharField(source="profile.github_user")
+    twitter_user = serializers.CharField(source="profile.twitter_user")
+    linkedin_user = serializers.CharField(source="profile.linkedin_user")
+    facebook_user = serializers.CharField(source="profile.facebook_user")
+    youtube_user = serializers.CharField(source="profile.youtube_user")
+    post_count = serializers.IntegerField()
+
+    class Meta:
+        """Meta configuration for the serializer."""
+
+        model = User
+        fields = [
+            "id",
+            "username",
+            "url",
+            "image",
+            "image_sizes",
+            "location",
+            "bio",
+            "website",
+            "github_user",
+            "twitter_user",
+            "linkedin_user",
+            "facebook_user",
+            "youtube_user",
+            "post_count",
+        ]
@@ -0,0 +1,328 @@
+"""Signals for the Blog App."""
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from hitcount.models import Hit
+from hitcount.signals import delete_hit_count
+from hitcount.utils import get_hitcount_model
+from preferences.cache import invalidate_preferences
+from secretballot.utils import get_vote_model
+
+from blog.cache import bump_version
+from blog.models import (
+    Blog,
+    Comment,
+    PostPopularity,
+    Redirect,
+    RelatedPost,
+    SitePreferences,
+    Tag,
+)
+from blog.pagecache import purge_all_pages, purge_post_pages
+from blog.related import queue_related_update
+from blog.search import update_search_vectors
+from users.models import Profile
+
+HitCount = get_hitcount_model()
+Vote = get_vote_model()
+
+# changing any of these affects pages other than the post's own (the sidebar
+# lists every post by title), so they purge the whole page cache.
+LISTED_FIELDS = ("title", "slug", "draft", "created_at")
+
+
+def is_blog(content_type_id):
+    """Return True if this content type is the Blog model."""
+    return content_type_id == ContentType.objects.get_for_model(Blog).id
+
+
+@receiver(post_save, sender=Blog)
+def refresh_pinned_post(sender, instance, **kwargs):
+    """Drop the cached preferences, they may hold a stale pinned post."""
+    invalidate_preferences()
+
+
+@receiver(post_save, sender=Blog)
+@receiver(post_delete, sender=Blog)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Tag.posts.through)
+def refresh_sidebar(sender, **kwargs):
+    """Invalidate the cached sidebar when its posts or tags change.
+
+    Hits don't, as every view would: the popular posts are re-ranked by
+    refresh_popularity, which invalidates it (see popularity.py).
+    """
+    bump_version("sidebar")
+
+
+@receiver(post_save, sender=Blog)
+@receiver(post_delete, sender=Blog)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Tag.posts.through)
+def refresh_search(sender, **kwargs):
+    """Invalidate the in-memory search index when posts or tags change."""
+    bump_version("search")
+
+
+@receiver(post_save, sender=Blog)
+@receiver(post_delete, sender=Blog)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Tag.posts.through)
+def refresh_feeds(sender, **kwargs):
+    """Invalidate the cached feeds when posts or tags change."""
+    bump_version("feeds")
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, update_fields=None, **kwargs):
+    """Keep the saved username of a user, to see if it changed.
+
+    A save that can't change it, such as the last_login saved by every login,
+    costs no query.
+    """
+    instance.username_before = (
+        User.objects.filter(pk=instance.pk)
+        .values_list("username", flat=True)
+        .first()
+        if instance.pk
+        and (update_fields is None or "username" in update_fields)
+        else None
+    )
+
+
+@receiver(post_save, sender=User)
+def refresh_author_feeds(sender, instance, **kwargs):
+    """Invalidate the cached feeds when an author is renamed.
+
+    The username is all the feeds show of a user.
+    """
+    before = getattr(instance, "username_before", None)
+    if before is not None and before != instance.username:
+        bump_version("feeds")
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def refresh_api(sender, **kwargs):
+    """Invalidate the cached API responses when an author or profile changes."""
+    bump_version("api")
+
+
+@receiver(post_save, sender=Blog)
+@receiver(post_delete, sender=Blog)
+@receiver(post_save, sender=Redirect)
+@receiver(post_delete, sender=Redirect)
+def refresh_redirects(sender, **kwargs):
+    """Invalidate the in-memory redirect map when posts or redirects change."""
+    bump_version("redirects")
+
+
+@receiver(post_save, sender=Blog)
+def index_post(sender, instance, **kwargs):
+    """Update the stored search vector of a saved post."""
+    update_search_vectors(Blog.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Tag)
+def index_tag_posts(sender, instance, **kwargs):
+    """Update the search vectors of every post with this (renamed) tag."""
+    update_search_vectors(instance.posts.all())
+
+
+@receiver(m2m_changed, sender=Tag.posts.through)
+def index_tagged_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    """Update the search vectors of posts whose tags were changed."""
+    if reverse:
+        # the tags of a single post were changed.
+        if action in ("post_add", "post_remove", "post_clear"):
+            update_search_vectors(Blog.objects.filter(pk=instance.pk))
+    elif action == "pre_clear":
+        # pk_set is not sent on a clear, so remember the posts beforehand.
+        instance.cleared_post_ids = list(
+            instance.posts.values_list("pk", flat=True)
+        )
+    elif action == "post_clear":
+        update_search_vectors(
+            Blog.objects.filter(pk__in=instance.cleared_post_ids)
+        )
+    elif action in ("post_add", "post_remove"):
+        update_search_vectors(Blog.objects.filter(pk__in=pk_set))
+
+
+@receiver(m2m_changed, sender=Tag.posts.through)
+def relate_tagged_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    """Queue the posts whose tags were changed, for their related posts."""
+    if reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            queue_related_update([instance.pk])
+    elif action == "post_clear":
+        # remembered on the pre_clear, by index_tagged_posts.
+        queue_related_update(instance.cleared_post_ids)
+    elif action in ("post_add", "post_remove"):
+        queue_related_update(pk_set)
+
+
+@receiver(post_save, sender=Blog)
+def relate_published_post(sender, instance, created, **kwargs):
+    """Queue a post that was published or unpublished, for related posts.
+
+    A new post has no tags yet, it is queued when they are added.
+    """
+    before = getattr(instance, "listed_before", None)
+    if before is not None and before["draft"] != instance.draft:
+        queue_related_update([instance.pk])
+
+
+@receiver(post_save, sender=Blog)
+def unrank_draft(sender, instance, **kwargs):
+    """Drop the popularity of a post that was unpublished."""
+    before = getattr(instance, "listed_before", None)
+    if instance.draft and before is not None and not before["draft"]:
+        PostPopularity.objects.filter(post=instance).delete()
+
+
+@receiver(pre_delete, sender=Blog)
+def relate_deleted_post(sender, instance, **kwargs):
+    """Queue the posts that list a deleted post, for their related posts."""
+    queue_related_update(
+        RelatedPost.objects.filter(related=instance).values_list(
+            "post_id", flat=True
+        )
+    )
+
+
+# The below receivers keep the denormalized counters on the Blog model up to
+# date. Each is a single atomic UPDATE, any drift can be fixed with the
+# 'resync_counters' management command.
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    """Increment the comment count of the post."""
+    if created:
+        Blog.objects.filter(pk=instance.related_post_id).update(
+            comment_count=F("comment_count") + 1
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    """Decrement the comment count of the post."""
+    Blog.objects.filter(
+        pk=instance.related_post_id, comment_count__gt=0
+    ).update(comment_count=F("comment_count") - 1)
+
+
+@receiver(post_save, sender=Hit)
+def count_new_hit(sender, instance, created, **kwargs):
+    """Increment the view count of the post."""
+    hitcount = instance.hitcount
+    if created and is_blog(hitcount.content_type_id):
+        Blog.objects.filter(pk=hitcount.object_pk).update(
+            view_count=F("view_count") + 1
+        )
+
+
+@receiver(delete_hit_count)
+def count_deleted_hit(sender, instance, save_hitcount=False, **kwargs):
+    """Decrement the view count of the post, unless the hit is preserved."""
+    hitcount = instance.hitcount
+    if not save_hitcount and is_blog(hitcount.content_type_id):
+        Blog.objects.filter(pk=hitcount.object_pk, view_count__gt=0).update(
+            view_count=F("view_count") - 1
+        )
+
+
+@receiver(post_delete, sender=HitCount)
+def reset_view_count(sender, instance, **kwargs):
+    """Zero the view count of the post when its hit count is removed."""
+    if is_blog(instance.content_type_id):
+        Blog.objects.filter(pk=instance.object_pk).update(view_count=0)
+
+
+@receiver(post_save, sender=Vote)
+def count_vote(sender, instance, created, **kwargs):
+    """Add a new vote to the post, or recount it if a vote was changed."""
+    if not is_blog(instance.content_type_id):
+        return
+    posts = Blog.objects.filter(pk=instance.object_id)
+    if created:
+        posts.update(vote_count=F("vote_count") + instance.vote)
+    else:
+        posts.resync_counters()
+
+
+@receiver(post_delete, sender=Vote)
+def count_deleted_vote(sender, instance, **kwargs):
+    """Remove a deleted vote from the post."""
+    if is_blog(instance.content_type_id):
+        Blog.objects.filter(pk=instance.object_id).update(
+            vote_count=F("vote_count") - instance.vote
+        )
+
+
+@receiver(pre_save, sender=Blog)
+def remember_listed_fields(sender, instance, **kwargs):
+    """Keep the saved values of the listed fields, to see what changed."""
+    instance.listed_before = (
+        Blog.objects.filter(pk=instance.pk).values(*LISTED_FIELDS).first()
+        if instance.pk
+        else None
+    )
+
+
+@receiver(post_save, sender=Blog)
+def purge_saved_post(sender, instance, created, **kwargs):
+    """Purge the cached pages showing a saved post.
+
+    A new, published, renamed or re-dated post purges every page.
+    """
+    before = getattr(instance, "listed_before", None)
+    if created or before is None:
+        purge_all_pages()
+    elif any(before[field] != getattr(instance, field) for field in before):
+        purge_all_pages()
+    else:
+        purge_post_pages(instance)
+
+
+@receiver(post_delete, sender=Blog)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Tag.posts.through)
+@receiver(post_save, sender=SitePreferences)
+@receiver(post_delete, sender=SitePreferences)
+def purge_every_page(sender, **kwargs):
+    """Purge every cached page, they all show the sidebar and preferences."""
+    purge_all_pages()
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def purge_commented_post(sender, instance, **kwargs):
+    """Purge the cached pages showing the post's comment count."""
+    # the post may already be gone, if the comment is deleted along with it.
+    post = Blog.objects.filter(pk=instance.related_post_id).first()
+    if post is not None:
+        purge_post_pages(post)
+
+
+@receiver(post_save, sender=Vote)
+@receiver(post_delete, sender=Vote)
+def purge_voted_post(sender, instance, **kwargs):
+    """Purge the cached pages showing the post's likes."""
+    if is_blog(instance.content_type_id):
+        post = Blog.objects.filter(pk=instance.object_id).first()
+        if post is not None:
+            purge_post_pages(post)
@@ -1,8 +1,18 @@
-"""Create the sitemap.xml file."""
+"""Create the sitemap.xml file.
+
+The sitemap is an index of sections. The posts are split into sections of
+BlogSitemap.limit posts by primary key, so a post always stays in the same
+section and publishing, editing or deleting a post only changes its own
+section. The lastmod of every post section comes from a single aggregate
+query, and is part of the cache key of the section, so each section is cached
+until a post in it changes. See views/sitemap_views.py for the XML.
+"""
+from django.contrib.auth.models import User
 from django.contrib.sitemaps import Sitemap
+from django.db.models import Count, F, Max, Q
 from django.urls.base import reverse
 
-from blog.models import Blog
+from blog.models import Blog, Tag
 
 
 class StaticSiteMap(Sitemap):
@@ -21,19 +31,112 @@ class StaticSiteMap(Sitemap):
 
 
 class BlogSitemap(Sitemap):
-    """Create the sitemap.xml file."""
+    """List one section of the published blog posts.
+
+    The items are (slug, updated_at) tuples, rather than Blog objects.
+    """
 
     changefreq = "weekly"
     priority = 0.5
+    limit = 1000
+
+    def __init__(self, section=0):
+        """Store which section of the posts to list."""
+        self.section = section
+
+    @classmethod
+    def sections(cls, section=None):
+        """Return {section: (lastmod, post count)} for the published posts.
+
+        Only sections with a published post are included. This is a single
+        aggregate query, it can be limited to one section.
+        """
+        posts = Blog.objects.filter(draft=False)
+        if section is not None:
+            posts = posts.filter(
+                pk__gt=section * cls.limit, pk__lte=(section + 1) * cls.limit
+            )
+        rows = (
+            posts.order_by()
+            .annotate(section=(F("pk") - 1) / cls.limit)
+            .values("section")
+            .annotate(lastmod=Max("updated_at"), count=Count("pk"))
+        )
+        return {row["section"]: (row["lastmod"], row["count"]) for row in rows}
 
     def items(self):
-        """Return all blog posts."""
-        return Blog.objects.filter(draft=False)
+        """Return the published posts in this section."""
+        return (
+            Blog.objects.filter(
+                draft=False,
+                pk__gt=self.section * self.limit,
+                pk__lte=(self.section + 1) * self.limit,
+            )
+            .order_by("pk")
+            .values_list("slug", "updated_at")
+            .iterator()
+        )
 
-    def lastmod(self, obj):
+    def lastmod(self, item):
         """Return the last modified date."""
-        return obj.updated_at
+        return item[1]
 
-    def location(self, obj):
+    def location(self, item):
         """Return the location of the blog post."""
-        return obj.get_absolute_url()
+        return reverse("blog:detail", args=[item[0]])
+
+
+class TagSitemap(Sitemap):
+    """List the tags with published posts."""
+
+    changefreq = "weekly"
+    priority = 0.3
+
+    def items(self):
+        """Return (slug, lastmod) for each tag, from its latest post."""
+        return (
+            Tag.objects.annotate(
+                lastmod=Max("posts__updated_at", filter=Q(posts__draft=False))
+            )
+            .filter(lastmod__isnull=False)
+            .order_by("slug")
+            .values_list("slug", "lastmod")
+            .iterator()
+        )
+
+    def lastmod(self, item):
+        """Return the last time a post with this tag changed."""
+        return item[1]
+
+    def location(self, item):
+        """Return the location of the tag page."""
+        return reverse("blog:tag_detail", args=[item[0]])
+
+
+class AuthorSitemap(Sitemap):
+    """List the profile pages of the users with published posts."""
+
+    changefreq = "weekly"
+    priority = 0.3
+
+    def items(self):
+        """Return (user id, lastmod) for each author, from their latest post."""
+        return (
+            User.objects.annotate(
+                lastmod=Max(
+                    "blog_posts__updated_at", filter=Q(blog_posts__draft=False)
+                )
+            )
+            .filter(lastmod__isnull=False)
+            .order_by("pk")
+            .values_list("pk", "lastmod")
+            .iterator()
+        )
+
+    def lastmod(self, item):
+        """Return the last time a post by this author changed."""
+        return item[1]
+
+    def location(self, item):
+        """Return the location of the profile page."""
+        return reverse("user-profile", args=[item[0]])
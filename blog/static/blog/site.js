@@ -5,3 +5,28 @@ let attr = document.querySelector(".django-ckeditor-widget");
 if (attr) {
   attr.removeAttribute("style");
 }
+
+// load the comments of a post after the article, and each further page of
+// them in place of the 'More comments' button.
+function loadComments(list, url) {
+  fetch(url)
+    .then((response) => response.text())
+    .then((html) => {
+      list.querySelectorAll("noscript, .blog_comment_more").forEach((node) => {
+        node.remove();
+      });
+      list.insertAdjacentHTML("beforeend", html);
+    });
+}
+
+let commentList = document.querySelector(".blog_comment_list");
+if (commentList) {
+  loadComments(commentList, commentList.dataset.url);
+  commentList.addEventListener("click", (event) => {
+    let more = event.target.closest("[data-comments-more]");
+    if (more) {
+      event.preventDefault();
+      loadComments(commentList, more.href);
+    }
+  });
+}
@@ -0,0 +1,65 @@
+"""Turn the comma separated tags typed into the post forms into Tag objects.
+
+The names are looked up in one query, any missing tags are created in one
+bulk insert, and the post's tags are then replaced by Django's set(), which
+only adds and removes the tags that changed. A tag created at the same time by
+another request is skipped by the insert (the tag name and slug are unique)
+and found again by the second lookup, so concurrent edits can't fail or make
+duplicate tags.
+"""
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.template.defaultfilters import slugify
+
+from blog.models import Tag
+
+
+def parse_tag_names(text):
+    """Return the tag names in a comma separated string.
+
+    Names are stripped, lower case and truncated to fit. Repeated names, and
+    names with nothing to make a slug from, are dropped.
+    """
+    max_length = Tag._meta.get_field("tag_name").max_length
+    names = (
+        name.strip().lower()[:max_length].strip() for name in text.split(",")
+    )
+    return list(dict.fromkeys(name for name in names if slugify(name)))
+
+
+def find_tags(names):
+    """Return {name: Tag} for the existing tags with these names.
+
+    Names are matched case-insensitively, or by slug, as two names (such as
+    'c++' and 'c') can share a slug.
+    """
+    slugs = {slugify(name): name for name in names}
+    found = {}
+    for tag in Tag.objects.annotate(name=Lower("tag_name")).filter(
+        Q(name__in=names) | Q(slug__in=slugs)
+    ):
+        found.setdefault(tag.name, tag)
+        if tag.slug in slugs:
+            found.setdefault(slugs[tag.slug], tag)
+    return {name: found[name] for name in names if name in found}
+
+
+def resolve_tags(names, creator):
+    """Return the Tag for each name, creating the missing tags in bulk."""
+    tags = find_tags(names)
+    missing = [name for name in names if name not in tags]
+    if missing:
+        Tag.objects.bulk_create(
+            [
+                Tag(tag_name=name, slug=slugify(name), tag_creator=creator)
+                for name in missing
+            ],
+            ignore_conflicts=True,
+        )
+        tags = find_tags(names)
+    return list(dict.fromkeys(tags[name] for name in names if name in tags))
+
+
+def set_post_tags(post, text, creator):
+    """Replace the tags of a post with those in a comma separated string."""
+    post.tag_set.set(resolve_tags(parse_tag_names(text), creator))
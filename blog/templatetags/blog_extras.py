@@ -1,12 +1,23 @@
 """Several custom Template tags to make things easier."""
 from django import template
-from django.db.models import Q
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
 from django.db.models.functions import Lower
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 
-from blog.models import Blog, Tag
+from blog.cache import versioned_key
+from blog.models import Blog, PostPopularity, Tag
+from blog.rendering import render_body
+from myblog.images import IMAGE_KINDS, placeholder_sizes
 
 register = template.Library()
 
+# the posts and tags are invalidated by signals, but the popular posts are not
+# (a view would invalidate them), so they are only this many seconds stale.
+SIDEBAR_TIMEOUT = 5 * 60
+
 
 @register.filter()
 def no_draft(tag_posts, user=None):
@@ -21,47 +32,135 @@ def no_draft(tag_posts, user=None):
     return filtered
 
 
+@register.filter()
+def post_body(post):
+    """Return the rendered body of a post, safe to show as it is.
+
+    A post saved before bodies were rendered (and not yet backfilled by the
+    render_posts command) is rendered, and so sanitized, on each view.
+    """
+    return mark_safe(post.rendered_body or render_body(post.body))
+
+
 @register.filter()
 def by_hits(posts):
-    """Sort the posts Queryset by hits."""
+    """Sort the posts Queryset by their decayed popularity, see popularity.py.
+
+    Posts that have not been scored yet come last, newest first.
+    """
     return posts.order_by(
-        "-hit_count_generic__hits", "-total_upvotes", "-created_at"
+        F("popularity__score").desc(nulls_last=True), "-created_at"
     )
 
 
 # the below tag is used in the sidebar to pass extra context that is needed to
-# get the sidebar to work.
-@register.simple_tag
-def sidebar():
+# get the sidebar to work. The result is memoized on the request and cached
+# across requests until a signal bumps the 'sidebar' version (see signals.py),
+# or refresh_popularity re-ranks the popular posts, or it times out.
+@register.simple_tag(takes_context=True)
+def sidebar(context):
     """Provide extra information needed for the sidebar."""
+    request = context.get("request")
+    if request is not None and hasattr(request, "sidebar_context"):
+        return request.sidebar_context
+
+    key = versioned_key("sidebar")
+    sidebar_context = cache.get(key)
+    if sidebar_context is None:
+        sidebar_context = build_sidebar_context()
+        cache.set(key, sidebar_context, SIDEBAR_TIMEOUT)
+
+    if request is not None:
+        request.sidebar_context = sidebar_context
+    return sidebar_context
+
+
+def build_sidebar_context():
+    """Query the sidebar data, as plain values that can be cached."""
     context = {}
 
     # Return first 5 posts in the database.
-    context["posts"] = (
-        Blog.objects.all().exclude(draft=True).order_by("-created_at")[:6]
+    context["posts"] = list(
+        Blog.objects.all()
+        .exclude(draft=True)
+        .order_by("-created_at")
+        .values("slug", "title")[:6]
     )
 
     # Return all Tags.
     # will later most likely restrict tags to the top 20 or so tags sorted by
     # number of related posts, for now send all.
-    context["tags"] = Tag.objects.all().order_by(Lower("tag_name"))
+    context["tags"] = list(
+        Tag.objects.all().order_by(Lower("tag_name")).values("slug", "tag_name")
+    )
 
-    # set a filtered context for popular posts, sorted by views then likes.
-    popular_posts = (
-        Blog.objects.all()
-        .exclude(
-            Q(draft=True)
-            | Q(hit_count_generic__hits=0)
-            | Q(hit_count_generic__hits=None)
-        )
-        .order_by("-hit_count_generic__hits", "-total_upvotes", "-created_at")[
-            :6
-        ]
+    # set a filtered context for popular posts, by their recent hits and likes
+    # (see popularity.py), read in order from blog_popularity_score_idx.
+    context["popular"] = list(
+        PostPopularity.objects.order_by("-score").values(
+            slug=F("post__slug"), title=F("post__title")
+        )[:6]
     )
-    context["popular"] = popular_posts
+    if not context["popular"]:
+        # nothing has been scored yet, so fall back on the all-time totals.
+        context["popular"] = list(
+            Blog.objects.filter(draft=False, view_count__gt=0)
+            .by_popularity()
+            .values("slug", "title")[:6]
+        )
 
     #  empty each context (for troubleshooting)
     # context["posts"] = ()
     # context["tags"] = ()
     # context["popular"] = ()
     return context
+
+
+@register.simple_tag
+def responsive_image(image, image_sizes, kind, sizes, **attrs):
+    """Return a <picture> of an image, using its resized copies.
+
+    The WebP copies are offered first, with the JPEG copies as the fallback.
+    If there is no image the placeholder for this kind is used, and an image
+    without resized copies (yet) is shown as it is. Any other keyword
+    arguments are added to the <img> tag, 'css_class' as its class.
+    """
+    storage = image.storage if image else default_storage
+    if not image:
+        image_sizes = placeholder_sizes(kind)
+    attrs.setdefault("loading", "lazy")
+    attrs["class"] = attrs.pop("css_class", "")
+    img_attrs = format_html(
+        " ".join(f'{name}="{{}}"' for name in attrs), *attrs.values()
+    )
+    if not image_sizes:
+        src = (
+            image.url
+            if image
+            else storage.url(IMAGE_KINDS[kind]["placeholder"])
+        )
+        return format_html('<img src="{}" {}>', src, img_attrs)
+
+    sources = image_sizes["sources"]
+    largest = sources[-1]
+
+    def srcset(extension):
+        """Return the srcset of the copies in this format."""
+        return ", ".join(
+            f"{storage.url(source[extension])} {source['width']}w"
+            for source in sources
+        )
+
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" '
+        'decoding="async" {}></picture>',
+        srcset("webp"),
+        sizes,
+        storage.url(largest["jpg"]),
+        srcset("jpg"),
+        sizes,
+        largest["width"],
+        largest["height"],
+        img_attrs,
+    )
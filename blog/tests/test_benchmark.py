@@ -0,0 +1,37 @@
+"""Benchmarks of the main pages, against a seeded corpus.
+
+Set BENCHMARK_OUTPUT to a file name to keep the JSON results, and
+BENCHMARK_POSTS / BENCHMARK_ROUNDS for a bigger run, for example :
+
+    BENCHMARK_POSTS=5000 BENCHMARK_ROUNDS=50 BENCHMARK_OUTPUT=after.json \
+        pytest blog/tests/test_benchmark.py
+
+Each page must stay within its budget in settings.QUERY_BUDGETS, the same one
+that logs a warning in production (see myblog/timing.py), so a new N+1 fails
+the run.
+"""
+import os
+from urllib.parse import urlsplit
+
+import pytest
+from django.urls import resolve
+
+from blog.benchmark import BENCHMARK_PAGES, run_benchmarks, write_results
+from blog.seeding import seed_corpus
+from myblog.timing import query_budget
+
+
+@pytest.mark.django_db
+def test_benchmark_pages_within_query_budgets(settings):
+    """Every page works against a seeded corpus, within its query budget."""
+    seed_corpus(posts=int(os.getenv("BENCHMARK_POSTS", 300)), tags=40)
+    results = run_benchmarks(rounds=int(os.getenv("BENCHMARK_ROUNDS", 3)))
+    if os.getenv("BENCHMARK_OUTPUT"):
+        write_results(results, os.getenv("BENCHMARK_OUTPUT"))
+
+    assert list(results["pages"]) == list(BENCHMARK_PAGES)
+    for name, page in results["pages"].items():
+        assert page["status"] == 200, name
+        budget = query_budget(resolve(urlsplit(page["url"]).path))
+        assert budget is not None and page["queries"] <= budget, name
+        assert page["min"] <= page["p50"] <= page["p90"] <= page["max"]
@@ -1 +1,868 @@
 """Unit tests for the Blog Model."""
+import json
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+import pytest
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from hitcount.conf import settings as hitcount_settings
+from hitcount.models import Hit
+from PIL import Image
+from preferences.cache import get_preferences, invalidate_preferences
+from secretballot.utils import get_vote_model
+
+from blog.cache import get_version
+from blog.hits import flush_hits
+from blog.models import (
+    Blog,
+    Comment,
+    PopularityRefresh,
+    Redirect,
+    RelatedPost,
+    RelatedPostUpdate,
+    SitePreferences,
+    Tag,
+)
+from blog.popularity import refresh_popularity
+from blog.rendering import render_posts
+from blog.redirects import record_rename
+from blog.search import InvertedIndexSearchBackend
+from blog.tags import set_post_tags
+from blog.templatetags.blog_extras import (
+    build_sidebar_context,
+    by_hits,
+    responsive_image,
+    sidebar,
+)
+
+
+def preference_queries(queries):
+    """Return only the captured queries that hit the preferences tables."""
+    return [q for q in queries if "preferences" in q["sql"]]
+
+
+@pytest.mark.django_db
+def test_index_preferences_cached(client, settings):
+    """The index page reads the preferences once, then from the cache."""
+    settings.PAGE_CACHE_TIMEOUT = 0
+    user = User.objects.create_user("author")
+    for i in range(6):
+        Blog.objects.create(user=user, title=f"Post {i}", desc="desc", body="")
+
+    invalidate_preferences()
+    with CaptureQueriesContext(connection) as cold:
+        client.get(reverse("blog:index"))
+    with CaptureQueriesContext(connection) as warm:
+        client.get(reverse("blog:index"))
+
+    assert preference_queries(cold)
+    assert not preference_queries(warm)
+    assert len(warm) < len(cold)
+
+
+@pytest.mark.django_db
+def test_preferences_reloaded_after_their_ttl(settings):
+    """A process reloads its preferences once they are too old."""
+    SitePreferences.singleton.get()  # saving it drops the cached copy
+    get_preferences(SitePreferences)
+    with CaptureQueriesContext(connection) as fresh:
+        get_preferences(SitePreferences)
+    settings.PREFERENCES_CACHE_TTL = 0
+    invalidate_preferences()
+    get_preferences(SitePreferences)
+    with CaptureQueriesContext(connection) as expired:
+        get_preferences(SitePreferences)
+    assert not preference_queries(fresh)
+    assert preference_queries(expired)
+
+
+@pytest.mark.django_db
+def test_index_summary_queries_constant(client, settings):
+    """Rendering more summary cards does not cost more queries."""
+    settings.PAGE_CACHE_TIMEOUT = 0
+    user = User.objects.create_user("author")
+
+    def index_queries():
+        client.get(reverse("blog:index"))  # warm the per-process caches
+        with CaptureQueriesContext(connection) as queries:
+            client.get(reverse("blog:index"))
+        return len(queries)
+
+    Blog.objects.create(user=user, title="First", desc="desc", body="")
+    one_card = index_queries()
+    for i in range(5):
+        Blog.objects.create(user=user, title=f"Post {i}", desc="desc", body="")
+    assert index_queries() == one_card
+
+
+@pytest.mark.django_db
+def test_sidebar_cached(django_assert_num_queries):
+    """The sidebar is cached until its posts or tags change, not on hits."""
+    user = User.objects.create_user("author")
+    post = Blog.objects.create(user=user, title="Post", desc="desc", body="")
+    Hit.objects.create(hitcount=post.hit_count, session="session")
+
+    first = sidebar({})
+    assert [p["slug"] for p in first["popular"]] == [post.slug]
+    with django_assert_num_queries(0):
+        assert sidebar({}) == first
+
+    Hit.objects.create(hitcount=post.hit_count, session="another")
+    with django_assert_num_queries(0):
+        assert sidebar({}) == first
+
+    Blog.objects.create(user=user, title="Another", desc="desc", body="")
+    assert len(sidebar({})["posts"]) == 2
+
+
+@pytest.mark.django_db
+def test_counters_follow_comments_and_hits():
+    """The denormalized counters are kept up to date by signals."""
+    user = User.objects.create_user("author")
+    post = Blog.objects.create(user=user, title="Post", desc="desc", body="")
+    comment = Comment.objects.create(related_post=post, body="Hello")
+    Hit.objects.create(hitcount=post.hit_count, session="session")
+    post.refresh_from_db()
+    assert (post.comment_count, post.view_count) == (1, 1)
+
+    # a stale instance must not overwrite the counters when saved.
+    stale = Blog.objects.get(pk=post.pk)
+    comment.delete()
+    Blog.objects.filter(pk=post.pk).update(view_count=10)
+    stale.save()
+    post.refresh_from_db()
+    assert (post.comment_count, post.view_count) == (0, 10)
+
+    assert Blog.objects.resync_counters() == 1
+    post.refresh_from_db()
+    assert post.view_count == 1
+
+
+@pytest.mark.django_db
+def test_search_fallback_ranks_title_tags_and_body():
+    """The in-memory search covers tags and body, ranking title hits first."""
+    user = User.objects.create_user("author")
+    in_body = Blog.objects.create(
+        user=user, title="Other", desc="desc", body="<p>About django</p>"
+    )
+    in_title = Blog.objects.create(
+        user=user, title="Django tips", desc="desc", body=""
+    )
+    tagged = Blog.objects.create(user=user, title="Tagged", desc="d", body="")
+    tag = Tag.objects.create(tag_name="python", tag_creator=user)
+    tag.posts.add(tagged)
+    Blog.objects.create(
+        user=user, title="Django draft", desc="desc", body="", draft=True
+    )
+
+    backend = InvertedIndexSearchBackend()
+    assert list(backend.search("django", AnonymousUser())) == [
+        in_title,
+        in_body,
+    ]
+    assert list(backend.search("python", AnonymousUser())) == [tagged]
+    assert backend.search("django", user).count() == 3
+
+
+@pytest.mark.django_db
+def test_buffered_hits_are_written_in_bulk(client, settings, monkeypatch):
+    """Buffered hits keep the session dedupe and are written on flush."""
+    settings.BLOG_HIT_MODE = "buffered"
+    settings.BLOG_HIT_FLUSH_INTERVAL = 3600
+    monkeypatch.setattr(hitcount_settings, "HITCOUNT_HITS_PER_SESSION_LIMIT", 1)
+    user = User.objects.create_user("author")
+    post = Blog.objects.create(user=user, title="Post", desc="desc", body="")
+
+    with CaptureQueriesContext(connection) as queries:
+        client.get(post.get_absolute_url())
+    assert not [q for q in queries if 'INTO "hitcount_hit" ' in q["sql"]]
+    client.get(post.get_absolute_url())
+
+    # a failed write keeps the hits (and their limits) for the next flush.
+    def fail(hits):
+        raise DatabaseError("down")
+
+    with monkeypatch.context() as patch:
+        patch.setattr("blog.hits.write_hits", fail)
+        with pytest.raises(DatabaseError):
+            flush_hits()
+    client.get(post.get_absolute_url())
+    assert Hit.objects.count() == 0
+
+    assert flush_hits() == 1
+    post.refresh_from_db()
+    assert post.view_count == post.hit_count.hits == 1
+    assert Hit.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_page_cache_counts_hits_and_purges_on_comment(client):
+    """Cached post pages still count hits, and a new comment purges them."""
+    user = User.objects.create_user("author")
+    post = Blog.objects.create(user=user, title="Post", desc="desc", body="")
+    url = post.get_absolute_url()
+    client.get(url)  # creates the site preferences, purging every page.
+
+    client.get(url)
+    with CaptureQueriesContext(connection) as queries:
+        cached = client.get(url, REMOTE_ADDR="10.0.0.2")
+    assert not [q for q in queries if 'FROM "blog_blog"' in q["sql"]]
+    assert Hit.objects.count() == 3
+
+    comments = reverse("blog:comments", args=[post.slug])
+    client.get(comments)
+    Comment.objects.create(related_post=post, body="A new comment")
+    assert b"<b>1</b> comment" not in cached.content
+    assert b"<b>1</b> comment" in client.get(url).content
+    assert b"A new comment" in client.get(comments).content
+
+
+@pytest.mark.django_db
+def test_cached_pages_cost_no_queries_with_the_default_cache(
+    client, django_assert_num_queries
+):
+    """With the cache in settings, a page served from it makes no queries."""
+    user = User.objects.create_user("author")
+    Blog.objects.create(user=user, title="Post", desc="desc", body="")
+    for url in (reverse("blog:index"), reverse("blog:tag_list")):
+        client.get(url)
+        client.get(url)
+        with django_assert_num_queries(0):
+            assert client.get(url).status_code == 200
+
+
+@pytest.mark.django_db
+def test_conditional_get_returns_304_until_changed(client, settings):
+    """Unchanged posts and feeds are revalidated without being rendered."""
+    settings.PAGE_CACHE_TIMEOUT = 0
+    user = User.objects.create_user("author")
+    post = Blog.objects.create(user=user, title="Post", desc="desc", body="")
+    url = post.get_absolute_url()
+    feed = reverse("latest-posts-feed")
+    client.get(url)  # creates the site preferences, changing every page.
+
+    etag = client.get(url)["ETag"]
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    assert len(queries) <= 2  # the session and the validators.
+    feed_etag = client.get(feed)["ETag"]
+    assert client.get(feed, HTTP_IF_NONE_MATCH=feed_etag).status_code == 304
+
+    Comment.objects.create(related_post=post, body="A new comment")
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+    post.title = "Renamed"
+    post.save()
+    assert client.get(feed, HTTP_IF_NONE_MATCH=feed_etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_body_rendered_on_save(client):
+    """The body is sanitized, highlighted and anchored when saved."""
+    user = User.objects.create_user("author")
+    post = Blog.objects.create(
+        user=user,
+        title="Post",
+        desc="desc",
+        body=(
+            '<h2>Setup</h2><p onclick="steal()">Hi<script>steal()</script></p>'
+            '<pre><code class="language-python">import os</code></pre>'
+            '<img src="/media/missing.png" style="width:40px; height:30px">'
+        ),
+    )
+    assert post.rendered_body == (
+        '<h2 id="setup">Setup<a aria-hidden="true" class="heading_anchor" '
+        'href="#setup">#</a></h2><p>Hi</p>'
+        '<pre class="code_block" data-language="python"><code>'
+        '<span class="token keyword">import</span> os</code></pre>'
+        '<img decoding="async" height="30" loading="lazy" '
+        'src="/media/missing.png" style="width:40px; height:30px" width="40"/>'
+    )
+
+    # a post that hasn't been rendered yet is rendered when it is shown.
+    Blog.objects.filter(pk=post.pk).update(rendered_body="")
+    page = client.get(post.get_absolute_url()).content
+    assert b'<h2 id="setup">' in page and b"steal()" not in page
+    assert render_posts(Blog.objects.all()) == 1
+    post.refresh_from_db()
+    assert post.rendered_body.startswith('<h2 id="setup">')
+
+
+@pytest.mark.django_db
+def test_header_image_resized_on_upload(settings, tmp_path):
+    """Uploaded header images get WebP and JPEG copies for their srcset."""
+    settings.MEDIA_ROOT = tmp_path
+    upload = BytesIO()
+    Image.new("RGBA", (1000, 500), "red").save(upload, "PNG")
+    user = User.objects.create_user("author")
+    post = Blog.objects.create(
+        user=user,
+        title="Post",
+        desc="desc",
+        body="",
+        image=SimpleUploadedFile("photo.png", upload.getvalue()),
+    )
+
+    post.refresh_from_db()
+    sources = post.image_sizes["sources"]
+    assert [(s["width"], s["height"]) for s in sources] == [
+        (400, 200),
+        (800, 400),
+        (1000, 500),
+    ]
+    assert (tmp_path / "posts/post/header_image-400w.webp").exists()
+    html = responsive_image(post.image, post.image_sizes, "header", "100vw")
+    assert "/media/posts/post/header_image-800w.jpg 800w" in html
+    assert 'width="1000" height="500"' in html
+
+
+@pytest.mark.django_db
+def test_sitemap_sections_cached_until_a_post_changes(client):
+    """Each sitemap section is cached until one of its posts changes."""
+    user = User.objects.create_user("author")
+    post = Blog.objects.create(user=user, title="Post", desc="desc", body="")
+    tag = Tag.objects.create(tag_name="python", tag_creator=user)
+    tag.posts.add(post)
+
+    index = b"".join(client.get(reverse("sitemap")).streaming_content)
+    for section in ("static", "tags", "authors", "posts-0"):
+        assert f"/sitemap-{section}.xml".encode() in index
+    url = reverse("sitemap-section", args=["posts-0"])
+    assert b"/post</loc>" in b"".join(client.get(url).streaming_content)
+
+    with CaptureQueriesContext(connection) as queries:
+        assert b"/post</loc>" in client.get(url).content
+    assert not [q for q in queries if '"slug"' in q["sql"]]
+
+    post.title = "Renamed"
+    post.save()
+    assert b"/renamed</loc>" in b"".join(client.get(url).streaming_content)
+    tags = reverse("sitemap-section", args=["tags"])
+    assert b"/tags/python/" in b"".join(client.get(tags).streaming_content)
+
+
+@pytest.mark.django_db
+def test_feeds_cached_until_a_post_is_published(client):
+    """The feeds are served from the cache until the posts change."""
+    user = User.objects.create_user("author")
+    post = Blog.objects.create(user=user, title="Post", desc="desc", body="")
+    tag = Tag.objects.create(tag_name="python", tag_creator=user)
+    tag.posts.add(post)
+
+    response = client.get(reverse("latest-posts-feed-json"))
+    feed = response.json()
+    assert feed["items"][0]["title"] == "Post"
+    assert feed["items"][0]["tags"] == ["python"]
+    with CaptureQueriesContext(connection) as queries:
+        cached = client.get(reverse("latest-posts-feed-json"))
+        tracked = client.get(
+            reverse("latest-posts-feed-json"), {"utm_source": "reader"}
+        )
+    assert cached.content == tracked.content == response.content
+    assert not [q for q in queries if "blog_blog" in q["sql"]]
+    not_modified = client.get(
+        reverse("latest-posts-feed-json"),
+        HTTP_IF_NONE_MATCH=response["ETag"],
+    )
+    assert not_modified.status_code == 304
+
+    Blog.objects.create(user=user, title="Newer", desc="desc", body="")
+    assert b"Newer" in client.get(reverse("latest-posts-feed-atom")).content
+    assert b"Newer" in client.get(reverse("latest-posts-feed-json")).content
+    tagged = client.get(reverse("tag-posts-feed", args=["python"])).content
+    assert b"Post" in tagged and b"Newer" not in tagged
+
+    # logging in saves the user, but only renaming them changes the feeds.
+    version = get_version("feeds")
+    client.force_login(user)
+    user.email = "author@example.com"
+    user.save()
+    assert get_version("feeds") == version
+    user.username = "writer"
+    user.save()
+    assert get_version("feeds") != version
+    assert b"Writer" in client.get(reverse("latest-posts-feed")).content
+
+
+@pytest.mark.django_db
+def test_tag_list_queries_constant_for_500_tags(client, settings):
+    """The tag list costs the same queries for 500 tags and 5,000 posts."""
+    settings.PAGE_CACHE_TIMEOUT = 0
+    author = User.objects.create_user("author")
+    other = User.objects.create_user("other")
+    posts = Blog.objects.bulk_create(
+        Blog(
+            user=author,
+            title=f"Post {n}",
+            slug=f"post-{n}",
+            desc="desc",
+            body="",
+            view_count=n,
+            draft=n % 100 == 0,
+        )
+        for n in range(5000)
+    )
+    tags = Tag.objects.bulk_create(
+        Tag(tag_name=f"tag{n:03}", slug=f"tag{n:03}", tag_creator=other)
+        for n in range(500)
+    )
+    Tag.posts.through.objects.bulk_create(
+        Tag.posts.through(tag=tags[n % 499], blog=post)
+        for n, post in enumerate(posts)
+    )
+
+    client.get(reverse("blog:tag_list"))  # creates the site preferences.
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse("blog:tag_list"))
+    assert len(queries) <= 5
+
+    overview = {tag["slug"]: tag for tag in response.context["tag_list"]}
+    assert len(overview) == 500 and overview["tag499"]["posts"] == []
+    tag = overview["tag000"]
+    # posts 0, 499, ... 4990 have this tag, and post 0 is a draft.
+    assert tag["post_count"] == 10 and tag["more"]
+    assert [post["title"] for post in tag["posts"]] == [
+        f"Post {n}" for n in (4990, 4491, 3992, 3493, 2994, 2495)
+    ]
+
+
+@pytest.mark.django_db
+def test_tag_detail_paginates_popular_posts_without_drafts(client, settings):
+    """A tag's posts are paged by popularity, other users' drafts hidden."""
+    settings.PAGE_CACHE_TIMEOUT = 0
+    author = User.objects.create_user("author")
+    tag = Tag.objects.create(tag_name="python", tag_creator=author)
+    posts = Blog.objects.bulk_create(
+        Blog(
+            user=author,
+            title=f"Post {n}",
+            slug=f"post-{n}",
+            desc="desc",
+            body="",
+            view_count=n,
+            draft=n == 9,
+        )
+        for n in range(10)
+    )
+    tag.posts.add(*posts)
+    url = reverse("blog:tag_detail", args=[tag.slug])
+
+    client.get(url)  # creates the site preferences.
+    with CaptureQueriesContext(connection) as queries:
+        first = client.get(url)
+    assert [post.title for post in first.context["object_list"]] == [
+        f"Post {n}" for n in range(8, 2, -1)
+    ]
+    second = client.get(url, {"page": 2})
+    assert [post.title for post in second.context["object_list"]] == [
+        "Post 2",
+        "Post 1",
+        "Post 0",
+    ]
+    with CaptureQueriesContext(connection) as more_queries:
+        client.get(url, {"page": 2})
+    assert len(more_queries) == len(queries)
+
+    client.force_login(author)
+    own = client.get(url)
+    assert own.context["object_list"][0].title == "Post 9"
+
+
+@pytest.mark.django_db
+def test_index_cursor_pages_skip_drafts_at_any_depth(client, settings):
+    """Cursor pages hold six published posts, and walk back and forth."""
+    settings.PAGE_CACHE_TIMEOUT = 0
+    settings.BLOG_PAGINATION = "cursor"
+    author = User.objects.create_user("author")
+    for n in range(14):
+        Blog.objects.create(
+            user=author, title=f"Post {n}", desc="desc", body="", draft=n == 10
+        )
+    url = reverse("blog:index")
+
+    client.get(url)  # creates the site preferences.
+    titles, pages, cursor = [], [], None
+    while True:
+        with CaptureQueriesContext(connection) as queries:
+            page = client.get(url, {"cursor": cursor} if cursor else {})
+        pages.append(len(queries))
+        titles.append([post.title for post in page.context["blogs"]])
+        cursor = page.context["page_obj"].next_cursor
+        if cursor is None:
+            break
+    assert titles == [
+        ["Post 13", "Post 12", "Post 11", "Post 9", "Post 8", "Post 7"],
+        ["Post 6", "Post 5", "Post 4", "Post 3", "Post 2", "Post 1"],
+        ["Post 0"],
+    ]
+    assert pages[1] == pages[2]
+    assert b"About 13 posts" in page.content
+
+    newer = page.context["page_obj"].previous_cursor
+    back = client.get(url, {"cursor": newer})
+    assert [post.title for post in back.context["blogs"]] == titles[1]
+    assert client.get(url, {"cursor": "not-a-cursor"}).status_code == 404
+
+
+@pytest.mark.django_db
+def test_comments_load_as_cursor_paged_fragments(client, settings):
+    """A post's comments are served eight at a time, in constant queries."""
+    settings.PAGE_CACHE_TIMEOUT = 0
+    user = User.objects.create_user("author")
+    post = Blog.objects.create(user=user, title="Post", desc="desc", body="")
+    for n in range(20):
+        Comment.objects.create(
+            related_post=post,
+            created_by_user=user if n % 2 else None,
+            created_by_guest="" if n % 2 else "guest",
+            body=f"Comment {n:02}",
+        )
+    url = reverse("blog:comments", args=[post.slug])
+
+    detail = client.get(post.get_absolute_url())
+    assert b"Comment 00" not in detail.content
+    assert url.encode() in detail.content
+
+    bodies, pages, cursor = [], [], None
+    while True:
+        with CaptureQueriesContext(connection) as queries:
+            page = client.get(url, {"cursor": cursor} if cursor else {})
+        pages.append(len(queries))
+        assert b"<html" not in page.content
+        bodies.extend(comment.body for comment in page.context["comments"])
+        cursor = page.context["page_obj"].next_cursor
+        if cursor is None:
+            break
+    assert bodies == [f"Comment {n:02}" for n in range(20)]
+    assert pages[0] == pages[1] == pages[2] <= 5
+
+
+@pytest.mark.django_db
+def test_set_post_tags_resolves_names_in_bulk(django_assert_max_num_queries):
+    """Tags are matched case-insensitively and created in one insert."""
+    user = User.objects.create_user("author")
+    post = Blog.objects.create(user=user, title="Post", desc="desc", body="")
+    Tag.objects.create(tag_name="Python", tag_creator=user)
+
+    with django_assert_max_num_queries(6):
+        set_post_tags(post, " python, Django,, DJANGO , !!, web", user)
+    assert sorted(post.tag_set.values_list("tag_name", flat=True)) == [
+        "Python",
+        "django",
+        "web",
+    ]
+    assert Tag.objects.count() == 3
+
+    set_post_tags(post, "web, rust", user)
+    assert sorted(post.tag_set.values_list("tag_name", flat=True)) == [
+        "rust",
+        "web",
+    ]
+
+
+@pytest.mark.django_db
+def test_renamed_posts_redirect_permanently_without_cycles(client):
+    """Every old slug gets a cached 301 to the current one, never a loop."""
+    user = User.objects.create_user("author")
+    post = Blog.objects.create(user=user, title="First", desc="desc", body="")
+
+    def rename(title):
+        old_slug = post.slug
+        post.title = title
+        post.save()
+        record_rename(post, old_slug)
+
+    rename("Second")
+    rename("Third")
+    response = client.get("/first")
+    assert response.status_code == 301 and response["Location"] == "/third"
+    assert "max-age" in response["Cache-Control"]
+    assert client.get("/second")["Location"] == "/third"
+    client.get("/first")
+    with CaptureQueriesContext(connection) as queries:
+        client.get("/second")
+    assert not [q for q in queries if "blog_" in q["sql"]]
+
+    rename("First")
+    assert client.get("/first").status_code == 200
+    assert client.get("/third")["Location"] == "/first"
+    assert client.get("/second")["Location"] == "/first"
+
+
+@pytest.mark.django_db
+def test_blog_export_and_import_round_trip(tmp_path):
+    """A backup restores the posts, tags, comments and hits, with new keys."""
+    user = User.objects.create_user("author", password="secret")
+    post = Blog.objects.create(user=user, title="Post", desc="desc", body="")
+    Tag.objects.create(tag_name="python", tag_creator=user).posts.add(post)
+    Comment.objects.create(related_post=post, body="A comment")
+    Hit.objects.create(hitcount=post.hit_count, session="session")
+    Vote = get_vote_model()
+    Vote.objects.create(content_object=post, token="token", vote=1)
+    Redirect.objects.create(old_slug="old-post", old_post=post)
+    created_at = Blog.objects.get().created_at
+    backup = tmp_path / "backup.ndjson.gz"
+    call_command("blog_export", output=str(backup), stderr=StringIO())
+
+    User.objects.all().delete()
+    User.objects.create_user("someone-else")
+    call_command("blog_import", str(backup), stdout=StringIO())
+
+    restored = Blog.objects.get(slug="post")
+    assert restored.pk != post.pk and restored.created_at == created_at
+    assert restored.user.username == "author"
+    assert restored.user.check_password("secret")
+    assert restored.user.profile is not None
+    assert [tag.tag_name for tag in restored.tag_set.all()] == ["python"]
+    assert [comment.body for comment in restored.comments.all()] == [
+        "A comment"
+    ]
+    assert restored.hit_count.hits == 1 and restored.view_count == 1
+    assert restored.comment_count == 1
+
+    # restoring it again adds nothing that is already there.
+    counts = [model.objects.count() for model in (Comment, Hit, Vote, Redirect)]
+    call_command("blog_import", str(backup), stdout=StringIO())
+    assert [
+        model.objects.count() for model in (Comment, Hit, Vote, Redirect)
+    ] == counts
+    restored.refresh_from_db()
+    assert restored.comment_count == 1 and restored.view_count == 1
+    assert restored.vote_count == 1
+
+
+@pytest.mark.django_db
+def test_api_pages_posts_with_sparse_fields_and_caches_them(client):
+    """The API pages posts by cursor, and serves them from the cache."""
+    user = User.objects.create_user("author")
+    tag = Tag.objects.create(tag_name="python", slug="python", tag_creator=user)
+    for number in range(25):
+        post = Blog.objects.create(
+            user=user, title=f"Post {number}", desc="desc", body="body"
+        )
+        post.tag_set.add(tag)
+        Comment.objects.create(related_post=post, body="A comment")
+    Blog.objects.create(user=user, title="Draft", desc="desc", draft=True)
+
+    url = reverse("api:post_list")
+    with CaptureQueriesContext(connection) as queries:
+        first = client.get(url)
+    assert len(queries) <= 6
+    assert [post["title"] for post in first.json()["results"]][:2] == [
+        "Post 24",
+        "Post 23",
+    ]
+    assert first.json()["results"][0]["tags"][0]["slug"] == "python"
+    assert client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code == 304
+
+    titles = []
+    next_url = f"{url}?fields=slug,title"
+    while next_url:
+        page = client.get(next_url).json()
+        assert set(page["results"][0]) == {"slug", "title"}
+        titles += [post["title"] for post in page["results"]]
+        next_url = page["next"]
+    assert titles == [f"Post {number}" for number in range(24, -1, -1)]
+
+    with CaptureQueriesContext(connection) as queries:
+        client.get(url)
+    assert not [q for q in queries if 'FROM "blog_tag' in q["sql"]]
+
+    detail = client.get(reverse("api:post_detail", args=[post.slug])).json()
+    assert detail["body"] == "body"
+    comments = reverse("api:comment_list", args=[post.slug])
+    assert client.get(comments).json()["results"][0]["author"] == ""
+    tags = client.get(reverse("api:tag_list")).json()["results"]
+    assert tags == [
+        {
+            "name": "python",
+            "slug": "python",
+            "url": "http://testserver/tags/python/",
+            "post_count": 25,
+        }
+    ]
+    author = client.get(reverse("api:author_detail", args=[user.pk])).json()
+    assert author["post_count"] == 25
+    draft = reverse("api:post_detail", args=["draft"])
+    assert client.get(draft).status_code == 404
+
+    def queries_of(params):
+        with CaptureQueriesContext(connection) as queries:
+            client.get(url, params)
+        return len(queries)
+
+    # other query parameters aren't cached, so they can't fill the cache.
+    assert queries_of({"tag": "python"}) > queries_of({"tag": "python"})
+    tracked = {"tag": "python", "utm_source": "feed"}
+    assert queries_of(tracked) == queries_of(tracked)
+
+
+@pytest.mark.django_db
+def test_seed_blog_is_deterministic_with_consistent_counters():
+    """The seeded corpus depends only on the seed, and its counters add up."""
+    call_command("seed_blog", posts=60, tags=8, users=3, stdout=StringIO())
+    first = list(Blog.objects.order_by("pk").values_list("view_count", "draft"))
+    assert Blog.objects.drifted().count() == 0
+    assert Blog.objects.filter(draft=False, view_count=0).count() < 60
+
+    Blog.objects.all().delete()
+    call_command("seed_blog", posts=60, tags=8, users=3, stdout=StringIO())
+    again = list(Blog.objects.order_by("pk").values_list("view_count", "draft"))
+    assert again == first
+    most_viewed = max(first)[0]
+    assert most_viewed > 5 * sorted(first)[len(first) // 2][0]
+
+
+@pytest.mark.django_db
+def test_server_timing_header_and_query_budget_warning(
+    client, settings, caplog
+):
+    """Staff see the metrics of a response, and views over budget log a warning.
+
+    The header is public, so other users only get it if SERVER_TIMING is on.
+    """
+    user = User.objects.create_user("author")
+    post = Blog.objects.create(user=user, title="Post", desc="desc", body="")
+    settings.QUERY_BUDGETS = {"PostDetailView": 2}
+    settings.SERVER_TIMING = False
+
+    with caplog.at_level("INFO", logger="myblog.timing"):
+        response = client.get(post.get_absolute_url())
+    assert "Server-Timing" not in response
+    assert json.loads(caplog.records[0].getMessage())["view"] == "blog:detail"
+
+    user.is_staff = True
+    user.save()
+    client.force_login(user)
+    caplog.clear()
+    with caplog.at_level("INFO", logger="myblog.timing"):
+        response = client.get(post.get_absolute_url())
+    timing = response["Server-Timing"]
+    assert "db;dur=" in timing and "tpl;dur=" in timing
+    assert "total;dur=" in timing
+    record = json.loads(caplog.records[0].getMessage())
+    assert record["view"] == "blog:detail"
+    assert record["queries"] > 2
+    assert record["template_ms"] > 0
+    warnings = [r for r in caplog.records if r.levelname == "WARNING"]
+    assert "over its budget of 2" in warnings[0].getMessage()
+
+    settings.SERVER_TIMING = True
+    settings.SERVER_TIMING_LOG = False
+    client.logout()
+    caplog.clear()
+    with caplog.at_level("INFO", logger="myblog.timing"):
+        response = client.get(post.get_absolute_url())
+    assert "db;dur=" in response["Server-Timing"]
+    assert not caplog.records
+
+
+@pytest.mark.django_db
+def test_related_posts_follow_shared_tags(
+    client, django_capture_on_commit_callbacks
+):
+    """Related posts share tags, and are updated from a queue of changes."""
+    user = User.objects.create_user("author")
+    posts = {
+        title: Blog.objects.create(
+            user=user, title=title, desc="desc", body="", slug=title
+        )
+        for title in ("python", "django", "pandas", "cooking")
+    }
+    # the posts changed in one transaction are queued once it commits.
+    with CaptureQueriesContext(connection) as queries:
+        with django_capture_on_commit_callbacks(execute=True):
+            set_post_tags(posts["python"], "python, code", user)
+            set_post_tags(posts["django"], "python, web, code", user)
+            set_post_tags(posts["pandas"], "python, data", user)
+            set_post_tags(posts["cooking"], "food", user)
+    inserts = [
+        q for q in queries if 'INSERT INTO "blog_relatedpostupdate"' in q["sql"]
+    ]
+    assert len(inserts) == 1
+    assert RelatedPostUpdate.objects.count() == 4
+
+    def related(title):
+        return [
+            row.related.title
+            for row in RelatedPost.objects.filter(post=posts[title])
+        ]
+
+    def update_pending():
+        call_command("build_related_posts", pending=True, stdout=StringIO())
+
+    # saving only queues the posts, they are updated by the command.
+    assert related("python") == []
+    update_pending()
+    assert related("python") == ["django", "pandas"]
+    assert related("cooking") == []
+
+    with django_capture_on_commit_callbacks(execute=True):
+        set_post_tags(posts["cooking"], "food, data", user)
+    update_pending()
+    assert related("cooking") == ["pandas"]
+    assert "cooking" in related("pandas")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        posts["pandas"].draft = True
+        posts["pandas"].save()
+    update_pending()
+    assert related("cooking") == []
+    assert related("python") == ["django"]
+    assert not RelatedPostUpdate.objects.exists()
+
+    RelatedPost.objects.all().delete()
+    call_command("build_related_posts", stdout=StringIO())
+    assert related("python") == ["django"]
+    response = client.get(posts["python"].get_absolute_url())
+    assert response.context["related_posts"][0].related.title == "django"
+    assert posts["django"].get_absolute_url().encode() in response.content
+
+
+@pytest.mark.django_db
+def test_popular_posts_decay_and_refresh_incrementally():
+    """Old hits count for less, and a refresh only scores the new ones."""
+    user = User.objects.create_user("author")
+    old = Blog.objects.create(user=user, title="Old", desc="desc", body="")
+    new = Blog.objects.create(user=user, title="New", desc="desc", body="")
+    draft = Blog.objects.create(
+        user=user, title="Draft", desc="desc", body="", draft=True
+    )
+    now = timezone.now()
+
+    def add_hits(post, count, when):
+        for number in range(count):
+            hit = Hit.objects.create(
+                hitcount=post.hit_count, session=f"{post.pk}-{number}-{when}"
+            )
+            Hit.objects.filter(pk=hit.pk).update(created=when)
+
+    add_hits(old, 20, now - timedelta(days=60))
+    add_hits(new, 3, now)
+    add_hits(draft, 30, now)
+    assert refresh_popularity().full
+
+    popular = [post["slug"] for post in build_sidebar_context()["popular"]]
+    assert popular == [new.slug, old.slug]
+    assert [post.title for post in by_hits(Blog.objects.all())] == [
+        "New",
+        "Old",
+        "Draft",
+    ]
+
+    add_hits(old, 4, now)
+    refresh = refresh_popularity()
+    assert not refresh.full and refresh.posts == 1
+    popular = [post["slug"] for post in build_sidebar_context()["popular"]]
+    assert popular == [old.slug, new.slug]
+    assert PopularityRefresh.objects.count() == 2
+
+    old.draft = True
+    old.save()
+    popular = [post["slug"] for post in build_sidebar_context()["popular"]]
+    assert popular == [new.slug]
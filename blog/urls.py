@@ -34,6 +34,11 @@ urlpatterns = [
     # search
     path("search/", blog_views.SearchView.as_view(), name="search"),
     # Comment Views
+    path(
+        "<str:slug>/comments",
+        comment_views.CommentListView.as_view(),
+        name="comments",
+    ),
     path(
         "<str:slug>/comment",
         comment_views.AddCommentView.as_view(),
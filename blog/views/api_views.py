@@ -0,0 +1,221 @@
+"""Define the read API views, for the posts, tags, comments and authors.
+
+Only published posts are shown, to everyone, so the serialized data of a
+response is the same for every client. It is stored in the cache with the
+pages (see pagecache.py) and purged with them, as well as when a user or
+profile changes (the 'api' version, see signals.py). The responses have an
+ETag and Last-Modified header, so a client can revalidate them with a 304.
+
+Every list is paged by cursor, and '?fields=' picks which fields are returned.
+Related rows are only joined in or prefetched if their fields are asked for.
+"""
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from rest_framework import generics
+from rest_framework.exceptions import ParseError
+from rest_framework.response import Response
+
+from blog.cache import get_version, versioned_key
+from blog.conditional import api_condition, api_post_condition
+from blog.models import Blog, Comment, Tag
+from blog.pagecache import page_timeout
+from blog.pagination import (
+    APICursorPagination,
+    IdCursorPagination,
+    SlugCursorPagination,
+)
+from blog.serializers import (
+    AuthorSerializer,
+    CommentSerializer,
+    PostDetailSerializer,
+    PostSerializer,
+    TagSerializer,
+    requested_fields,
+)
+
+
+class CachedAPIMixin:
+    """Serve the serialized data from the cache, in this page cache group."""
+
+    cache_group = "index"
+    # the query parameters the responses depend on, in the order they are keyed.
+    cache_params = ("cursor", "fields", "tag", "author", "format")
+
+    def get_cache_group(self):
+        """Return the page cache group that this response belongs to."""
+        return self.cache_group
+
+    def get_cache_key(self):
+        """Return the cache key for this request, or None if not cacheable."""
+        params = self.request.query_params
+        # other query strings are rare, don't let them fill the cache.
+        if set(params) - set(self.cache_params):
+            return None
+        # the links in the data are absolute, so the host is part of the key.
+        url = self.request.build_absolute_uri(self.request.path)
+        query = urlencode(
+            [(name, params.getlist(name)) for name in self.cache_params],
+            doseq=True,
+        )
+        return versioned_key(
+            "pages",
+            get_version(f"pages:{self.get_cache_group()}"),
+            get_version("api"),
+            "api",
+            md5(f"{url}?{query}".encode()).hexdigest(),
+        )
+
+    def get(self, request, *args, **kwargs):
+        """Return the cached data, or serialize and store it."""
+        key = self.get_cache_key() if page_timeout() else None
+        if key is None:
+            return super().get(request, *args, **kwargs)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, page_timeout())
+        return response
+
+    def wants(self, field):
+        """Return True if this field was asked for with '?fields='."""
+        wanted = requested_fields(self.request)
+        return wanted is None or field in wanted
+
+
+@method_decorator(api_condition, name="dispatch")
+class PostListAPIView(CachedAPIMixin, generics.ListAPIView):
+    """List the published posts, newest first.
+
+    They can be filtered with '?tag=<slug>' and '?author=<id>'.
+    """
+
+    serializer_class = PostSerializer
+    pagination_class = APICursorPagination
+
+    def get_queryset(self):
+        """Return the posts, with only the related rows that are needed."""
+        posts = Blog.objects.filter(draft=False).defer(
+            "body", "rendered_body", "search_vector"
+        )
+        tag = self.request.query_params.get("tag")
+        if tag:
+            posts = posts.filter(tag__slug=tag)
+        author = self.request.query_params.get("author")
+        if author:
+            if not author.isdigit():
+                raise ParseError("'author' must be the id of a user.")
+            posts = posts.filter(user_id=author)
+        if self.wants("author"):
+            posts = posts.select_related("user")
+        if self.wants("tags"):
+            posts = posts.prefetch_related("tag_set")
+        return posts
+
+
+@method_decorator(api_post_condition, name="dispatch")
+class PostDetailAPIView(CachedAPIMixin, generics.RetrieveAPIView):
+    """Return a published post, with its body."""
+
+    serializer_class = PostDetailSerializer
+    lookup_field = "slug"
+    queryset = (
+        Blog.objects.filter(draft=False)
+        .select_related("user")
+        .prefetch_related("tag_set")
+        .defer("body", "search_vector")
+    )
+
+    def get_cache_group(self):
+        """Return the page cache group of the post."""
+        return f"post:{self.kwargs['slug']}"
+
+
+@method_decorator(api_post_condition, name="dispatch")
+class CommentListAPIView(CachedAPIMixin, generics.ListAPIView):
+    """List the comments on a published post, oldest first."""
+
+    serializer_class = CommentSerializer
+    pagination_class = APICursorPagination
+    newest_first = False
+
+    def get_cache_group(self):
+        """Return the page cache group of the post."""
+        return f"post:{self.kwargs['slug']}"
+
+    def get_queryset(self):
+        """Return the post's comments, with their users joined in."""
+        post = get_object_or_404(
+            Blog.objects.filter(draft=False).only("pk"),
+            slug=self.kwargs["slug"],
+        )
+        comments = Comment.objects.filter(related_post=post).defer(
+            "guest_email"
+        )
+        if self.wants("author"):
+            comments = comments.select_related("created_by_user")
+        return comments
+
+
+class TagAPIMixin(CachedAPIMixin):
+    """Return the tags of published posts, with how many posts have them."""
+
+    serializer_class = TagSerializer
+    cache_group = "tags"
+    lookup_field = "slug"
+
+    def get_queryset(self):
+        """Return the tags, with their published post count."""
+        return Tag.objects.annotate(
+            post_count=Count("posts", filter=Q(posts__draft=False))
+        ).filter(post_count__gt=0)
+
+
+@method_decorator(api_condition, name="dispatch")
+class TagListAPIView(TagAPIMixin, generics.ListAPIView):
+    """List the tags, by slug."""
+
+    pagination_class = SlugCursorPagination
+
+
+@method_decorator(api_condition, name="dispatch")
+class TagDetailAPIView(TagAPIMixin, generics.RetrieveAPIView):
+    """Return a tag. Its posts are listed by PostListAPIView."""
+
+
+class AuthorAPIMixin(CachedAPIMixin):
+    """Return the users who have published posts, with their profiles."""
+
+    serializer_class = AuthorSerializer
+
+    def get_queryset(self):
+        """Return the authors, with their published post count."""
+        return (
+            User.objects.annotate(
+                post_count=Count(
+                    "blog_posts", filter=Q(blog_posts__draft=False)
+                )
+            )
+            .filter(post_count__gt=0)
+            .select_related("profile")
+        )
+
+
+@method_decorator(api_condition, name="dispatch")
+class AuthorListAPIView(AuthorAPIMixin, generics.ListAPIView):
+    """List the authors, by id."""
+
+    pagination_class = IdCursorPagination
+
+
+@method_decorator(api_condition, name="dispatch")
+class AuthorDetailAPIView(AuthorAPIMixin, generics.RetrieveAPIView):
+    """Return an author. Their posts are listed by PostListAPIView."""
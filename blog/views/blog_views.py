@@ -4,24 +4,32 @@ from datetime import datetime
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.staticfiles.storage import staticfiles_storage
 from django.core.exceptions import PermissionDenied
-from django.db.models import Q
 from django.db.models.functions import Lower
 from django.http import Http404
 from django.template.defaultfilters import slugify
 from django.urls.base import reverse, reverse_lazy
+from django.utils.decorators import method_decorator
 from django.views.generic import CreateView, ListView
 from django.views.generic.edit import DeleteView, UpdateView
 from hitcount.views import HitCountDetailView
 from preferences import preferences
 
+from blog.conditional import post_condition
 from blog.forms import EditPostForm, NewPostForm
-from blog.models import Blog, Redirect, Tag
+from blog.hits import BufferedHitCountMixin
+from blog.models import Blog, RelatedPost
+from blog.pagination import CursorPaginationMixin
+from blog.redirects import record_rename, redirect_old_slugs
+from blog.search import get_search_backend
+from blog.tags import set_post_tags
 
-# from itertools import chain
 
+class IndexClassView(CursorPaginationMixin, ListView):
+    """Define a TemplateView for the index (Blog main page).
 
-class IndexClassView(ListView):
-    """Define a TemplateView for the index (Blog main page)."""
+    Drafts are only listed for their author. The pages are numbered, or use
+    cursors if BLOG_PAGINATION is 'cursor' (see pagination.py).
+    """
 
     template_name = "blog/index.html"
     context_object_name = "blogs"
@@ -29,6 +37,15 @@ class IndexClassView(ListView):
     ordering = ["-created_at"]
     model = Blog
 
+    def get_queryset(self):
+        """Return the posts, annotated for the summary cards."""
+        return (
+            super(IndexClassView, self)
+            .get_queryset()
+            .visible_to(self.request.user)
+            .summary()
+        )
+
     def get_context_data(self, **kwargs):
         """Add page title to the context."""
         context = super(IndexClassView, self).get_context_data(**kwargs)
@@ -60,8 +77,16 @@ class IndexClassView(ListView):
         return context
 
 
-class PostDetailView(HitCountDetailView):
-    """Display an actual blog post."""
+@method_decorator(redirect_old_slugs, name="dispatch")
+@method_decorator(post_condition, name="dispatch")
+class PostDetailView(BufferedHitCountMixin, HitCountDetailView):
+    """Display an actual blog post.
+
+    Hits are counted in the request, or buffered and written in bulk, depending
+    on settings.BLOG_HIT_MODE (see hits.py). Unchanged posts are revalidated
+    with a 304, see conditional.py. Old slugs of renamed posts get a 301 to the
+    current one, see redirects.py
+    """
 
     model = Blog
     template = "blog/detail.html"
@@ -94,24 +119,21 @@ class PostDetailView(HitCountDetailView):
                 },
             ],
         }
+        # precomputed by related.py, so this is a single query.
+        context["related_posts"] = (
+            RelatedPost.objects.filter(post=self.object)
+            .select_related("related")
+            .only("related__title", "related__slug", "related__desc")
+        )
         return context
 
     def get_object(self, queryset=None):
         """Get the correct post object.
 
         Return 404 if the post is a draft.
-        If we have an old slug with a redirect value, go to the new slug.
         Return 404 if the slug is not found.
         """
-        try:
-            obj = super(PostDetailView, self).get_object()
-        except Http404:
-            slug_wanted = self.kwargs.get("slug")
-            try:
-                redirect = Redirect.objects.get(old_slug=slug_wanted)
-            except Redirect.DoesNotExist:
-                raise Http404("Post does not exist")
-            obj = Blog.objects.get(pk=redirect.old_post_id)
+        obj = super(PostDetailView, self).get_object()
         if obj.draft is True and self.request.user != obj.user:
             raise Http404("That Page does not exist")
         return obj
@@ -127,26 +149,10 @@ class NewPostView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
     def form_valid(self, form):
         """Validate the form."""
         form.save()
-        tag_list = [
-            tag.strip() for tag in form.cleaned_data["tags_list"].split(",")
-        ]
-        new_tags = []
-        for tag in tag_list:
-            if tag == "":
-                continue
-            try:
-                existing_tag = Tag.objects.get(tag_name=tag.lower())
-            except Tag.DoesNotExist:
-                new_tags.append(
-                    Tag.objects.create(
-                        tag_name=tag.lower(), tag_creator=self.request.user
-                    )
-                )
-            else:
-                new_tags.append(existing_tag)
-
         # replace all the tag associations on this post with the new list
-        form.instance.tag_set.set(new_tags)
+        set_post_tags(
+            form.instance, form.cleaned_data["tags_list"], self.request.user
+        )
 
         # detect if we want this a draft or not.
         if "draft" in self.request.POST:
@@ -186,39 +192,11 @@ class EditPostView(LoginRequiredMixin, UpdateView):
         # if the slug has changed, add this to a redirect table
         new_slug = self.object.slug
         if (not original_slug == new_slug) and not self.object.draft:
-            # the redirect may exist and should be unique, so we need to check
-            # and update the existing in that case.
-            try:
-                redirect = Redirect.objects.get(old_slug=original_slug)
-            except Redirect.DoesNotExist:
-                # would be good in here to have logic to remove any surplus
-                # redirect, for example when its redirected back to a previous
-                # slug.
-                redirect = Redirect(
-                    old_slug=original_slug, old_post=self.object
-                )
-                redirect.save()
-
-        tag_list = [
-            tag.strip() for tag in form.cleaned_data["tags_list"].split(",")
-        ]
-
-        new_tags = []
-        for tag in tag_list:
-            if tag == "":
-                continue
-            try:
-                existing_tag = Tag.objects.get(tag_name=tag.lower())
-            except Tag.DoesNotExist:
-                new_tags.append(
-                    Tag.objects.create(
-                        tag_name=tag.lower(), tag_creator=self.request.user
-                    )
-                )
-            else:
-                new_tags.append(existing_tag)
-
-        form.instance.tag_set.set(new_tags)
+            record_rename(self.object, original_slug)
+
+        set_post_tags(
+            form.instance, form.cleaned_data["tags_list"], self.request.user
+        )
 
         if "publish" in self.request.POST:
             # turn off the draft flag
@@ -302,24 +280,20 @@ class DeletePostView(LoginRequiredMixin, DeleteView):
 
 
 class SearchView(ListView):
-    """Search for a post by title."""
+    """Search for a post by title, tags, description and content."""
 
     model = Blog
     template_name = "blog/blog_search.html"
 
     def get_queryset(self):
-        """Search for a post by title and content."""
+        """Search for a post by title, tags, description and content.
+
+        The results are ranked by relevance and are lazy, so only the page
+        being displayed is fetched.
+        """
         query = self.request.GET.get("q")
         if query:
-            blog_result = Blog.objects.filter(
-                Q(title__icontains=query) | Q(desc__icontains=query)
-            )
-            # will want to include tag names in this search, but they need to
-            # return posts not tags. Further work needed.
-            # tag_result =Tag.objects.filter(tag_name__icontains=query)
-            # object_list = chain(blog_result)
-            object_list = blog_result
-            return object_list
+            return get_search_backend().search(query, self.request.user)
 
     def get_context_data(self, **kwargs):
         """Add page title to the context."""
@@ -1,12 +1,55 @@
 """Define the views for the Comment Model."""
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http.response import Http404
+from django.shortcuts import get_object_or_404
 from django.urls.base import reverse
-from django.views.generic import CreateView
+from django.utils.decorators import method_decorator
+from django.views.generic import CreateView, ListView
 from django.views.generic.edit import DeleteView, UpdateView
 
+from blog.conditional import post_condition
 from blog.forms import EditCommentForm, NewCommentForm
 from blog.models import Blog, Comment
+from blog.pagination import CursorPaginationMixin
+
+
+@method_decorator(post_condition, name="dispatch")
+class CommentListView(CursorPaginationMixin, ListView):
+    """Return a page of a post's comments, as an HTML fragment.
+
+    The post page loads this after the article, and each fragment links to the
+    next. The comments are paged by cursor, oldest first, with their users
+    joined in, and the total comes from the post's comment_count column.
+    """
+
+    template_name = "blog/comment_list.html"
+    context_object_name = "comments"
+    paginate_by = 8
+    always_cursor = True
+    newest_first = False
+
+    def get(self, request, *args, **kwargs):
+        """Look up the post, before listing its comments."""
+        self.blog = get_object_or_404(
+            Blog.objects.visible_to(request.user).only(
+                "slug", "draft", "user_id", "comment_count"
+            ),
+            slug=kwargs["slug"],
+        )
+        response = super(CommentListView, self).get(request, *args, **kwargs)
+        # a fragment must not be wrapped in <html> by HtmlMinifyMiddleware.
+        response.minify_response = False
+        return response
+
+    def get_queryset(self):
+        """Return the comments on this post, with their users."""
+        return self.blog.comments.select_related("created_by_user")
+
+    def get_context_data(self, **kwargs):
+        """Add the post to the context."""
+        context = super(CommentListView, self).get_context_data(**kwargs)
+        context["blog"] = self.blog
+        return context
 
 
 class AddCommentView(CreateView):
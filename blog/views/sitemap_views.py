@@ -0,0 +1,117 @@
+"""Define the views for the sitemap index and its sections.
+
+The XML is generated while it is streamed to the client, and a section is
+stored in the cache once it has been generated completely.
+"""
+from xml.sax.saxutils import escape
+
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+
+from blog.cache import versioned_key
+from blog.conditional import published_condition
+from blog.sitemaps import AuthorSitemap, BlogSitemap, StaticSiteMap, TagSitemap
+
+SITEMAP_TIMEOUT = 60 * 60 * 24
+CONTENT_TYPE = "application/xml; charset=utf-8"
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+XMLNS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+
+# the sections that are not posts. They change with the tags and the posts,
+# so are cached until the 'pages' version is bumped (see pagecache.py).
+OTHER_SECTIONS = {
+    "static": StaticSiteMap,
+    "tags": TagSitemap,
+    "authors": AuthorSitemap,
+}
+
+
+def w3c_date(lastmod):
+    """Return a date in the W3C format used by sitemaps."""
+    return lastmod.isoformat(timespec="seconds")
+
+
+def generate_index(request, sections):
+    """Generate the XML of the sitemap index, in chunks."""
+    yield XML_HEADER
+    yield f"<sitemapindex {XMLNS}>\n"
+    latest = max((lastmod for lastmod, _ in sections.values()), default=None)
+    names = [*OTHER_SECTIONS, *(f"posts-{n}" for n in sorted(sections))]
+    for name in names:
+        if name.startswith("posts-"):
+            lastmod = sections[int(name[6:])][0]
+        else:
+            lastmod = None if name == "static" else latest
+        location = request.build_absolute_uri(
+            reverse("sitemap-section", args=[name])
+        )
+        yield f"<sitemap><loc>{escape(location)}</loc>"
+        if lastmod is not None:
+            yield f"<lastmod>{w3c_date(lastmod)}</lastmod>"
+        yield "</sitemap>\n"
+    yield "</sitemapindex>\n"
+
+
+def generate_urlset(request, sitemap):
+    """Generate the XML of one sitemap section, in chunks."""
+    yield XML_HEADER
+    yield f"<urlset {XMLNS}>\n"
+    for item in sitemap.items():
+        location = request.build_absolute_uri(sitemap.location(item))
+        chunk = f"<url><loc>{escape(location)}</loc>"
+        lastmod = sitemap.lastmod(item) if hasattr(sitemap, "lastmod") else None
+        if lastmod is not None:
+            chunk += f"<lastmod>{w3c_date(lastmod)}</lastmod>"
+        chunk += (
+            f"<changefreq>{sitemap.changefreq}</changefreq>"
+            f"<priority>{sitemap.priority}</priority></url>\n"
+        )
+        yield chunk
+    yield "</urlset>\n"
+
+
+def cache_when_done(key, chunks):
+    """Pass the chunks through, and cache them once they are all generated."""
+    generated = []
+    for chunk in chunks:
+        generated.append(chunk)
+        yield chunk
+    cache.set(key, "".join(generated), SITEMAP_TIMEOUT)
+
+
+@published_condition
+def sitemap_index(request):
+    """Return the sitemap index, listing every section."""
+    return StreamingHttpResponse(
+        generate_index(request, BlogSitemap.sections()),
+        content_type=CONTENT_TYPE,
+    )
+
+
+@published_condition
+def sitemap_section(request, section):
+    """Return one section of the sitemap, from the cache if possible."""
+    host = request.build_absolute_uri("/")
+    if section in OTHER_SECTIONS:
+        sitemap = OTHER_SECTIONS[section]()
+        key = versioned_key("pages", "sitemap", section, host)
+    else:
+        prefix, _, number = section.partition("-")
+        if prefix != "posts" or not number.isdigit():
+            raise Http404("No such sitemap section")
+        number = int(number)
+        sections = BlogSitemap.sections(number)
+        if number not in sections:
+            raise Http404("No such sitemap section")
+        lastmod, count = sections[number]
+        sitemap = BlogSitemap(number)
+        key = f"sitemap:posts:{number}:{lastmod.isoformat()}:{count}:{host}"
+
+    content = cache.get(key)
+    if content is not None:
+        return HttpResponse(content, content_type=CONTENT_TYPE)
+    return StreamingHttpResponse(
+        cache_when_done(key, generate_urlset(request, sitemap)),
+        content_type=CONTENT_TYPE,
+    )
@@ -1,15 +1,34 @@
 """Define the views for the Tag Model."""
 from django.db.models.functions import Lower
-from django.views.generic import DetailView, ListView
+from django.views.generic import ListView
+from django.views.generic.detail import SingleObjectMixin
 
 from blog.models import Tag
 
 
-class TagDetailView(DetailView):
-    """This will list all posts with a certain Tag slug."""
+class TagDetailView(SingleObjectMixin, ListView):
+    """This will list all posts with a certain Tag slug, a page at a time.
+
+    Drafts are filtered out in the query (except for their author), and the
+    posts are ordered by popularity, as blog_popularity_idx.
+    """
 
     model = Tag
     template_name = "blog/tag_detail.html"
+    paginate_by = 6
+
+    def get(self, request, *args, **kwargs):
+        """Look up the tag, before listing its posts."""
+        self.object = self.get_object(queryset=Tag.objects.all())
+        return super(TagDetailView, self).get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        """Return this tag's posts that the user can see, most popular first."""
+        return (
+            self.object.posts.visible_to(self.request.user)
+            .summary()
+            .by_popularity()
+        )
 
     def get_context_data(self, **kwargs):
         """Add posts ant tags to this context, so we can use in the sidebar."""
@@ -24,11 +43,18 @@ class TagListView(ListView):
 
     model = Tag
     template_name = "blog/tag/list.html"
+    context_object_name = "tag_list"
     ordering = [Lower("tag_name")]
 
     def get_context_data(self, **kwargs):
-        """Add posts and tags to this context, so we can use in the sidebar."""
-        context = super(TagListView, self).get_context_data(**kwargs)
+        """Add posts and tags to this context, so we can use in the sidebar.
+
+        The tags and their top posts are passed to the template as plain data,
+        see TagQuerySet.overview().
+        """
+        context = super(TagListView, self).get_context_data(
+            object_list=self.object_list.overview(self.request.user), **kwargs
+        )
         context["page_title"] = "Tags"
 
         return context
@@ -0,0 +1,13 @@
+"""Shared fixtures for the tests."""
+import pytest
+from django.core.cache import cache
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Start each test with an empty cache, the one configured in settings.
+
+    The tests run with the cache the site uses, so their query counts include
+    whatever it costs.
+    """
+    cache.clear()
@@ -0,0 +1,141 @@
+"""Resized copies of the uploaded images, used by multiple apps.
+
+When a post header image or an avatar is uploaded, WebP and JPEG copies are
+made at a few fixed widths (never larger than the original), and their names
+and dimensions are stored on the model as a dictionary :
+
+    {
+        "width": 1600, "height": 900,
+        "sources": [
+            {"width": 400, "height": 225, "webp": "...-400w.webp",
+             "jpg": "...-400w.jpg"},
+            ...
+        ],
+    }
+
+The templates use this for the 'srcset' and 'sizes' of the image, see the
+'responsive_image' template tag. The placeholder images shown when there is no
+upload get the same treatment, the first time they are needed.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# the widths made for each kind of image, and the image used when there is none.
+IMAGE_KINDS = {
+    "header": {
+        "widths": (400, 800, 1200),
+        "placeholder": "default_placeholder.png",
+    },
+    "avatar": {
+        "widths": (150, 300),
+        "placeholder": "default_profile_pic.png",
+    },
+}
+FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+QUALITY = 80
+
+# maps each kind to the sizes of its placeholder, filled in on first use.
+_placeholders = {}
+
+
+def derived_name(name, width, extension):
+    """Return the file name of a resized copy of this image."""
+    return f"{os.path.splitext(name)[0]}-{width}w.{extension}"
+
+
+def target_widths(kind, width):
+    """Return the widths to make for an image of this kind and width."""
+    return sorted(
+        {min(target, width) for target in IMAGE_KINDS[kind]["widths"]}
+    )
+
+
+def encode(image, image_format):
+    """Return the image encoded in this format, as a ContentFile."""
+    if image_format == "JPEG" and image.mode != "RGB":
+        # JPEG has no transparency, so flatten the image onto white.
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def make_sizes(name, kind, storage=default_storage):
+    """Write the resized copies of an image, returning their details."""
+    with storage.open(name) as file, Image.open(file) as original:
+        image = ImageOps.exif_transpose(original)
+        width, height = image.size
+        sources = []
+        for target in target_widths(kind, width):
+            size = (target, max(1, round(height * target / width)))
+            resized = image.resize(size, Image.LANCZOS)
+            source = {"width": size[0], "height": size[1]}
+            for extension, image_format in FORMATS.items():
+                derived = derived_name(name, target, extension)
+                # overwrite the copies of a previous upload with the same name.
+                storage.delete(derived)
+                source[extension] = storage.save(
+                    derived, encode(resized, image_format)
+                )
+            sources.append(source)
+    return {"width": width, "height": height, "sources": sources}
+
+
+def update_image_sizes(
+    instance, kind, field="image", sizes_field="image_sizes"
+):
+    """Make the resized copies of a model's image and store their details.
+
+    The details are saved with an UPDATE, so no signals are sent.
+    """
+    image = getattr(instance, field)
+    sizes = make_sizes(image.name, kind, image.storage) if image else {}
+    setattr(instance, sizes_field, sizes)
+    type(instance).objects.filter(pk=instance.pk).update(**{sizes_field: sizes})
+    return sizes
+
+
+def placeholder_sizes(kind):
+    """Return the sizes of the placeholder image for this kind of image.
+
+    The resized copies are only written if they are missing, and the result is
+    kept for the life of the process.
+    """
+    if kind not in _placeholders:
+        name = IMAGE_KINDS[kind]["placeholder"]
+        try:
+            _placeholders[kind] = make_placeholder_sizes(name, kind)
+        except OSError:
+            _placeholders[kind] = {}
+    return _placeholders[kind]
+
+
+def make_placeholder_sizes(name, kind, storage=default_storage):
+    """Return the sizes of a placeholder, making the copies if needed."""
+    with storage.open(name) as file, Image.open(file) as image:
+        width, height = ImageOps.exif_transpose(image).size
+    sources = []
+    for target in target_widths(kind, width):
+        source = {
+            "width": target,
+            "height": max(1, round(height * target / width)),
+        }
+        for extension in FORMATS:
+            source[extension] = derived_name(name, target, extension)
+        sources.append(source)
+    if not all(
+        storage.exists(source[extension])
+        for source in sources
+        for extension in FORMATS
+    ):
+        return make_sizes(name, kind, storage)
+    return {"width": width, "height": height, "sources": sources}
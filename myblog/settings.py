@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     "django.contrib.sitemaps",
     "django.contrib.humanize",
+    "django.contrib.postgres",
     "preferences",
     "rundevserver",
     "compressor",
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
     "secretballot",
     "captcha",
     "likes",
+    "rest_framework",
     "blog",
     "users",
     "hitcount",
@@ -66,6 +68,7 @@ FIX_PROXY_IP = bool(int(os.getenv("FIX_PROXY_IP", 0)))
 
 
 MIDDLEWARE = [
+    "myblog.timing.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     # "django.contrib.sessions.middleware.SessionMiddleware",
     "user_sessions.middleware.SessionMiddleware",
@@ -77,8 +80,10 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "dj_pagination.middleware.PaginationMiddleware",
     "likes.middleware.SecretBallotUserIpUseragentMiddleware",
+    "blog.pagecache.PageCacheMiddleware",
     "htmlmin.middleware.HtmlMinifyMiddleware",
     "htmlmin.middleware.MarkRequestMiddleware",
+    "myblog.timing.ViewTimingMiddleware",
 ]
 
 # Only load the XForwarded fix if explicitly required
@@ -206,6 +211,92 @@ PAGINATION_DISABLE_LINK_FOR_FIRST_PAGE = True
 HITCOUNT_HITS_PER_IP_LIMIT = 0
 HITCOUNT_USE_IP = True
 
+# how post hits are written: "sync" saves each hit during the request,
+# "buffered" queues them in memory and writes them in bulk from a background
+# thread every BLOG_HIT_FLUSH_INTERVAL seconds (or sooner once
+# BLOG_HIT_BUFFER_SIZE hits are waiting). See blog/hits.py
+BLOG_HIT_MODE = os.getenv("BLOG_HIT_MODE", "sync")
+BLOG_HIT_FLUSH_INTERVAL = 10
+BLOG_HIT_BUFFER_SIZE = 1000
+
+# how the index is paged. "offset" numbers the pages, each one counting every
+# post and skipping over all the posts before it. "cursor" links to the next
+# and previous pages by the date of the last post shown, so a deep page costs
+# the same as the first. BLOG_PAGINATION_TOTAL shows an approximate count of
+# the posts with cursor pages. See blog/pagination.py
+BLOG_PAGINATION = os.getenv("BLOG_PAGINATION", "offset")
+BLOG_PAGINATION_TOTAL = True
+
+# the version tokens in blog/cache.py and preferences/cache.py invalidate cached
+# data in every process that shares the cache. Set BLOG_CACHE_URL (for example
+# "redis://127.0.0.1:6379/1") to share a Redis cache between the gunicorn
+# workers. Otherwise each process has its own in-memory cache, which costs no
+# queries, and a change made through one worker reaches the others as their
+# copies time out (PAGE_CACHE_TIMEOUT, PREFERENCES_CACHE_TTL and the like).
+if os.getenv("BLOG_CACHE_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("BLOG_CACHE_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# a safety net, how many seconds each process keeps the site preferences even
+# if it misses their invalidation. See preferences/cache.py
+PREFERENCES_CACHE_TTL = 60
+
+# how many seconds the public pages are cached for anonymous readers. They are
+# purged when their content changes, but the view counts and the 'popular'
+# sidebar can be this much out of date. 0 turns the page cache off.
+# See blog/pagecache.py
+PAGE_CACHE_TIMEOUT = 300
+
+# how many related posts are shown under each post, and how much their
+# popularity counts against the tags they share (0 to 1). See blog/related.py
+BLOG_RELATED_POSTS = 4
+BLOG_RELATED_POPULARITY = 0.2
+
+# the 'Popular Posts' are ranked by their hits and likes (a like counts as
+# BLOG_POPULARITY_VOTE_WEIGHT hits), which lose half their value every
+# BLOG_POPULARITY_HALF_LIFE days. Refreshed by the 'refresh_popularity' command,
+# see blog/popularity.py
+BLOG_POPULARITY_HALF_LIFE = 7
+BLOG_POPULARITY_VOTE_WEIGHT = 5
+
+# responses to staff users get a Server-Timing header with their query count
+# and times, as do all responses if SERVER_TIMING is on (by default only with
+# DEBUG, the header is public). The same figures are logged to the
+# 'myblog.timing' logger if SERVER_TIMING_LOG is on, and a view that makes more
+# queries than its budget here (by URL or view name) logs a warning.
+# See myblog/timing.py
+SERVER_TIMING = bool(int(os.getenv("SERVER_TIMING", int(DEBUG))))
+SERVER_TIMING_LOG = bool(int(os.getenv("SERVER_TIMING_LOG", 1)))
+QUERY_BUDGETS = {
+    "blog:index": 15,
+    "blog:detail": 30,
+    "blog:comments": 8,
+    "blog:tag_list": 6,
+    "blog:tag_detail": 10,
+    "blog:search": 10,
+    "user-profile": 12,
+    "my-profile": 14,
+    "PostsFeed": 4,
+    "sitemap": 4,
+    "sitemap-section": 4,
+}
+
+# the read API only ever returns JSON, and is open to everyone.
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": ["rest_framework.renderers.JSONRenderer"],
+    "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.AllowAny"],
+}
+
 # settings for CKEditor Rich-text editor plugin
 CKEDITOR_UPLOAD_PATH = "image/uploads/"
 CKEDITOR_IMAGE_BACKEND = "pillow"
@@ -295,6 +386,9 @@ CKEDITOR_CONFIGS = {
     },
 }
 
+# Postgresql text search configuration used for the post search.
+BLOG_SEARCH_CONFIG = "english"
+
 # Secret Ballot settings.
 SECRETBALLOT_FOR_MODELS = {
     "blog.Blog": {},
@@ -0,0 +1,281 @@
+"""Per-request performance metrics, sent as a Server-Timing header and logged.
+
+ServerTimingMiddleware (the first middleware) measures each request: the SQL
+queries, with their count, total time and how many were exact repeats of an
+earlier query, through a database execute wrapper; the hits and misses of the
+default cache; the time spent rendering the template of a TemplateResponse; and
+the time spent in the middleware, outside ViewTimingMiddleware (the last
+middleware). These are added to the response as a Server-Timing header, which
+the browser's developer tools show alongside the request, and logged as one
+JSON line to the 'myblog.timing' logger at INFO level.
+
+The header tells anyone how busy the server is and how a page is built, so it
+is only sent to staff users, unless SERVER_TIMING is True (it defaults to
+DEBUG). The log is turned on and off by SERVER_TIMING_LOG, and a view that
+makes more queries than its budget in QUERY_BUDGETS (by URL name, such as
+'blog:detail', or by view name, such as 'PostDetailView') is logged as a
+WARNING. Nothing is measured if neither is on.
+
+Streamed responses (the sitemap) are measured up to their first byte only.
+Templates rendered by the view itself, rather than returned in a
+TemplateResponse, are part of the view's time.
+"""
+import json
+import logging
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# the metrics of the request being handled, if it is being measured.
+current_metrics = ContextVar("current_metrics", default=None)
+
+# marks a cache miss, as None can be a cached value.
+_missing = object()
+
+
+class RequestMetrics:
+    """The metrics collected while handling one request."""
+
+    def __init__(self):
+        """Start with nothing measured."""
+        self.start = perf_counter()
+        self.total = 0.0
+        self.inner = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.seen_queries = Counter()
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def duplicates(self):
+        """Return how many queries repeated an earlier one exactly."""
+        return sum(count - 1 for count in self.seen_queries.values())
+
+    @property
+    def middleware_time(self):
+        """Return the time spent in the middleware, around the view."""
+        if self.inner is None:
+            return self.total
+        return max(self.total - self.inner, 0.0)
+
+    def record_query(self, sql, params, duration):
+        """Record a query that was run."""
+        self.queries += 1
+        self.sql_time += duration
+        self.seen_queries[(sql, repr(params))] += 1
+
+    def server_timing(self):
+        """Return the value of the Server-Timing header."""
+        return ", ".join(
+            (
+                f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} '
+                f'queries, {self.duplicates} duplicate"',
+                f"tpl;dur={self.template_time * 1000:.1f}",
+                f'cache;desc="{self.cache_hits} hits, '
+                f'{self.cache_misses} misses"',
+                f"mw;dur={self.middleware_time * 1000:.1f}",
+                f"total;dur={self.total * 1000:.1f}",
+            )
+        )
+
+    def as_dict(self):
+        """Return the metrics as a JSON friendly dict, times in ms."""
+        return {
+            "total_ms": round(self.total * 1000, 2),
+            "middleware_ms": round(self.middleware_time * 1000, 2),
+            "template_ms": round(self.template_time * 1000, 2),
+            "sql_ms": round(self.sql_time * 1000, 2),
+            "queries": self.queries,
+            "duplicate_queries": self.duplicates,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+        }
+
+
+def time_query(execute, sql, params, many, context):
+    """Time a database query, for the request being measured (if any)."""
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, params, perf_counter() - start)
+
+
+def instrument_cache(cache):
+    """Count the hits and misses of 'get' on this cache object.
+
+    Each thread has its own cache object, so they are wrapped once each.
+    get_many is counted per key, but not again when it falls back on get.
+    """
+    if getattr(cache, "_timed", False):
+        return
+    get, get_many = cache.get, cache.get_many
+
+    @wraps(get)
+    def timed_get(key, default=None, version=None):
+        value = get(key, _missing, version=version)
+        metrics = current_metrics.get()
+        if metrics is not None and not cache._in_get_many:
+            if value is _missing:
+                metrics.cache_misses += 1
+            else:
+                metrics.cache_hits += 1
+        return default if value is _missing else value
+
+    @wraps(get_many)
+    def timed_get_many(keys, version=None):
+        keys = list(keys)
+        cache._in_get_many = True
+        try:
+            values = get_many(keys, version=version)
+        finally:
+            cache._in_get_many = False
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.cache_hits += len(values)
+            metrics.cache_misses += len(keys) - len(values)
+        return values
+
+    cache.get, cache.get_many = timed_get, timed_get_many
+    cache._in_get_many = False
+    cache._timed = True
+
+
+def query_budget(match):
+    """Return the most queries the view of a URL match should make, or None."""
+    if match is None:
+        return None
+    budgets = getattr(settings, "QUERY_BUDGETS", {})
+    budget = budgets.get(match.view_name)
+    if budget is None:
+        # class based views have a 'view_class', feeds are instances.
+        view = getattr(match.func, "view_class", match.func)
+        budget = budgets.get(getattr(view, "__name__", type(view).__name__))
+    return budget
+
+
+def header_for_everyone():
+    """Return True if the header is sent to everyone, not only to staff."""
+    return getattr(settings, "SERVER_TIMING", settings.DEBUG)
+
+
+def log_enabled():
+    """Return True if the metrics of each request are logged."""
+    return getattr(settings, "SERVER_TIMING_LOG", True)
+
+
+def timing_enabled():
+    """Return True if the requests are measured."""
+    return header_for_everyone() or log_enabled()
+
+
+def send_header(request):
+    """Return True if the Server-Timing header is sent for this request."""
+    if header_for_everyone():
+        return True
+    user = getattr(request, "user", None)
+    return user is not None and user.is_staff
+
+
+class ServerTimingMiddleware:
+    """Measure each request, and report it in a header and the log.
+
+    This must be the first middleware, so everything else is measured.
+    """
+
+    def __init__(self, get_response):
+        """Store the next handler in the chain."""
+        if not timing_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Handle the request, measuring it."""
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        instrument_cache(caches["default"])
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(time_query))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        metrics.total = perf_counter() - metrics.start
+
+        if send_header(request):
+            response["Server-Timing"] = metrics.server_timing()
+        if log_enabled():
+            self.log(request, response, metrics)
+        return response
+
+    def log(self, request, response, metrics):
+        """Log the metrics, and a warning if the query budget is exceeded."""
+        match = getattr(request, "resolver_match", None)
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            **metrics.as_dict(),
+        }
+        logger.info(json.dumps(record))
+
+        budget = query_budget(match)
+        if budget is not None and metrics.queries > budget:
+            logger.warning(
+                "%s made %d queries (%d duplicate), over its budget of %d: %s",
+                record["view"],
+                metrics.queries,
+                metrics.duplicates,
+                budget,
+                request.path,
+            )
+
+
+class ViewTimingMiddleware:
+    """Measure the view and its template, inside the other middleware.
+
+    This must be the last middleware, see ServerTimingMiddleware.
+    """
+
+    def __init__(self, get_response):
+        """Store the next handler in the chain."""
+        if not timing_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Handle the request, timing everything inside this middleware."""
+        start = perf_counter()
+        response = self.get_response(request)
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.inner = perf_counter() - start
+        return response
+
+    def process_template_response(self, request, response):
+        """Time the rendering of the template, which happens next."""
+        metrics = current_metrics.get()
+        if metrics is not None:
+            start = perf_counter()
+
+            def rendered(response):
+                metrics.template_time += perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
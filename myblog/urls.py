@@ -3,27 +3,33 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.contrib.auth import views as authentication_views
-from django.contrib.sitemaps.views import sitemap
 from django.urls import include, path
 
-from blog.feeds import PostsFeed
-from blog.sitemaps import BlogSitemap, StaticSiteMap
+from blog.feeds import AuthorPostsFeed, PostsFeed, TagPostsFeed, feed_urls
+from blog.views import sitemap_views
 from users import views as user_views
 
 handler403 = "myblog.errors.views.custom403"
 handler404 = "myblog.errors.views.custom404"
 
-sitemaps = {"blog": BlogSitemap, "static": StaticSiteMap}
-
 urlpatterns = (
     [
         path(
             "sitemap.xml",
-            sitemap,
-            {"sitemaps": sitemaps},
-            name="django.contrib.sitemaps.views.sitemap",
+            sitemap_views.sitemap_index,
+            name="sitemap",
+        ),
+        path(
+            "sitemap-<str:section>.xml",
+            sitemap_views.sitemap_section,
+            name="sitemap-section",
+        ),
+        *feed_urls("feed/posts/", PostsFeed, "latest-posts-feed"),
+        *feed_urls("feed/tags/<str:slug>/", TagPostsFeed, "tag-posts-feed"),
+        *feed_urls(
+            "feed/authors/<int:pk>/", AuthorPostsFeed, "author-posts-feed"
         ),
-        path("feed/posts/", PostsFeed(), name="latest-posts-feed"),
+        path("api/", include("blog.api_urls")),
         path("", include("blog.urls")),
         path("register/", user_views.register, name="register"),
         # path(
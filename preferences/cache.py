@@ -0,0 +1,59 @@
+"""Process-wide cache for the preferences singletons.
+
+Each Preferences subclass is loaded from the database once per process and then
+served from memory. A version token is kept in the Django cache framework and is
+replaced whenever any preferences object is saved or deleted, so every process
+drops its stale copy once it sees the new token. The cache must be shared by
+every process for this to work (see CACHES in settings.py). The token is read
+at most once every VERSION_CHECK_INTERVAL seconds, rather than on each of the
+many reads of a page, and as a safety net a copy is never kept for more than
+PREFERENCES_CACHE_TTL seconds either way.
+"""
+from time import monotonic
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = "preferences:version"
+VERSION_CHECK_INTERVAL = 1
+
+# maps the model label to a (version, expiry time, instance) tuple.
+_preferences = {}
+
+# the last version token read, and when it was read.
+_version = {"token": None, "checked": None}
+
+
+def cache_ttl():
+    """Return the most seconds a loaded preferences object is kept for."""
+    return getattr(settings, "PREFERENCES_CACHE_TTL", 60)
+
+
+def current_version():
+    """Return the version token, reading it again if it may have changed."""
+    now = monotonic()
+    checked = _version["checked"]
+    if checked is None or now - checked >= VERSION_CHECK_INTERVAL:
+        _version["token"] = cache.get(VERSION_KEY)
+        _version["checked"] = now
+    return _version["token"]
+
+
+def get_preferences(model):
+    """Return the singleton object for this model, loading it if needed."""
+    version = current_version()
+    label = model._meta.label_lower
+    cached = _preferences.get(label)
+    if cached is None or cached[0] != version or cached[1] <= monotonic():
+        cached = (version, monotonic() + cache_ttl(), model.singleton.get())
+        _preferences[label] = cached
+    return cached[2]
+
+
+def invalidate_preferences():
+    """Forget all cached preferences, in this and every other process."""
+    _preferences.clear()
+    _version["token"] = uuid4().hex
+    _version["checked"] = monotonic()
+    cache.set(VERSION_KEY, _version["token"], None)
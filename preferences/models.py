@@ -3,6 +3,7 @@ from django.db import models
 from django.dispatch import receiver
 
 import preferences
+from preferences.cache import get_preferences, invalidate_preferences
 from preferences.managers import SingletonManager
 
 
@@ -28,7 +29,8 @@ class Preferences(models.Model):
 def preferences_class_prepared(sender, *args, **kwargs):
     """Add various preferences members to preferences.preferences.
 
-    This enables easy access from code.
+    This enables easy access from code. The object is served from the
+    process-wide cache, see cache.py
     """
     cls = sender
     if issubclass(cls, Preferences):
@@ -38,5 +40,13 @@ def preferences_class_prepared(sender, *args, **kwargs):
         setattr(
             preferences.Preferences,
             cls._meta.object_name,
-            property(lambda x: cls.singleton.get()),
+            property(lambda x: get_preferences(cls)),
         )
+
+
+@receiver(models.signals.post_save)
+@receiver(models.signals.post_delete)
+def preferences_changed(sender, *args, **kwargs):
+    """Invalidate the cached preferences when any of them change."""
+    if issubclass(sender, Preferences):
+        invalidate_preferences()
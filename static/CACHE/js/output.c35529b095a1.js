@@ -0,0 +1,3 @@
+let attr=document.querySelector(".django-ckeditor-widget");if(attr){attr.removeAttribute("style");}
+function loadComments(list,url){fetch(url).then((response)=>response.text()).then((html)=>{list.querySelectorAll("noscript, .blog_comment_more").forEach((node)=>{node.remove();});list.insertAdjacentHTML("beforeend",html);});}
+let commentList=document.querySelector(".blog_comment_list");if(commentList){loadComments(commentList,commentList.dataset.url);commentList.addEventListener("click",(event)=>{let more=event.target.closest("[data-comments-more]");if(more){event.preventDefault();loadComments(commentList,more.href);}});};
\ No newline at end of file
@@ -5,6 +5,8 @@ from django.contrib.auth.models import User
 from django.core.files.storage import FileSystemStorage
 from django.db import models
 
+from myblog.images import update_image_sizes
+
 
 class OverwriteStorage(FileSystemStorage):
     """Returns a filename that's free on the target storage system.
@@ -45,6 +47,8 @@ class Profile(models.Model):
     youtube_user = models.CharField(max_length=50, blank=True, default="")
     twitter_user = models.CharField(max_length=50, blank=True, default="")
     bio = models.TextField(max_length=300, blank=True, default="")
+    # the resized copies of the avatar, see myblog/images.py
+    image_sizes = models.JSONField(default=dict, blank=True, editable=False)
 
     # set to true if the user can Author posts.
     author = models.BooleanField(default=False)
@@ -52,3 +56,12 @@ class Profile(models.Model):
     def __str__(self):
         """Return the string representation of this model."""
         return self.user.username
+
+    def save(self, *args, **kwargs):
+        """Save the profile, making resized copies of a new avatar."""
+        image_changed = (self.image and not self.image._committed) or (
+            not self.image and self.image_sizes
+        )
+        super().save(*args, **kwargs)
+        if image_changed:
+            update_image_sizes(self, "avatar")
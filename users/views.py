@@ -15,7 +15,16 @@ def get_profile_context(profile_object):
     """Take the profile links and return a fuller dictionary."""
     my_profile = Profile.objects.filter(user=profile_object).values()[0]
     # remove certain fields that we dont want
-    unwanted = ["id", "user_id", "user", "image", "location", "author", "bio"]
+    unwanted = [
+        "id",
+        "user_id",
+        "user",
+        "image",
+        "image_sizes",
+        "location",
+        "author",
+        "bio",
+    ]
     my_copy = my_profile.copy()
     for item in my_copy:
         if item in unwanted:
@@ -68,6 +77,14 @@ def get_profile_context(profile_object):
     return final
 
 
+def get_profile_posts(person):
+    """Return the posts and comments listed on a users profile page."""
+    return {
+        "person_posts": person.blog_posts.summary(),
+        "person_comments": person.comments.select_related("related_post__user"),
+    }
+
+
 def register(request):
     """Register a new user."""
     if request.method == "POST":
@@ -99,6 +116,7 @@ class MyProfileView(LoginRequiredMixin, ListView):
         """Add links data to this context."""
         context = super(MyProfileView, self).get_context_data(**kwargs)
         context["links"] = get_profile_context(self.object_list)
+        context.update(get_profile_posts(self.object_list))
         context["page_title"] = self.object_list.username.capitalize()
         context[
             "canonical"
@@ -117,6 +135,7 @@ class UserProfileView(DetailView):
         """Add links data to this context."""
         context = super(UserProfileView, self).get_context_data(**kwargs)
         context["links"] = get_profile_context(self.object)
+        context.update(get_profile_posts(self.object))
         context["page_title"] = self.object.username.capitalize()
         context["canonical"] = f"{self.request.build_absolute_uri()}"
         return context